@@ -1,7 +1,9 @@
 from app import create_app
 from dotenv import load_dotenv
+import os
 
+# Development server only; production runs wsgi:app under gunicorn.
 if __name__=="__main__":
     load_dotenv()
     app = create_app()
-    app.run(host="0.0.0.0" , port=5000 , debug=True)
\ No newline at end of file
+    app.run(host="0.0.0.0" , port=5000 , debug=os.getenv("FLASK_DEBUG" , "0") == "1")
@@ -2,6 +2,30 @@ from flask import Flask
 from dotenv import load_dotenv
 import os
 
+def _detector_ready():
+    # Starts warming the preprocess workers on the first probe; after that it
+    # only reads the pool's flag.
+    from app.utils.preprocess_pool import default_preprocess_pool
+    return default_preprocess_pool().warm()
+
+
+def _warm_detector():
+    # Faces are detected in the preprocess pool's processes, which warm their
+    # own detectors. Only an inline pool detects in this process; warming it
+    # here lets a preloading master share the parsed cascades with its workers.
+    from app.utils.preprocess_pool import default_preprocess_pool
+    pool = default_preprocess_pool()
+    if pool.processes <= 0:
+        pool.warm()
+
+
+def _mark_ready():
+    from app.utils.lifecycle import server_state
+
+    server_state.add_check("face_detector" , _detector_ready)
+    server_state.mark_ready()
+
+
 def create_app():
     load_dotenv()
     template_path = os.path.abspath(os.path.join(os.path.dirname(__file__),'..','templates'))
@@ -10,8 +34,33 @@ def create_app():
 
     app.secret_key = os.getenv("SECRET_KEY" , "default_secret")
 
+    _warm_detector()
+
     from app.routes import main
 
     app.register_blueprint(main)
 
+    _mark_ready()
+
+    return app
+
+
+def create_asgi_app():
+    from quart import Quart
+
+    load_dotenv()
+    template_path = os.path.abspath(os.path.join(os.path.dirname(__file__),'..','templates'))
+
+    app = Quart(__name__ , template_folder=template_path)
+
+    app.secret_key = os.getenv("SECRET_KEY" , "default_secret")
+
+    _warm_detector()
+
+    from app.async_routes import main
+
+    app.register_blueprint(main)
+
+    _mark_ready()
+
     return app
\ No newline at end of file
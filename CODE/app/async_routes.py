@@ -0,0 +1,249 @@
+import asyncio
+import base64
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Blueprint,Response,abort,current_app,g,jsonify,render_template,request
+
+from app.utils.batch import BatchError, collect_images, identify_batch
+from app.utils.celebrity_detector import CelebrityDetector
+from app.utils.image_handler import InvalidImageError
+from app.utils.multi_face import identify_faces_async
+from app.utils.preprocess_pool import default_preprocess_pool
+from app.utils.qa_engine import AnswerStreamError
+from app.utils.async_engines import AsyncCelebrityDetector, AsyncQAEngine
+from app.utils.lifecycle import server_state
+from app.utils.metrics import flatten, http_seconds, metrics
+from app.utils.prompts import token_meter
+from app.utils.result_store import RESULT_TTL, default_result_store, make_result
+
+main = Blueprint("main" , __name__)
+
+celebrity_detector = AsyncCelebrityDetector()
+qa_engine = AsyncQAEngine()
+# identify_batch runs its images on threads with the blocking client.
+batch_detector = CelebrityDetector(cache=celebrity_detector.cache , recognizer=celebrity_detector.recognizer)
+result_store = default_result_store()
+preprocess_pool = default_preprocess_pool()
+
+metrics.gauge("celebrity_upstream", "Provider health, routing, queues and rate-limit buckets", lambda: flatten({
+    "identify" : celebrity_detector.router.stats(),
+    "qa" : qa_engine.router.stats(),
+}), ("key",))
+metrics.gauge("celebrity_preprocess_pool", "Preprocess pool counters and load", lambda: flatten(preprocess_pool.stats()), ("key",))
+metrics.gauge("celebrity_cache", "Identify and answer cache and single-flight counters", lambda: flatten({
+    "identify" : celebrity_detector.cache.stats(),
+    "answers" : qa_engine.cache.stats(),
+    "identify_flights" : celebrity_detector.async_flights.stats(),
+    "answer_flights" : qa_engine.async_flights.stats(),
+}), ("key",))
+
+
+@main.before_app_request
+async def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@main.after_app_request
+async def observe_request(response):
+    start = g.pop("request_start" , None)
+    if start is not None and request.endpoint != "main.prometheus_metrics":
+        rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        http_seconds.observe(time.perf_counter() - start , endpoint=rule , method=request.method , status=response.status_code)
+    return response
+
+@main.errorhandler(InvalidImageError)
+async def invalid_image(error):
+    if request.path.startswith("/api/"):
+        return jsonify({"error" : str(error)}) , 400
+    return await render_template("index.html" , player_info=str(error) , result_id="" , user_question="" , answer="" , faces=[]) , 400
+
+
+@main.route("/" , methods=["GET" ,"POST"])
+async def index():
+    player_info = ""
+    result_id = ""
+    user_question = ""
+    answer = ""
+    faces = []
+
+    if request.method == "POST":
+        files = await request.files
+        form = await request.form
+
+        if "image" in files:
+            image_file = files["image"]
+
+            if image_file and form.get("multi"):
+                result_bytes , faces = await identify_faces_async(image_file.stream.read() , celebrity_detector , pool=preprocess_pool)
+
+                if faces:
+                    player_info = "\n".join(face["info"] for face in faces)
+                    result_id = result_store.put(make_result(result_bytes , player_info , faces[0]["name"] , faces))
+                else:
+                    player_info="No face detected Please try another image"
+
+            elif image_file:
+                prepared = await asyncio.wrap_future(preprocess_pool.submit(image_file.stream.read()))
+                current_app.logger.info("model payload %d bytes (%d saved), stages %s", prepared.model_size, prepared.bytes_saved, prepared.timings)
+
+                player_info , player_name = await celebrity_detector.identify(prepared.model_bytes, prepared.embedding)
+
+                if prepared.face_box is not None:
+                    result_id = result_store.put(make_result(prepared.display_bytes , player_info , player_name))
+                else:
+                    player_info="No face detected Please try another image"
+
+        elif "question" in form:
+            user_question = form["question"]
+
+            result = result_store.get(form.get("result_id"))
+
+            if result is None:
+                player_info = "This result has expired. Please upload the image again"
+            else:
+                result_id = form["result_id"]
+                player_info = result["player_info"]
+                faces = result["faces"]
+
+                answer = await qa_engine.ask_about_celebrity(result["player_name"],user_question)
+
+    return await render_template(
+        "index.html",
+        player_info=player_info,
+        result_id=result_id,
+        user_question=user_question,
+        answer=answer,
+        faces=faces
+    )
+
+
+@main.route("/result/<result_id>.jpg")
+async def result_image(result_id):
+    result = result_store.get(result_id)
+    if result is None:
+        abort(404)
+
+    response = Response(result["image"] , mimetype="image/jpeg")
+    response.set_etag(result["etag"])
+    response.cache_control.private = True
+    response.cache_control.max_age = RESULT_TTL
+    response.cache_control.immutable = True
+
+    await response.make_conditional(request)
+    return response
+
+
+@main.route("/api/cache/stats")
+async def cache_stats():
+    return jsonify({
+        "identify" : celebrity_detector.cache.stats(),
+        "answers" : qa_engine.cache.stats(),
+        "identify_flights" : celebrity_detector.async_flights.stats(),
+        "answer_flights" : qa_engine.async_flights.stats(),
+        "tokens" : token_meter.stats()
+    })
+
+
+@main.route("/api/preprocess/stats")
+async def preprocess_stats():
+    return jsonify(preprocess_pool.stats())
+
+
+@main.route("/api/upstream/stats")
+async def upstream_stats():
+    return jsonify({
+        "identify" : celebrity_detector.router.stats(),
+        "qa" : qa_engine.router.stats()
+    })
+
+
+@main.route("/api/ask/stream" , methods=["GET" , "POST"])
+async def ask_stream():
+    values = await request.values
+    name = values.get("name" , "").strip()
+    result = result_store.get(values.get("result_id"))
+    if result is not None:
+        name = result["player_name"]
+
+    question = values.get("question" , "").strip()
+    if not name or not question:
+        return jsonify({"error" : "name and question are required"}) , 400
+
+    async def generate():
+        try:
+            async for chunk in qa_engine.stream_answer(name , question):
+                yield f"data: {json.dumps({'content' : chunk})}\n\n".encode()
+        except AnswerStreamError as e:
+            yield f"event: failed\ndata: {json.dumps({'error' : str(e)})}\n\n".encode()
+        yield b"event: done\ndata: {}\n\n"
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control" : "no-cache" , "X-Accel-Buffering" : "no"}
+    )
+
+
+@main.route("/api/identify/faces" , methods=["POST"])
+async def identify_faces_api():
+    image_file = (await request.files).get("image")
+    if not image_file:
+        return jsonify({"error" : "No image uploaded"}) , 400
+
+    result_bytes , faces = await identify_faces_async(image_file.stream.read() , celebrity_detector , request.args.get("mode") , pool=preprocess_pool)
+
+    return jsonify({
+        "faces" : faces,
+        "annotated_image" : base64.b64encode(result_bytes).decode()
+    })
+
+
+@main.route("/api/identify/batch" , methods=["POST"])
+async def identify_batch_api():
+    files = await request.files
+    # Uploaded archives stay in their spooled files; members are read lazily.
+    archives = [f.stream for f in files.getlist("archive")]
+    if request.mimetype in ("application/zip" , "application/x-zip-compressed"):
+        archives.append(await request.get_data())
+
+    try:
+        images = collect_images(files.getlist("images") , archives)
+    except BatchError as e:
+        return jsonify({"error" : str(e)}) , 400
+
+    results = identify_batch(images , batch_detector)
+
+    async def generate():
+        # One thread drives the generator, so closing it on disconnect waits
+        # behind the result being computed instead of racing it.
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1 , thread_name_prefix="batch")
+        try:
+            while True:
+                result = await loop.run_in_executor(executor , next , results , None)
+                if result is None:
+                    break
+                yield (json.dumps(result) + "\n").encode()
+        finally:
+            executor.submit(results.close)
+            executor.shutdown(wait=False)
+
+    return Response(generate() , mimetype="application/x-ndjson")
+
+
+@main.route("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.render() , mimetype="text/plain; version=0.0.4")
+
+
+@main.route("/healthz")
+async def healthz():
+    return jsonify({"status" : "ok"})
+
+
+@main.route("/readyz")
+async def readyz():
+    ready , status = server_state.readiness()
+    return jsonify(status) , (200 if ready else 503)
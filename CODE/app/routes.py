@@ -1,62 +1,226 @@
-from flask import Blueprint,render_template,request
-
-from app.utils.image_handler import process_image
+from flask import Blueprint,Response,abort,current_app,g,jsonify,render_template,request,stream_with_context
+
+from app.utils.batch import BatchError, collect_images, identify_batch
+from app.utils.image_handler import InvalidImageError
+from app.utils.multi_face import identify_faces
+from app.utils.preprocess_pool import default_preprocess_pool
+from app.utils.prompts import token_meter
+from app.utils.lifecycle import server_state
+from app.utils.metrics import flatten, http_seconds, metrics
+from app.utils.result_store import RESULT_TTL, default_result_store, make_result
 from app.utils.celebrity_detector import CelebrityDetector
-from app.utils.qa_engine import QAEngine
+from app.utils.qa_engine import AnswerStreamError, QAEngine
 
 import base64
+import json
+import time
 
 main = Blueprint("main" , __name__)
 
 celebrity_detector = CelebrityDetector()
 qa_engine = QAEngine()
+result_store = default_result_store()
+preprocess_pool = default_preprocess_pool()
+
+metrics.gauge("celebrity_upstream", "Provider health, routing, queues and rate-limit buckets", lambda: flatten({
+    "identify" : celebrity_detector.router.stats(),
+    "qa" : qa_engine.router.stats(),
+}), ("key",))
+metrics.gauge("celebrity_preprocess_pool", "Preprocess pool counters and load", lambda: flatten(preprocess_pool.stats()), ("key",))
+metrics.gauge("celebrity_cache", "Identify and answer cache and single-flight counters", lambda: flatten({
+    "identify" : celebrity_detector.cache.stats(),
+    "answers" : qa_engine.cache.stats(),
+    "identify_flights" : celebrity_detector.flights.stats(),
+    "answer_flights" : qa_engine.flights.stats(),
+}), ("key",))
+
+
+@main.before_app_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@main.after_app_request
+def observe_request(response):
+    start = g.pop("request_start" , None)
+    if start is not None and request.endpoint != "main.prometheus_metrics":
+        rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        http_seconds.observe(time.perf_counter() - start , endpoint=rule , method=request.method , status=response.status_code)
+    return response
+
+@main.errorhandler(InvalidImageError)
+def invalid_image(error):
+    if request.path.startswith("/api/"):
+        return jsonify({"error" : str(error)}) , 400
+    return render_template("index.html" , player_info=str(error) , result_id="" , user_question="" , answer="" , faces=[]) , 400
+
 
 @main.route("/" , methods=["GET" ,"POST"])
 def index():
     player_info = ""
-    result_img_data = ""
+    result_id = ""
     user_question = ""
     answer = ""
+    faces = []
 
 
     if request.method == "POST":
         if "image" in request.files:
             image_file = request.files["image"]
 
-            if image_file:
-                img_bytes , face_box = process_image(image_file)
+            if image_file and request.form.get("multi"):
+                result_bytes , faces = identify_faces(image_file.read() , celebrity_detector , pool=preprocess_pool)
+
+                if faces:
+                    player_info = "\n".join(face["info"] for face in faces)
+                    result_id = result_store.put(make_result(result_bytes , player_info , faces[0]["name"] , faces))
+                else:
+                    player_info="No face detected Please try another image"
 
-                player_info , player_name = celebrity_detector.identify(img_bytes)
+            elif image_file:
+                prepared = preprocess_pool.preprocess(image_file.read())
+                current_app.logger.info("model payload %d bytes (%d saved), stages %s", prepared.model_size, prepared.bytes_saved, prepared.timings)
 
-                if face_box is not None:
-                    result_img_data = base64.b64encode(img_bytes).decode()
+                player_info , player_name = celebrity_detector.identify(prepared.model_bytes, prepared.embedding)
+
+                if prepared.face_box is not None:
+                    result_id = result_store.put(make_result(prepared.display_bytes , player_info , player_name))
                 else:
                     player_info="No face detected Please try another image"
 
         elif "question" in request.form:
             user_question = request.form["question"]
 
-            player_name = request.form["player_name"]
-            player_info = request.form["player_info"]
-            result_img_data = request.form["result_img_data"]
+            result = result_store.get(request.form.get("result_id"))
+
+            if result is None:
+                player_info = "This result has expired. Please upload the image again"
+            else:
+                result_id = request.form["result_id"]
+                player_info = result["player_info"]
+                faces = result["faces"]
 
-            answer = qa_engine.ask_about_celebrity(player_name,user_question)
+                answer = qa_engine.ask_about_celebrity(result["player_name"],user_question)
 
     return render_template(
         "index.html",
         player_info=player_info,
-        result_img_data=result_img_data,
+        result_id=result_id,
         user_question=user_question,
-        answer=answer
+        answer=answer,
+        faces=faces
     )
-    
 
 
+@main.route("/result/<result_id>.jpg")
+def result_image(result_id):
+    result = result_store.get(result_id)
+    if result is None:
+        abort(404)
+
+    response = Response(result["image"] , mimetype="image/jpeg")
+    response.set_etag(result["etag"])
+    response.cache_control.private = True
+    response.cache_control.max_age = RESULT_TTL
+    response.cache_control.immutable = True
+
+    return response.make_conditional(request)
+
+
+@main.route("/api/cache/stats")
+def cache_stats():
+    return jsonify({
+        "identify" : celebrity_detector.cache.stats(),
+        "answers" : qa_engine.cache.stats(),
+        "identify_flights" : celebrity_detector.flights.stats(),
+        "answer_flights" : qa_engine.flights.stats(),
+        "tokens" : token_meter.stats()
+    })
+
+
+@main.route("/api/preprocess/stats")
+def preprocess_stats():
+    return jsonify(preprocess_pool.stats())
+
+
+@main.route("/api/upstream/stats")
+def upstream_stats():
+    return jsonify({
+        "identify" : celebrity_detector.router.stats(),
+        "qa" : qa_engine.router.stats()
+    })
+
+
+@main.route("/api/ask/stream" , methods=["GET" , "POST"])
+def ask_stream():
+    name = request.values.get("name" , "").strip()
+    result = result_store.get(request.values.get("result_id"))
+    if result is not None:
+        name = result["player_name"]
+
+    question = request.values.get("question" , "").strip()
+    if not name or not question:
+        return jsonify({"error" : "name and question are required"}) , 400
+
+    def generate():
+        try:
+            for chunk in qa_engine.stream_answer(name , question):
+                yield f"data: {json.dumps({'content' : chunk})}\n\n"
+        except AnswerStreamError as e:
+            yield f"event: failed\ndata: {json.dumps({'error' : str(e)})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control" : "no-cache" , "X-Accel-Buffering" : "no"}
+    )
+
+
+@main.route("/api/identify/faces" , methods=["POST"])
+def identify_faces_api():
+    image_file = request.files.get("image")
+    if not image_file:
+        return jsonify({"error" : "No image uploaded"}) , 400
+
+    result_bytes , faces = identify_faces(image_file.read() , celebrity_detector , request.args.get("mode") , pool=preprocess_pool)
+
+    return jsonify({
+        "faces" : faces,
+        "annotated_image" : base64.b64encode(result_bytes).decode()
+    })
+
+
+@main.route("/api/identify/batch" , methods=["POST"])
+def identify_batch_api():
+    # Uploaded archives stay in their spooled files; members are read lazily.
+    archives = [f.stream for f in request.files.getlist("archive")]
+    if request.mimetype in ("application/zip" , "application/x-zip-compressed"):
+        archives.append(request.get_data())
+
+    try:
+        images = collect_images(request.files.getlist("images") , archives)
+    except BatchError as e:
+        return jsonify({"error" : str(e)}) , 400
+
+    def generate():
+        for result in identify_batch(images , celebrity_detector):
+            yield json.dumps(result) + "\n"
+
+    return Response(generate() , mimetype="application/x-ndjson")
 
 
-        
+@main.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render() , mimetype="text/plain; version=0.0.4")
 
 
+@main.route("/healthz")
+def healthz():
+    return jsonify({"status" : "ok"})
 
-                
 
+@main.route("/readyz")
+def readyz():
+    ready , status = server_state.readiness()
+    return jsonify(status) , (200 if ready else 503)
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from app.utils.cache import LRUCache, SQLiteCache, TieredCache
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "4096"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "604800"))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")
+# Cosine similarity above which a past question counts as the same question.
+# Empty disables the similarity tier.
+ANSWER_CACHE_SIMILARITY = os.getenv("ANSWER_CACHE_SIMILARITY", "")
+
+PRONOUNS = {"he", "she", "him", "her", "his", "hers", "they", "them", "their"}
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def normalize_question(question):
+    words = re.sub(r"[^\w\s]", " ", question.lower()).split()
+    return " ".join("<person>" if word in PRONOUNS else word for word in words)
+
+
+def hashed_ngram_vector(text, dim=512):
+    # Character trigram counts folded into a fixed-size vector (hashing trick).
+    vector = np.zeros(dim, dtype=np.float32)
+    padded = f"  {text}  "
+    for i in range(len(padded) - 2):
+        digest = hashlib.blake2b(padded[i:i + 3].encode(), digest_size=4).digest()
+        vector[int.from_bytes(digest, "little") % dim] += 1
+    return vector / (np.linalg.norm(vector) + 1e-12)
+
+
+class SimilarityTier:
+
+    def __init__(self, threshold, embed=hashed_ngram_vector, max_per_name=256):
+        self.threshold = threshold
+        self.embed = embed
+        self.max_per_name = max_per_name
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, question):
+        with self._lock:
+            entries = self._entries.get(name)
+            if not entries:
+                return None
+            questions = list(entries)
+            vectors = np.vstack([entries[q][0] for q in questions])
+
+        scores = vectors @ self.embed(question)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(name, {}).get(questions[best])
+        return entry[1] if entry else None
+
+    def set(self, name, question, answer):
+        vector = self.embed(question)
+        with self._lock:
+            entries = self._entries.setdefault(name, OrderedDict())
+            entries[question] = (vector, answer)
+            entries.move_to_end(question)
+            while len(entries) > self.max_per_name:
+                entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class AnswerCache:
+
+    def __init__(self, store, similarity=None):
+        self.store = store
+        self.similarity = similarity
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def _key(self, name, question):
+        return f"{name.strip().lower()}\x1f{question}"
+
+    def get(self, name, question):
+        question = normalize_question(question)
+
+        answer = self.store.get(self._key(name, question))
+        if answer is not None:
+            self.exact_hits += 1
+            return answer
+
+        if self.similarity is not None:
+            answer = self.similarity.get(name.strip().lower(), question)
+            if answer is not None:
+                self.similar_hits += 1
+                return answer
+
+        self.misses += 1
+        return None
+
+    def set(self, name, question, answer):
+        question = normalize_question(question)
+        self.store.set(self._key(name, question), answer)
+        if self.similarity is not None:
+            self.similarity.set(name.strip().lower(), question, answer)
+
+    def clear(self):
+        self.store.clear()
+        if self.similarity is not None:
+            self.similarity.clear()
+
+    def stats(self):
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+            "store": self.store.stats(),
+        }
+
+
+def build_answer_cache(maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, path=ANSWER_CACHE_PATH,
+                       similarity=ANSWER_CACHE_SIMILARITY):
+    disk = SQLiteCache(path, ttl=ttl, table="answers") if path else None
+    tier = SimilarityTier(float(similarity)) if similarity else None
+    return AnswerCache(TieredCache(LRUCache(maxsize=maxsize, ttl=ttl), disk), tier)
+
+
+def default_answer_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = build_answer_cache()
+        return _default_cache
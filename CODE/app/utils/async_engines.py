@@ -0,0 +1,245 @@
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from app.utils.async_http_client import default_async_http_client
+from app.utils.celebrity_detector import MULTI_FACE_MODE, CelebrityDetector
+from app.utils.identification import Identification
+from app.utils.identify_cache import image_key
+from app.utils.qa_engine import AnswerStreamError, QAEngine
+from app.utils.metrics import record_response, results_total, stage_seconds, stage_timer
+from app.utils.prompts import token_meter
+from app.utils.single_flight import AsyncSingleFlight
+
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "64"))
+
+
+class AsyncCelebrityDetector(CelebrityDetector):
+
+    def __init__(self, cache=None, cache_key=None, http=None, recognizer=None, max_concurrency=GROQ_MAX_CONCURRENCY):
+        super().__init__(cache=cache, cache_key=cache_key, recognizer=recognizer)
+        self.http = http
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self.async_flights = AsyncSingleFlight()
+
+    def _client(self):
+        return self.http or default_async_http_client()
+
+    def _limit(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def identify(self , image_bytes , embedding=None):
+        result = await self.identify_result(image_bytes , embedding=embedding)
+        return result.info , result.name
+
+    async def identify_result(self , image_bytes , face_box=None , embedding=None):
+        with stage_timer("identify" , "cache"):
+            key = await asyncio.to_thread(image_key, image_bytes, self.cache_key)
+            cached = self.cache.get(key)
+        if cached is not None:
+            results_total.inc(operation="identify" , source="cache")
+            result = Identification.from_cached(cached)
+        else:
+            result = await self.async_flights.do(key , self._identify_uncached , key , image_bytes , embedding)
+
+        return result._replace(face_box=tuple(int(v) for v in face_box)) if face_box is not None else result
+
+    async def _identify_uncached(self , key , image_bytes , embedding=None):
+        cached = self.cache.get(key)
+        if cached is not None:
+            return Identification.from_cached(cached)
+
+        local = await asyncio.to_thread(self._identify_local, image_bytes, embedding)
+        if local is not None:
+            results_total.inc(operation="identify" , source="local")
+            return local
+
+        result, ok = await self._identify_remote(image_bytes)
+        results_total.inc(operation="identify" , source="remote" if ok else "error")
+        if ok:
+            self.cache.set(key, result.to_dict())
+
+        return result
+
+    async def identify_many(self , images , mode=None):
+        return [(result.info , result.name) for result in await self.identify_results(images , mode)]
+
+    async def identify_results(self , images , mode=None , embeddings=None):
+        if (mode or MULTI_FACE_MODE) == "batched":
+            # Batched mode is one request per five faces; the sync client is fine there.
+            return await asyncio.to_thread(super().identify_results , images , mode , embeddings)
+
+        embeddings = embeddings or [None] * len(images)
+        return list(await asyncio.gather(*[self.identify_result(image_bytes , embedding=embedding)
+                                           for image_bytes , embedding in zip(images , embeddings)]))
+
+    async def _identify_remote(self , image_bytes):
+        with stage_timer("identify" , "build_payload"):
+            payload = self._build_payload(image_bytes)
+
+        async with self._limit():
+            try:
+                with stage_timer("identify" , "upstream"):
+                    response = await self.router.post_async(self._client() , payload)
+            except httpx.HTTPError:
+                record_response("identify")
+                return Identification.unknown("") , False
+
+        record_response("identify" , response)
+        if response.status_code==200:
+            data = response.json()
+            token_meter.record("identify" , payload , data.get("usage"))
+
+            with stage_timer("identify" , "parse"):
+                return self._parse_response(data) , True
+
+        return Identification.unknown("") , False
+
+
+class AsyncQAEngine(QAEngine):
+
+    def __init__(self, http=None, cache=None, max_concurrency=GROQ_MAX_CONCURRENCY):
+        super().__init__(cache=cache)
+        self.http = http
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self.async_flights = AsyncSingleFlight()
+
+    def _client(self):
+        return self.http or default_async_http_client()
+
+    def _limit(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def ask_about_celebrity(self,name,question):
+        with stage_timer("qa" , "cache"):
+            cached = self.cache.get(name,question)
+        if cached is not None:
+            results_total.inc(operation="qa" , source="cache")
+            return cached
+
+        with stage_timer("qa" , "local_answer"):
+            local = self.answer_locally(name,question)
+        if local is not None:
+            results_total.inc(operation="qa" , source="local")
+            return local
+
+        return await self.async_flights.do(self._flight_key(name,question) , self._ask_uncached , name , question)
+
+    async def _ask_uncached(self,name,question):
+        payload = self._build_payload(name,question)
+
+        async with self._limit():
+            try:
+                with stage_timer("qa" , "upstream"):
+                    response = await self.router.post_async(self._client() , payload)
+            except httpx.HTTPError:
+                record_response("qa")
+                results_total.inc(operation="qa" , source="error")
+                return "Sorry I couldn't find the answer"
+
+        record_response("qa" , response)
+        if response.status_code==200:
+            data = response.json()
+            token_meter.record("qa" , payload , data.get("usage"))
+            answer = data['choices'][0]['message']['content']
+            results_total.inc(operation="qa" , source="remote")
+            self.cache.set(name,question,answer)
+            return answer
+
+        results_total.inc(operation="qa" , source="error")
+        return "Sorry I couldn't find the answer"
+
+    async def stream_answer(self,name,question):
+        with stage_timer("qa_stream" , "cache"):
+            cached = self.cache.get(name,question)
+        if cached is not None:
+            results_total.inc(operation="qa_stream" , source="cache")
+            yield cached
+            return
+
+        with stage_timer("qa_stream" , "local_answer"):
+            local = self.answer_locally(name,question)
+        if local is not None:
+            results_total.inc(operation="qa_stream" , source="local")
+            yield local
+            return
+
+        # Followers of an in-flight answer (streamed or not) get it in one piece.
+        key = self._flight_key(name,question)
+        future , leader = self.async_flights.join(key)
+        if not leader:
+            try:
+                yield await asyncio.shield(future)
+            except AnswerStreamError:
+                raise
+            except Exception as e:
+                raise AnswerStreamError() from e
+            return
+
+        chunks = []
+        try:
+            async for chunk in self._stream_uncached(name,question):
+                chunks.append(chunk)
+                yield chunk
+        except BaseException as e:
+            # Failed, cancelled or the client went away: followers get the error, not a partial answer.
+            self.async_flights.finish(key , future , error=e if isinstance(e , AnswerStreamError) else AnswerStreamError())
+            raise
+        self.async_flights.finish(key , future , "".join(chunks))
+
+    async def _stream_uncached(self,name,question):
+        payload = self._build_payload(name,question)
+        payload["stream"] = True
+        token_meter.record("qa_stream" , payload)
+
+        start = time.perf_counter()
+        response = None
+        chunks = []
+        done = False
+        async with self._limit():
+            try:
+                async with self.router.stream_async(self._client() , payload) as response:
+                    record_response("qa_stream" , response)
+                    if response.status_code!=200:
+                        results_total.inc(operation="qa_stream" , source="error")
+                        raise AnswerStreamError()
+
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            done = True
+                            break
+
+                        choices = json.loads(data).get("choices") or [{}]
+                        chunk = choices[0].get("delta" , {}).get("content")
+                        if chunk:
+                            if not chunks:
+                                stage_seconds.observe(time.perf_counter() - start , operation="qa_stream" , stage="first_token")
+                            chunks.append(chunk)
+                            yield chunk
+            except (httpx.HTTPError , ValueError) as e:
+                # Before or after the first chunk: never appended to a partial answer.
+                if response is None:
+                    record_response("qa_stream")
+                results_total.inc(operation="qa_stream" , source="error")
+                raise AnswerStreamError() from e
+
+        if not done or not chunks:
+            results_total.inc(operation="qa_stream" , source="error")
+            raise AnswerStreamError()
+
+        results_total.inc(operation="qa_stream" , source="remote")
+        # Only complete, non-empty answers are cached.
+        self.cache.set(name,question,"".join(chunks))
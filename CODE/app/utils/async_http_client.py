@@ -0,0 +1,89 @@
+import asyncio
+import os
+import random
+import weakref
+
+import httpx
+
+from app.utils.http_client import (
+    HTTP_BACKOFF,
+    HTTP_BACKOFF_MAX,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_POOL_MAXSIZE,
+    HTTP_READ_TIMEOUT,
+    HTTP_RETRIES,
+    RETRY_STATUSES,
+)
+
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv("HTTP_ASYNC_MAX_CONNECTIONS", "200"))
+HTTP_ASYNC_KEEPALIVE = int(os.getenv("HTTP_ASYNC_KEEPALIVE", str(HTTP_POOL_MAXSIZE)))
+
+_default_clients = weakref.WeakKeyDictionary()
+
+
+class AsyncHTTPClient:
+
+    def __init__(self, max_connections=HTTP_ASYNC_MAX_CONNECTIONS, max_keepalive=HTTP_ASYNC_KEEPALIVE,
+                 connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, backoff_max=HTTP_BACKOFF_MAX):
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    async def _sleep_before_retry(self, attempt, response=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    delay = max(delay, min(self.backoff_max, float(retry_after)))
+                except ValueError:
+                    pass
+
+        await asyncio.sleep(delay)
+
+    async def request(self, method, url, **kwargs):
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # As in HTTPClient: never retried once the request may have been sent.
+                if last_attempt:
+                    raise
+                await self._sleep_before_retry(attempt)
+                continue
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                await self._sleep_before_retry(attempt, response)
+                continue
+
+            return response
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    def stream(self, method, url, **kwargs):
+        # Streaming responses are not retried: chunks may already be relayed.
+        return self.client.stream(method, url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def default_async_http_client():
+    # httpx clients are bound to the event loop they were first used on.
+    loop = asyncio.get_running_loop()
+    client = _default_clients.get(loop)
+    if client is None:
+        client = _default_clients[loop] = AsyncHTTPClient()
+    return client
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from io import BytesIO
+
+from app.utils.preprocess_pool import default_preprocess_pool
+from app.utils.upstream_scheduler import BATCH, upstream_priority
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "5000"))
+BATCH_MAX_IMAGE_BYTES = int(os.getenv("BATCH_MAX_IMAGE_BYTES", str(20 * 1024 * 1024)))
+BATCH_MAX_TOTAL_BYTES = int(os.getenv("BATCH_MAX_TOTAL_BYTES", str(1024 * 1024 * 1024)))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+class BatchError(ValueError):
+    pass
+
+
+def _open_zip(archive):
+    # archive: bytes or a seekable file (an upload spooled to disk).
+    try:
+        return zipfile.ZipFile(BytesIO(archive) if isinstance(archive, bytes) else archive)
+    except zipfile.BadZipFile:
+        raise BatchError("Archive is not a valid zip file")
+
+
+def _members(archive):
+    return [info for info in archive.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def read_zip(archive):
+    # Members are decompressed one at a time, as they are consumed. zipfile
+    # stops at the size in the member's header, so that is all one read can
+    # hold.
+    archive = _open_zip(archive) if not isinstance(archive, zipfile.ZipFile) else archive
+    for info in _members(archive):
+        if info.file_size > BATCH_MAX_IMAGE_BYTES:
+            raise BatchError(f"{info.filename} exceeds {BATCH_MAX_IMAGE_BYTES} bytes")
+        try:
+            yield info.filename, archive.read(info)
+        except (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError, RuntimeError) as e:
+            # One damaged (or encrypted) member is reported on its own line of
+            # the results rather than failing the whole batch.
+            yield info.filename, BatchError(f"{info.filename} could not be read: {e}")
+
+
+def _size(storage):
+    stream = storage.stream
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def collect_images(files, archives):
+    # Checks the count and sizes from upload lengths and zip directories,
+    # without decompressing anything, and returns a generator that reads the
+    # images one by one. identify_batch keeps only the ones in flight.
+    archives = [_open_zip(archive) for archive in archives]
+    count = len(files) + sum(len(_members(archive)) for archive in archives)
+    total = sum(_size(storage) for storage in files)
+    total += sum(info.file_size for archive in archives for info in _members(archive))
+
+    if not count:
+        raise BatchError("No images found in request")
+    if count > BATCH_MAX_IMAGES:
+        raise BatchError(f"Batch has {count} images, limit is {BATCH_MAX_IMAGES}")
+    if total > BATCH_MAX_TOTAL_BYTES:
+        raise BatchError(f"Batch has {total} bytes of images, limit is {BATCH_MAX_TOTAL_BYTES}")
+    for archive in archives:
+        for info in _members(archive):
+            if info.file_size > BATCH_MAX_IMAGE_BYTES:
+                raise BatchError(f"{info.filename} exceeds {BATCH_MAX_IMAGE_BYTES} bytes")
+
+    def images():
+        for i, storage in enumerate(files):
+            yield storage.filename or f"image-{i}", storage.read()
+        for archive in archives:
+            yield from read_zip(archive)
+
+    return images()
+
+
+def _identify_one(detector, image_bytes):
+    prepared = default_preprocess_pool().preprocess(image_bytes)
+    if prepared.face_box is None:
+        return {"face_box": None, "name": "", "info": "No face detected"}
+
+    # Interactive uploads go ahead of batch work when Groq's limits are tight.
+    with upstream_priority(BATCH):
+        result = detector.identify_result(prepared.model_bytes, prepared.face_box, prepared.embedding)
+    return dict(result.to_dict(), info=result.info)
+
+
+def identify_batch(images, detector, concurrency=BATCH_CONCURRENCY):
+    # Images are pulled from the iterable only as slots free up, so at most
+    # 2 * concurrency of them are held at once. Identical uploads are
+    # identified once and reported under every filename.
+    images = iter(images)
+    results = {}
+    waiting = {}
+    pending = {}
+
+    def report(digest, result, filenames, first):
+        for i, filename in enumerate(filenames):
+            yield dict(result, filename=filename, sha256=digest, duplicate=not first or i > 0)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        exhausted = False
+        while not exhausted or pending:
+            while not exhausted and len(pending) < 2 * concurrency:
+                item = next(images, None)
+                if item is None:
+                    exhausted = True
+                    break
+
+                filename, image_bytes = item
+                if isinstance(image_bytes, BatchError):
+                    yield {"filename": filename, "error": str(image_bytes)}
+                    continue
+
+                digest = hashlib.sha256(image_bytes).hexdigest()
+                if digest in results:
+                    yield from report(digest, results[digest], [filename], first=False)
+                elif digest in waiting:
+                    waiting[digest].append(filename)
+                else:
+                    waiting[digest] = [filename]
+                    pending[executor.submit(_identify_one, detector, image_bytes)] = digest
+
+            if not pending:
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                digest = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"error": str(e)}
+
+                results[digest] = result
+                yield from report(digest, result, waiting.pop(digest), first=True)
+    finally:
+        # A client that disconnects closes this generator; drop the images
+        # still queued instead of identifying them for nobody.
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Expired rows are also deleted when read; the sweep catches those never read again.
+SQLITE_CACHE_SWEEP_SECONDS = float(os.getenv("SQLITE_CACHE_SWEEP_SECONDS", "300"))
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class SQLiteCache:
+
+    # Shared between gunicorn workers through a single file. Values are
+    # stored as JSON, so tuples come back as lists.
+
+    def __init__(self, path, ttl=None, table="cache", sweep_seconds=SQLITE_CACHE_SWEEP_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.table = table
+        self.sweep_seconds = sweep_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + sweep_seconds
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_expires ON {self.table} (expires)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is not None and row[1] is not None and row[1] < now:
+            # Another worker may have refreshed the row since the read.
+            deleted = conn.execute(
+                f"DELETE FROM {self.table} WHERE key = ? AND expires < ?", (key, now)
+            ).rowcount
+            conn.commit()
+            with self._lock:
+                self.expired += deleted
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl else None
+        conn = self._conn()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)",
+            (key, json.dumps(value), expires),
+        )
+        conn.commit()
+        self._maybe_sweep()
+
+    def _maybe_sweep(self):
+        with self._lock:
+            if time.monotonic() < self._next_sweep:
+                return
+            self._next_sweep = time.monotonic() + self.sweep_seconds
+        self.sweep()
+
+    def sweep(self):
+        conn = self._conn()
+        deleted = conn.execute(
+            f"DELETE FROM {self.table} WHERE expires < ?", (time.time(),)
+        ).rowcount
+        conn.commit()
+        with self._lock:
+            self.expired += deleted
+        return deleted
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute(f"DELETE FROM {self.table}")
+        conn.commit()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "expired": self.expired}
+
+
+class TieredCache:
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+
+        value = self.disk.get(key)
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        stats = {"memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
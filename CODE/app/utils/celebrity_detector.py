@@ -1,73 +1,220 @@
 import os
-import base64
+import re
 import requests
+from concurrent.futures import ThreadPoolExecutor
 
-class CelebrityDetector:
+from app.utils.http_client import default_http_client
+from app.utils.identification import Identification
+from app.utils.identify_cache import default_identify_cache, image_key
+from app.utils.knowledge_pack import default_knowledge_pack
+from app.utils.local_recognizer import default_local_recognizer
+from app.utils.metrics import record_response, results_total, stage_timer
+from app.utils.providers import GROQ_MODEL, default_provider_router
+from app.utils.prompts import group_identify_payload, identify_payload, parse_json_content, token_meter
+from app.utils.single_flight import identify_flights
 
-    def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY")
-        self.api_url = "https://api.groq.com/openai/v1/chat/completions"
-        self.model = "meta-llama/llama-4-maverick-17b-128e-instruct"
-
-    def identify(self , image_bytes):
-        encoded_image = base64.b64encode(image_bytes).decode()
-
-        headers = {
-            "Authorization" : f"Bearer {self.api_key}",
-            "Content-Type" : "application/json"
-        }
-
-        prompt = {
-            "model": self.model,
-            "messages": [
-                {
-                    "role": "user", 
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": """You are a celebrity recognition expert AI. 
-Identify the person in the image. If known, respond in this format:
-
-- **Full Name**:
-- **Profession**:
-- **Nationality**:
-- **Famous For**:
-- **Top Achievements**:
-
-If unknown, return "Unknown".
-"""
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{encoded_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            "temperature": 0.3,    
-            "max_tokens": 1024     
-        }
-
-
-        response = requests.post(self.api_url , headers=headers , json=prompt)
+MULTI_FACE_MODE = os.getenv("MULTI_FACE_MODE", "parallel")
+MULTI_FACE_WORKERS = int(os.getenv("MULTI_FACE_WORKERS", "8"))
+# Groq accepts at most five images per chat completion request.
+MULTI_FACE_BATCH_SIZE = int(os.getenv("MULTI_FACE_BATCH_SIZE", "5"))
 
-        if response.status_code==200:
-            result = response.json()['choices'][0]['message']['content']
+FACE_SECTION = re.compile(r"^#+\s*face\s+(\d+)", re.IGNORECASE | re.MULTILINE)
 
-            name = self.extract_name(result)
+class CelebrityDetector:
 
-            return result , name  
+    def __init__(self, cache=None, cache_key=None, http=None, recognizer=None, flights=None, knowledge=None, router=None):
+        self.model = GROQ_MODEL
+        self.cache = cache if cache is not None else default_identify_cache()
+        self.cache_key = cache_key
+        self.http = http or default_http_client()
+        self.recognizer = recognizer if recognizer is not None else default_local_recognizer()
+        self.flights = flights or identify_flights
+        self.knowledge = knowledge if knowledge is not None else default_knowledge_pack()
+        self.router = router or default_provider_router("identify")
+
+    def identify(self , image_bytes , embedding=None):
+        result = self.identify_result(image_bytes , embedding=embedding)
+        return result.info , result.name
+
+    def identify_result(self , image_bytes , face_box=None , embedding=None):
+        with stage_timer("identify" , "cache"):
+            key = image_key(image_bytes, self.cache_key)
+            cached = self.cache.get(key)
+        if cached is not None:
+            results_total.inc(operation="identify" , source="cache")
+            result = Identification.from_cached(cached)
+        else:
+            result = self.flights.do(key , self._identify_uncached , key , image_bytes , embedding)
+
+        return result._replace(face_box=tuple(int(v) for v in face_box)) if face_box is not None else result
+
+    def _identify_uncached(self , key , image_bytes , embedding=None):
+        # A flight that finished between our cache miss and joining has filled the cache.
+        cached = self.cache.get(key)
+        if cached is not None:
+            return Identification.from_cached(cached)
+
+        local = self._identify_local(image_bytes , embedding)
+        if local is not None:
+            results_total.inc(operation="identify" , source="local")
+            return local
+
+        result, ok = self._identify_remote(image_bytes)
+        results_total.inc(operation="identify" , source="remote" if ok else "error")
+        if ok:
+            self.cache.set(key, result.to_dict())
+
+        return result
+
+    def identify_many(self , images , mode=None):
+        return [(result.info , result.name) for result in self.identify_results(images , mode)]
+
+    def identify_results(self , images , mode=None , embeddings=None):
+        mode = mode or MULTI_FACE_MODE
+        embeddings = embeddings or [None] * len(images)
+        if not images:
+            return []
+
+        if mode == "batched":
+            return self._identify_batched(images , embeddings)
+
+        with ThreadPoolExecutor(max_workers=min(MULTI_FACE_WORKERS , len(images))) as executor:
+            return list(executor.map(lambda image_bytes , embedding : self.identify_result(image_bytes , embedding=embedding) , images , embeddings))
+
+    def _identify_batched(self , images , embeddings=None):
+        results = [None] * len(images)
+        pending = []
+        embeddings = embeddings or [None] * len(images)
+
+        for i , (image_bytes , embedding) in enumerate(zip(images , embeddings)):
+            key = image_key(image_bytes, self.cache_key)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results_total.inc(operation="identify" , source="cache")
+                results[i] = Identification.from_cached(cached)
+                continue
+
+            local = self._identify_local(image_bytes , embedding)
+            if local is not None:
+                results_total.inc(operation="identify" , source="local")
+                results[i] = local
+                continue
+
+            pending.append((i , key , image_bytes))
+
+        for start in range(0 , len(pending) , MULTI_FACE_BATCH_SIZE):
+            chunk = pending[start:start + MULTI_FACE_BATCH_SIZE]
+            answers , ok = self._identify_group([image_bytes for _ , _ , image_bytes in chunk])
+            results_total.inc(len(chunk) , operation="identify" , source="remote" if ok else "error")
+
+            for (i , key , _) , result in zip(chunk , answers):
+                results[i] = result
+                if ok:
+                    self.cache.set(key , result.to_dict())
+
+        return results
+
+    def _build_group_payload(self , images):
+        return group_identify_payload(self.model , images)
+
+    def _split_sections(self , content , count):
+        sections = [""] * count
+        matches = list(FACE_SECTION.finditer(content))
+
+        for j , match in enumerate(matches):
+            number = int(match.group(1))
+            if 1 <= number <= count:
+                end = matches[j + 1].start() if j + 1 < len(matches) else len(content)
+                sections[number - 1] = content[match.end():end].strip()
+
+        return sections
+
+    def _identify_group(self , images):
+        unknown = [Identification.unknown("")] * len(images)
+
+        with stage_timer("identify_group" , "build_payload"):
+            payload = self._build_group_payload(images)
+
+        try:
+            with stage_timer("identify_group" , "upstream"):
+                response = self.router.post(self.http , payload)
+        except requests.RequestException:
+            record_response("identify_group")
+            return unknown , False
+
+        record_response("identify_group" , response)
+        if response.status_code!=200:
+            return unknown , False
+
+        data = response.json()
+        token_meter.record("identify_group" , payload , data.get("usage"))
+        content = data['choices'][0]['message']['content']
+
+        with stage_timer("identify_group" , "parse"):
+            return self._parse_group(content , len(images))
+
+    def _parse_group(self , content , count):
+        parsed = parse_json_content(content)
+        if parsed is not None and isinstance(parsed.get("faces") , list):
+            faces = [Identification.from_profile(face) for face in parsed["faces"] if isinstance(face , dict)]
+            faces += [Identification.unknown()] * (count - len(faces))
+            return faces[:count] , True
+
+        answers = []
+        for section in self._split_sections(content , count):
+            if section:
+                answers.append(Identification.from_markdown(section))
+            else:
+                answers.append(Identification.unknown(""))
+
+        return answers , True
+
+    def _identify_local(self , image_bytes , embedding=None):
+        if self.recognizer is None:
+            return None
+
+        with stage_timer("identify" , "local_match"):
+            name , score = self.recognizer.recognize(image_bytes , embedding)
+        if name is None:
+            return None
+
+        profile = self.knowledge.profile(name) if self.knowledge is not None else None
+        return Identification.from_profile(profile or {"full_name" : name} , confidence=float(score))
+
+    def _build_payload(self , image_bytes):
+        return identify_payload(self.model , image_bytes)
+
+    def _parse_response(self , data):
+        content = data['choices'][0]['message']['content']
+
+        profile = parse_json_content(content)
+        if profile is not None:
+            return Identification.from_profile(profile)
+
+        # Older prompts, or a model that ignored the schema.
+        return Identification.from_markdown(content)
 
-        return "Unknown" , ""  
+    def _identify_remote(self , image_bytes):
+        with stage_timer("identify" , "build_payload"):
+            payload = self._build_payload(image_bytes)
 
+        try:
+            with stage_timer("identify" , "upstream"):
+                response = self.router.post(self.http , payload)
+        except requests.RequestException:
+            record_response("identify")
+            return Identification.unknown("") , False
 
-    def extract_name(self,content):
-        for line in content.splitlines():
-            if line.lower().startswith("- **full name**:"):
-                return line.split(":")[1].strip()
+        record_response("identify" , response)
+        if response.status_code==200:
+            data = response.json()
+            token_meter.record("identify" , payload , data.get("usage"))
+
+            with stage_timer("identify" , "parse"):
+                return self._parse_response(data) , True
 
-        return "Unknown"    
+        return Identification.unknown("") , False
 
 
+    def extract_name(self,content):
+        return Identification.from_markdown(content).name
@@ -0,0 +1,39 @@
+import math
+import os
+
+
+def _cgroup_quota():
+    # CPUs granted by the container's CFS quota, or None when unlimited.
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota , period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus():
+    # os.cpu_count() reports the host; a container is limited by its CPU
+    # affinity and its cgroup quota (a Kubernetes CPU limit).
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+
+    quota = _cgroup_quota()
+    if quota:
+        count = min(count, math.ceil(quota))
+    return max(1, count)
@@ -0,0 +1,98 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+FACE_EMBEDDER = os.getenv("FACE_EMBEDDER", "")
+FACE_EMBEDDING_MODEL = os.getenv("FACE_EMBEDDING_MODEL", "")
+
+
+def _uniform_lbp_table():
+    # Map the 256 LBP codes onto the 58 uniform patterns plus one catch-all bin.
+    table = np.full(256, 58, dtype=np.uint8)
+    index = 0
+    for code in range(256):
+        bits = [(code >> i) & 1 for i in range(8)]
+        transitions = sum(bits[i] != bits[(i + 1) % 8] for i in range(8))
+        if transitions <= 2:
+            table[code] = index
+            index += 1
+    return table
+
+
+class LBPEmbedder:
+
+    # Grid of uniform-LBP histograms (the LBPH descriptor), pure NumPy.
+    # Weaker than a CNN embedding but needs no model file.
+
+    name = "lbp"
+    threshold = 0.95
+
+    def __init__(self, size=96, grid=6):
+        self.size = size
+        self.grid = grid
+        self.table = _uniform_lbp_table()
+        self.dim = grid * grid * 59
+
+    def embed(self, face_bgr):
+        gray = face_bgr if face_bgr.ndim == 2 else cv2.cvtColor(face_bgr, cv2.COLOR_BGR2GRAY)
+        gray = cv2.equalizeHist(cv2.resize(gray, (self.size + 2, self.size + 2), interpolation=cv2.INTER_AREA))
+        gray = gray.astype(np.int16)
+
+        center = gray[1:-1, 1:-1]
+        codes = np.zeros(center.shape, dtype=np.uint8)
+        offsets = [(0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (2, 1), (2, 0), (1, 0)]
+        for bit, (dy, dx) in enumerate(offsets):
+            neighbour = gray[dy:dy + self.size, dx:dx + self.size]
+            codes |= (neighbour >= center).astype(np.uint8) << bit
+
+        patterns = self.table[codes]
+        cell = self.size // self.grid
+        cells = patterns[:cell * self.grid, :cell * self.grid].reshape(self.grid, cell, self.grid, cell)
+        cells = cells.transpose(0, 2, 1, 3).reshape(self.grid * self.grid, cell * cell)
+
+        offsets = np.arange(self.grid * self.grid)[:, None] * 59
+        hist = np.bincount((cells + offsets).ravel(), minlength=self.dim).astype(np.float32)
+
+        vector = np.sqrt(hist)
+        return vector / (np.linalg.norm(vector) + 1e-12)
+
+
+class SFaceEmbedder:
+
+    # OpenCV's SFace ONNX model (face_recognition_sface_2021dec.onnx) on the
+    # CPU DNN backend. One recognizer per thread, like the cascades.
+
+    name = "sface"
+    threshold = 0.45
+
+    def __init__(self, model_path=FACE_EMBEDDING_MODEL):
+        if not model_path or not os.path.exists(model_path):
+            raise RuntimeError(f"SFace model not found at {model_path!r}")
+        self.model_path = model_path
+        self.dim = 128
+        self._local = threading.local()
+
+    def _recognizer(self):
+        recognizer = getattr(self._local, "recognizer", None)
+        if recognizer is None:
+            recognizer = self._local.recognizer = cv2.FaceRecognizerSF.create(self.model_path, "")
+        return recognizer
+
+    def embed(self, face_bgr):
+        if face_bgr.ndim == 2:
+            face_bgr = cv2.cvtColor(face_bgr, cv2.COLOR_GRAY2BGR)
+        face = cv2.resize(face_bgr, (112, 112), interpolation=cv2.INTER_AREA)
+
+        vector = self._recognizer().feature(face).reshape(-1).astype(np.float32)
+        return vector / (np.linalg.norm(vector) + 1e-12)
+
+
+def build_embedder(name=FACE_EMBEDDER, model_path=FACE_EMBEDDING_MODEL):
+    name = name or ("sface" if model_path else "lbp")
+    if name == "sface":
+        return SFaceEmbedder(model_path)
+    if name == "lbp":
+        return LBPEmbedder()
+    raise ValueError(f"Unknown face embedder {name!r}")
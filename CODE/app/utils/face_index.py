@@ -0,0 +1,296 @@
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+def _top_k(scores, k):
+    k = min(k, len(scores))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _replace(path, name, write):
+    # Written beside the target and renamed over it, so processes that have
+    # the old file memory-mapped keep reading the old inode and a failed save
+    # never leaves a truncated file behind.
+    fd , tmp = tempfile.mkstemp(dir=path, prefix=f".{name}.", suffix=".tmp")
+    try:
+        os.chmod(tmp, 0o644)
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(path, name))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _save_array(path, name, array):
+    _replace(path, name, lambda f: np.save(f, array))
+
+
+def _write_meta(path, meta):
+    # Last, once every array it describes is in place.
+    _replace(path, "meta.json", lambda f: f.write(json.dumps(meta).encode()))
+
+
+def _read_meta(path):
+    with open(os.path.join(path, "meta.json")) as f:
+        return json.load(f)
+
+
+class FlatFaceIndex:
+
+    # Exact cosine search over L2-normalised embeddings stored as
+    # embeddings.npy / label_ids.npy / meta.json in one directory.
+    #
+    # Writers swap in new arrays under a lock rather than changing them in
+    # place; search() works on a snapshot taken under the same lock.
+
+    kind = "flat"
+
+    def __init__(self, embeddings, label_ids, labels, embedder=""):
+        self.embeddings = embeddings
+        self.label_ids = label_ids
+        self.labels = list(labels)
+        self.embedder = embedder
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.label_ids)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        meta = _read_meta(path)
+
+        mode = "r" if mmap else None
+        embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode=mode)
+        label_ids = np.load(os.path.join(path, "label_ids.npy"), mmap_mode=mode)
+        return cls(embeddings, label_ids, meta["labels"], meta.get("embedder", ""))
+
+    def save(self, path):
+        with self._lock:
+            embeddings , label_ids , labels = self.embeddings , self.label_ids , list(self.labels)
+
+        os.makedirs(path, exist_ok=True)
+        _save_array(path, "embeddings.npy", np.ascontiguousarray(embeddings, dtype=np.float32))
+        _save_array(path, "label_ids.npy", np.asarray(label_ids, dtype=np.int32))
+        _write_meta(path, {"type": self.kind, "labels": labels, "embedder": self.embedder,
+                           "dim": int(embeddings.shape[1])})
+
+    def _label_id(self, name):
+        if name not in self.labels:
+            self.labels.append(name)
+        return self.labels.index(name)
+
+    def add(self, name, vectors):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+
+        with self._lock:
+            label_id = self._label_id(name)
+            self.embeddings = np.vstack([self.embeddings, vectors])
+            self.label_ids = np.concatenate([self.label_ids, np.full(len(vectors), label_id, dtype=np.int32)])
+
+    def remove(self, name):
+        with self._lock:
+            if name not in self.labels:
+                return 0
+
+            keep = np.asarray(self.label_ids) != self.labels.index(name)
+            removed = int(len(keep) - keep.sum())
+            self.embeddings = np.asarray(self.embeddings)[keep]
+            self.label_ids = np.asarray(self.label_ids)[keep]
+            return removed
+
+    def search(self, vector, k=5):
+        with self._lock:
+            embeddings , label_ids = self.embeddings , self.label_ids
+
+        if len(label_ids) == 0:
+            return []
+
+        scores = embeddings @ vector
+        return [(self.labels[label_ids[i]], float(scores[i])) for i in _top_k(scores, k)]
+
+    def match(self, vector):
+        results = self.search(vector, k=1)
+        if not results:
+            return None, 0.0
+        return results[0]
+
+
+def train_centroids(vectors, nlist, iterations=10, seed=0):
+    # Spherical k-means: centroids stay on the unit sphere so that the
+    # coarse assignment uses the same cosine metric as the search.
+    rng = np.random.default_rng(seed)
+    nlist = max(1, min(nlist, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = vectors[assignment == c]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[c] = centroid / (np.linalg.norm(centroid) + 1e-12)
+
+    return centroids.astype(np.float32)
+
+
+class IVFFaceIndex:
+
+    # Inverted-file index: vectors are grouped by their nearest coarse
+    # centroid and a query only scores the nprobe closest lists.
+    #
+    # The persisted segment is sorted by list so each list is a contiguous
+    # slice and can be memory-mapped. Inserts go to an in-memory buffer that
+    # is scanned exhaustively; removals are tombstones. compact() folds both
+    # back into the sorted segment, and save() compacts first. As with the
+    # flat index, writers swap arrays under a lock and search() snapshots them.
+
+    kind = "ivf"
+
+    def __init__(self, centroids, embeddings, label_ids, offsets, labels, embedder="", nprobe=8):
+        self.centroids = centroids
+        self.embeddings = embeddings
+        self.label_ids = label_ids
+        self.offsets = offsets
+        self.labels = list(labels)
+        self.embedder = embedder
+        self.nprobe = nprobe
+
+        self.live = np.ones(len(label_ids), dtype=bool)
+        self.buffer_embeddings = np.zeros((0, centroids.shape[1]), dtype=np.float32)
+        self.buffer_label_ids = np.zeros(0, dtype=np.int32)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        with self._lock:
+            return int(self.live.sum()) + len(self.buffer_label_ids)
+
+    @classmethod
+    def build(cls, embeddings, label_ids, labels, embedder="", nlist=None, nprobe=8, iterations=10):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        label_ids = np.asarray(label_ids, dtype=np.int32)
+        nlist = nlist or max(1, int(np.sqrt(len(embeddings))))
+
+        centroids = train_centroids(embeddings, nlist, iterations)
+        index = cls(centroids, np.zeros((0, embeddings.shape[1]), np.float32), np.zeros(0, np.int32),
+                    np.zeros(len(centroids) + 1, np.int64), labels, embedder, nprobe)
+        index.buffer_embeddings = embeddings
+        index.buffer_label_ids = label_ids
+        index.compact()
+        return index
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        meta = _read_meta(path)
+
+        mode = "r" if mmap else None
+        centroids = np.load(os.path.join(path, "centroids.npy"))
+        offsets = np.load(os.path.join(path, "offsets.npy"))
+        embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode=mode)
+        label_ids = np.load(os.path.join(path, "label_ids.npy"), mmap_mode=mode)
+        return cls(centroids, embeddings, label_ids, offsets, meta["labels"], meta.get("embedder", ""),
+                   meta.get("nprobe", 8))
+
+    def save(self, path):
+        with self._lock:
+            self.compact()
+            offsets , embeddings , label_ids , labels = self.offsets , self.embeddings , self.label_ids , list(self.labels)
+
+        os.makedirs(path, exist_ok=True)
+        _save_array(path, "centroids.npy", self.centroids)
+        _save_array(path, "offsets.npy", offsets)
+        _save_array(path, "embeddings.npy", np.ascontiguousarray(embeddings, dtype=np.float32))
+        _save_array(path, "label_ids.npy", np.asarray(label_ids, dtype=np.int32))
+        _write_meta(path, {"type": self.kind, "labels": labels, "embedder": self.embedder,
+                           "dim": int(self.centroids.shape[1]), "nlist": len(self.centroids),
+                           "nprobe": self.nprobe})
+
+    def _label_id(self, name):
+        if name not in self.labels:
+            self.labels.append(name)
+        return self.labels.index(name)
+
+    def add(self, name, vectors):
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+
+        with self._lock:
+            label_id = self._label_id(name)
+            self.buffer_embeddings = np.vstack([self.buffer_embeddings, vectors])
+            self.buffer_label_ids = np.concatenate([self.buffer_label_ids, np.full(len(vectors), label_id, np.int32)])
+
+    def remove(self, name):
+        with self._lock:
+            if name not in self.labels:
+                return 0
+
+            label_id = self.labels.index(name)
+            hits = np.asarray(self.label_ids) == label_id
+            removed = int((hits & self.live).sum())
+            self.live = self.live & ~hits
+
+            keep = self.buffer_label_ids != label_id
+            removed += int(len(keep) - keep.sum())
+            self.buffer_embeddings = self.buffer_embeddings[keep]
+            self.buffer_label_ids = self.buffer_label_ids[keep]
+            return removed
+
+    def compact(self):
+        with self._lock:
+            embeddings = np.vstack([np.asarray(self.embeddings)[self.live], self.buffer_embeddings])
+            label_ids = np.concatenate([np.asarray(self.label_ids)[self.live], self.buffer_label_ids])
+
+            if len(embeddings):
+                assignment = np.argmax(embeddings @ self.centroids.T, axis=1)
+            else:
+                assignment = np.zeros(0, dtype=np.int64)
+            order = np.argsort(assignment, kind="stable")
+
+            self.embeddings = np.ascontiguousarray(embeddings[order], dtype=np.float32)
+            self.label_ids = label_ids[order].astype(np.int32)
+            counts = np.bincount(assignment, minlength=len(self.centroids))
+            self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+            self.live = np.ones(len(self.label_ids), dtype=bool)
+            self.buffer_embeddings = np.zeros((0, self.centroids.shape[1]), dtype=np.float32)
+            self.buffer_label_ids = np.zeros(0, dtype=np.int32)
+
+    def search(self, vector, k=5, nprobe=None):
+        with self._lock:
+            embeddings , label_ids , offsets , live = self.embeddings , self.label_ids , self.offsets , self.live
+            buffer_embeddings , buffer_label_ids = self.buffer_embeddings , self.buffer_label_ids
+
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        lists = _top_k(self.centroids @ vector, nprobe)
+
+        candidates = np.concatenate(
+            [np.arange(offsets[l], offsets[l + 1]) for l in lists] + [np.zeros(0, np.int64)]
+        )
+        candidates = candidates[live[candidates]]
+
+        scores = np.concatenate([embeddings[candidates] @ vector, buffer_embeddings @ vector])
+        label_ids = np.concatenate([np.asarray(label_ids)[candidates], buffer_label_ids])
+
+        return [(self.labels[label_ids[i]], float(scores[i])) for i in _top_k(scores, k)]
+
+    def match(self, vector):
+        results = self.search(vector, k=1)
+        if not results:
+            return None, 0.0
+        return results[0]
+
+
+def load_index(path, mmap=True):
+    kind = _read_meta(path).get("type", "flat")
+    if kind == "ivf":
+        return IVFFaceIndex.load(path, mmap)
+    return FlatFaceIndex.load(path, mmap)
@@ -0,0 +1,77 @@
+import os
+import threading
+from contextlib import contextmanager
+import cv2
+
+DEFAULT_CASCADE = "haarcascade_frontalface_default.xml"
+
+
+class FaceDetectorRegistry:
+
+    # cv2.CascadeClassifier is not safe to share between threads, so a
+    # classifier is borrowed for one detection and then handed back. Parsed
+    # copies are shared by every thread in the process: the XML is only parsed
+    # again when more detections than copies run at once, not on each new
+    # request thread's first upload.
+
+    def __init__(self, cascade_dir=None):
+        self.cascade_dir = cascade_dir or cv2.data.haarcascades
+        self._free = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+
+    def _path(self, name):
+        if os.path.isabs(name):
+            return name
+        return os.path.join(self.cascade_dir, name)
+
+    def _load(self, name):
+        cascade = cv2.CascadeClassifier(self._path(name))
+        if cascade.empty():
+            raise RuntimeError(f"Could not load cascade {self._path(name)}")
+
+        with self._lock:
+            self.loads += 1
+        return cascade
+
+    @contextmanager
+    def borrow(self, name=DEFAULT_CASCADE):
+        with self._lock:
+            free = self._free.setdefault(name, [])
+            cascade = free.pop() if free else None
+            if cascade is not None:
+                self.hits += 1
+
+        if cascade is None:
+            cascade = self._load(name)
+
+        try:
+            yield cascade
+        finally:
+            with self._lock:
+                self._free[name].append(cascade)
+
+    def warm(self, names=(DEFAULT_CASCADE,), copies=1):
+        # Parse enough copies for `copies` concurrent detections.
+        for name in names:
+            with self._lock:
+                missing = copies - len(self._free.get(name, []))
+            loaded = [self._load(name) for _ in range(missing)]
+            with self._lock:
+                self._free.setdefault(name, []).extend(loaded)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loads": self.loads,
+                "hits": self.hits,
+                "idle": {name : len(free) for name , free in self._free.items()},
+            }
+
+
+registry = FaceDetectorRegistry()
+
+
+def borrow_cascade(name=DEFAULT_CASCADE):
+    return registry.borrow(name)
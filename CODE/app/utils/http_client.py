@@ -0,0 +1,120 @@
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+# Connections kept per host: one per request thread (gunicorn.conf.py passes
+# its thread count), so none are closed after use and reopened.
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", os.getenv("GUNICORN_THREADS", "64")))
+HTTP_POOL_SIZES = os.getenv("HTTP_POOL_SIZES", "")
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))
+
+# 429s are left to the upstream scheduler, which pauses every caller rather
+# than letting each one retry on its own.
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def connect_failed(error):
+    # Only failures to connect are retried: once a POST has been sent (a read
+    # timeout, a reset mid-response) the LLM may be working on it, and
+    # retrying would multiply both the wait and the cost.
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def parse_pool_sizes(value):
+    # "api.groq.com=32,localhost:8000=4" -> {"api.groq.com": 32, "localhost:8000": 4}
+    sizes = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        host, size = item.split("=", 1)
+        sizes[host.strip()] = int(size)
+    return sizes
+
+
+class HTTPClient:
+
+    def __init__(self, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                 pool_sizes=None, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, backoff_max=HTTP_BACKOFF_MAX):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        if pool_sizes is None:
+            pool_sizes = parse_pool_sizes(HTTP_POOL_SIZES)
+        for host, size in pool_sizes.items():
+            host_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            self.session.mount(f"http://{host}", host_adapter)
+            self.session.mount(f"https://{host}", host_adapter)
+
+    def _sleep_before_retry(self, attempt, response=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * (2 ** attempt)))
+
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    delay = max(delay, min(self.backoff_max, float(retry_after)))
+                except ValueError:
+                    pass
+
+        time.sleep(delay)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last_attempt or not connect_failed(e):
+                    raise
+                self._sleep_before_retry(attempt)
+                continue
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                self._sleep_before_retry(attempt, response)
+                response.close()
+                continue
+
+            return response
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def default_http_client():
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HTTPClient()
+        return _default_client
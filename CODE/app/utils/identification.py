@@ -0,0 +1,174 @@
+import re
+from collections import namedtuple
+
+from app.utils.knowledge_pack import format_profile
+
+UNKNOWN = "Unknown"
+
+# Label lines in the markdown the older prompts return. Tolerates missing
+# bullets or bold, the colon inside or outside the bold, and dash separators.
+FIELD_LINE = re.compile(
+    r"^\s*(?:[-*•]|\d+[.)])?\s*(?:\*\*|__)?\s*"
+    r"(full name|name|profession|occupation|nationality|famous for|known for|top achievements|achievements|match confidence|confidence)"
+    r"\s*(?:\*\*|__)?\s*[:：–—-]\s*(?:\*\*|__)?\s*(.*?)\s*$",
+    re.IGNORECASE,
+)
+ITEM_LINE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+(.*\S)\s*$")
+
+FIELD_KEYS = {
+    "full name": "name",
+    "name": "name",
+    "profession": "profession",
+    "occupation": "profession",
+    "nationality": "nationality",
+    "famous for": "famous_for",
+    "known for": "famous_for",
+    "top achievements": "achievements",
+    "achievements": "achievements",
+    "match confidence": "confidence",
+    "confidence": "confidence",
+}
+
+
+def _clean(value):
+    return str(value or "").strip().strip("*_\"'`").strip()
+
+
+def _confidence(value):
+    try:
+        value = float(str(value).strip().rstrip("%"))
+    except (TypeError, ValueError):
+        return None
+    if value > 1:
+        value /= 100
+    return min(1.0, max(0.0, value))
+
+
+class Identification(namedtuple("Identification", "name profession nationality famous_for achievements confidence face_box raw")):
+
+    # Who was identified and how sure we are. `raw` only holds the model's
+    # text when no name could be parsed out of it.
+
+    __slots__ = ()
+
+    @classmethod
+    def unknown(cls, name=UNKNOWN):
+        return cls(name, "", "", "", (), None, None, "")
+
+    @classmethod
+    def from_profile(cls, profile, confidence=None):
+        achievements = profile.get("top_achievements") or ()
+        if isinstance(achievements, str):
+            achievements = [a for a in re.split(r"\s*;\s*", achievements) if a]
+
+        name = _clean(profile.get("full_name"))
+        if not name or name.lower() == "unknown":
+            return cls.unknown()
+
+        if confidence is None:
+            confidence = _confidence(profile.get("confidence"))
+
+        return cls(
+            name,
+            _clean(profile.get("profession")),
+            _clean(profile.get("nationality")),
+            _clean(profile.get("famous_for")),
+            tuple(_clean(a) for a in achievements if _clean(a)),
+            confidence,
+            None,
+            "",
+        )
+
+    @classmethod
+    def from_markdown(cls, content):
+        fields = {}
+        current = None
+
+        for line in content.splitlines():
+            match = FIELD_LINE.match(line)
+            if match:
+                current = FIELD_KEYS[match.group(1).lower()]
+                value = _clean(match.group(2))
+                if current == "achievements":
+                    fields.setdefault(current, [])
+                    if value:
+                        fields[current].extend(a for a in re.split(r"\s*;\s*", value) if a)
+                elif value and current not in fields:
+                    fields[current] = value
+                continue
+
+            item = ITEM_LINE.match(line)
+            if item and current == "achievements":
+                fields[current].append(_clean(item.group(1)))
+
+        name = fields.get("name", "")
+        if not name or name.lower() == "unknown":
+            # Keep free text that isn't a plain "Unknown" so the page can still show it.
+            raw = content.strip() if _clean(content).lower() != "unknown" else ""
+            return cls.unknown()._replace(raw=raw)
+
+        return cls(
+            name,
+            fields.get("profession", ""),
+            fields.get("nationality", ""),
+            fields.get("famous_for", ""),
+            tuple(a for a in fields.get("achievements", ()) if a),
+            _confidence(fields.get("confidence")),
+            None,
+            "",
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        face_box = data.get("face_box")
+        return cls(
+            data.get("name") or "",
+            data.get("profession") or "",
+            data.get("nationality") or "",
+            data.get("famous_for") or "",
+            tuple(data.get("achievements") or ()),
+            data.get("confidence"),
+            tuple(face_box) if face_box else None,
+            data.get("raw") or "",
+        )
+
+    @classmethod
+    def from_cached(cls, value):
+        # Entries written before results were structured are [markdown, name].
+        if isinstance(value, dict):
+            return cls.from_dict(value)
+        info , name = value
+        result = cls.from_markdown(info)
+        return result._replace(name=name) if name and result.name != name else result
+
+    @property
+    def known(self):
+        return bool(self.name) and self.name != UNKNOWN
+
+    @property
+    def profile(self):
+        return {
+            "full_name": self.name,
+            "profession": self.profession,
+            "nationality": self.nationality,
+            "famous_for": self.famous_for,
+            "top_achievements": list(self.achievements),
+        }
+
+    @property
+    def info(self):
+        if self.raw:
+            return self.raw
+        if not self.known:
+            return UNKNOWN
+
+        info = format_profile(self.profile)
+        if self.confidence is not None:
+            info += f"\n- **Match Confidence**: {self.confidence:.2f}"
+        return info
+
+    def to_dict(self):
+        data = self._asdict()
+        data["achievements"] = list(self.achievements)
+        data["face_box"] = [int(v) for v in self.face_box] if self.face_box is not None else None
+        return data
@@ -0,0 +1,33 @@
+import os
+import threading
+
+from app.utils.cache import LRUCache, SQLiteCache, TieredCache
+from app.utils.image_handler import content_hash, perceptual_hash
+
+IDENTIFY_CACHE_SIZE = int(os.getenv("IDENTIFY_CACHE_SIZE", "2048"))
+IDENTIFY_CACHE_TTL = float(os.getenv("IDENTIFY_CACHE_TTL", "86400"))
+IDENTIFY_CACHE_PATH = os.getenv("IDENTIFY_CACHE_PATH", "")
+IDENTIFY_CACHE_KEY = os.getenv("IDENTIFY_CACHE_KEY", "content")
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def image_key(image_bytes, mode=None):
+    mode = mode or IDENTIFY_CACHE_KEY
+    if mode == "phash":
+        return "phash:" + perceptual_hash(image_bytes)
+    return "sha256:" + content_hash(image_bytes)
+
+
+def build_identify_cache(maxsize=IDENTIFY_CACHE_SIZE, ttl=IDENTIFY_CACHE_TTL, path=IDENTIFY_CACHE_PATH):
+    disk = SQLiteCache(path, ttl=ttl, table="identify") if path else None
+    return TieredCache(LRUCache(maxsize=maxsize, ttl=ttl), disk)
+
+
+def default_identify_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = build_identify_cache()
+        return _default_cache
@@ -1,30 +1,467 @@
 import cv2
+import hashlib
+import os
+import struct
+import time
+from collections import namedtuple
 from io import BytesIO
+import threading
 import numpy as np
 
-def process_image(image_file):
+from app.utils.face_registry import DEFAULT_CASCADE, borrow_cascade, registry
+from app.utils.metrics import stage_timer
+
+MODEL_IMAGE_MAX_EDGE = int(os.getenv("MODEL_IMAGE_MAX_EDGE", "512"))
+MODEL_IMAGE_QUALITY = int(os.getenv("MODEL_IMAGE_QUALITY", "85"))
+MODEL_FACE_MARGIN = float(os.getenv("MODEL_FACE_MARGIN", "0.4"))
+# Uploads are decoded at 1/2, 1/4 or 1/8 scale (JPEG DCT scaling) while the
+# long edge stays at or above DECODE_MAX_EDGE; the cascade runs on at most DETECT_MAX_EDGE.
+DECODE_MAX_EDGE = int(os.getenv("DECODE_MAX_EDGE", "1280"))
+DETECT_MAX_EDGE = int(os.getenv("DETECT_MAX_EDGE", "800"))
+
+REDUCED_COLOR = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# haar | lbp | yunet | ssd. The DNN backends and the LBP cascade need
+# FACE_DETECTOR_MODEL; opencv-python only bundles the Haar cascades.
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "haar")
+FACE_DETECTOR_MODEL = os.getenv("FACE_DETECTOR_MODEL", "")
+FACE_DETECTOR_CONFIG = os.getenv("FACE_DETECTOR_CONFIG", "")
+FACE_DETECTOR_SCORE = float(os.getenv("FACE_DETECTOR_SCORE", "0.6"))
+HAAR_SCALE_FACTOR = float(os.getenv("HAAR_SCALE_FACTOR", "1.1"))
+HAAR_MIN_NEIGHBORS = int(os.getenv("HAAR_MIN_NEIGHBORS", "5"))
+HAAR_MIN_SIZE = int(os.getenv("HAAR_MIN_SIZE", "0"))
+HAAR_PROFILE = os.getenv("HAAR_PROFILE", "0") == "1"
+
+PROFILE_CASCADE = "haarcascade_profileface.xml"
+LBP_CASCADE = "lbpcascade_frontalface_improved.xml"
+
+# JPEG start-of-frame markers (C4, C8 and CC are not frames).
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+class PreparedImage(namedtuple("PreparedImage", "display_bytes model_bytes face_box upload_size timings embedding", defaults=(None, None))):
+
+    @property
+    def model_size(self):
+        return len(self.model_bytes)
+
+    @property
+    def bytes_saved(self):
+        return self.upload_size - self.model_size
+
+
+def _read_upload(image_file):
+    # Werkzeug uploads expose their stream; reading it skips the save() copy.
+    stream = getattr(image_file, "stream", None)
+    if stream is not None:
+        return stream.read()
+
     in_memory_file = BytesIO()
     image_file.save(in_memory_file)
 
-    image_bytes = in_memory_file.getvalue()
+    return in_memory_file.getvalue()
+
+
+def _jpeg_segments(image_bytes):
+    if image_bytes[:2] != b"\xff\xd8":
+        return
+    i = 2
+    while i + 4 <= len(image_bytes) and image_bytes[i] == 0xFF:
+        marker = image_bytes[i + 1]
+        length = struct.unpack(">H", image_bytes[i + 2:i + 4])[0]
+        yield marker, image_bytes[i + 4:i + 2 + length]
+        if marker == 0xDA:
+            return
+        i += 2 + length
+
+
+def image_size(image_bytes):
+    # (width, height) from the file header, before any EXIF rotation.
+    if image_bytes[:8] == b"\x89PNG\r\n\x1a\n" and len(image_bytes) >= 24:
+        return struct.unpack(">II", image_bytes[16:24])
+
+    for marker , segment in _jpeg_segments(image_bytes):
+        if marker in SOF_MARKERS and len(segment) >= 5:
+            height , width = struct.unpack(">HH", segment[1:5])
+            return width , height
+
+    return None
+
+
+def exif_orientation(image_bytes):
+    for marker , segment in _jpeg_segments(image_bytes):
+        if marker != 0xE1 or not segment.startswith(b"Exif\x00\x00"):
+            continue
+
+        tiff = segment[6:]
+        endian = "<" if tiff[:2] == b"II" else ">"
+        try:
+            offset = struct.unpack(endian + "I", tiff[4:8])[0]
+            count = struct.unpack(endian + "H", tiff[offset:offset + 2])[0]
+            for n in range(count):
+                entry = tiff[offset + 2 + n * 12:offset + 14 + n * 12]
+                tag , kind = struct.unpack(endian + "HH", entry[:4])
+                if tag == 0x0112:
+                    return struct.unpack(endian + "H", entry[8:10])[0]
+        except struct.error:
+            return 1
+
+    return 1
+
+
+def apply_orientation(img, orientation):
+    if orientation in (5, 6, 7, 8):
+        img = cv2.transpose(img)
+
+    flip = {2: 1, 3: -1, 4: 0, 6: 1, 7: -1, 8: 0}.get(orientation)
+    return img if flip is None else cv2.flip(img, flip)
+
+
+def decode_image(image_bytes, max_edge=DECODE_MAX_EDGE):
+    # Returns the upright image and its scale relative to the full-resolution
+    # upload; raises InvalidImageError for bytes OpenCV can't decode.
+    size = image_size(image_bytes)
+    factor = 1
+    if size is not None:
+        factor = next((f for f in (8, 4, 2) if max(size) / f >= max_edge), 1)
+
     nparr = np.frombuffer(image_bytes,np.uint8)
+    img = cv2.imdecode(nparr, REDUCED_COLOR[factor] | cv2.IMREAD_IGNORE_ORIENTATION)
 
-    img = cv2.imdecode(nparr,cv2.IMREAD_COLOR)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if img is None:
+        raise InvalidImageError("Could not read the image. Please upload a JPEG or PNG file")
+
+    img = apply_orientation(img, exif_orientation(image_bytes))
+
+    scale = max(size) / max(img.shape[:2]) if size is not None else 1.0
+    return img , scale
+
+
+def scale_box(face_box, scale):
+    return tuple(int(round(v * scale)) for v in face_box)
+
+
+def suppress_overlaps(faces, iou=0.3):
+    # Greedy non-maximum suppression, largest box first.
+    kept = []
+    for (x,y,w,h) in sorted(faces,key=lambda r:r[2] *r[3],reverse=True):
+        for (kx,ky,kw,kh) in kept:
+            inter = max(0 , min(x + w , kx + kw) - max(x , kx)) * max(0 , min(y + h , ky + kh) - max(y , ky))
+            if inter / float(w * h + kw * kh - inter) > iou:
+                break
+        else:
+            kept.append((x,y,w,h))
+    return kept
+
+
+class HaarDetector:
+
+    # cv2.CascadeClassifier borrowed from the shared registry. With profile=True the
+    # profile cascade also runs on the image and its mirror (it only knows
+    # left-facing profiles).
+
+    name = "haar"
+
+    def __init__(self, cascade=DEFAULT_CASCADE, scale_factor=HAAR_SCALE_FACTOR, min_neighbors=HAAR_MIN_NEIGHBORS,
+                 min_size=HAAR_MIN_SIZE, profile=HAAR_PROFILE):
+        self.cascade = cascade
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = (min_size , min_size)
+        self.profile = profile
+
+    def warm(self):
+        registry.warm((self.cascade , PROFILE_CASCADE) if self.profile else (self.cascade,))
+
+    def _run(self, name, gray):
+        with borrow_cascade(name) as cascade:
+            faces = cascade.detectMultiScale(gray,self.scale_factor,self.min_neighbors,minSize=self.min_size)
+        return [tuple(int(v) for v in face) for face in faces]
+
+    def detect(self, img):
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+        faces = self._run(self.cascade, gray)
+        if not self.profile:
+            return faces
+
+        width = gray.shape[1]
+        faces += self._run(PROFILE_CASCADE, gray)
+        faces += [(width - x - w , y , w , h) for (x,y,w,h) in self._run(PROFILE_CASCADE, cv2.flip(gray, 1))]
+        return suppress_overlaps(faces)
+
+
+class LBPDetector(HaarDetector):
+
+    # LBP cascades are several times faster than Haar at some cost in recall.
+
+    name = "lbp"
+
+    def __init__(self, model_path=FACE_DETECTOR_MODEL, **kwargs):
+        super().__init__(cascade=model_path or LBP_CASCADE, **kwargs)
+
+
+class YuNetDetector:
+
+    # OpenCV's YuNet ONNX model (face_detection_yunet_2023mar.onnx) through
+    # cv2.FaceDetectorYN on the CPU DNN backend, one instance per thread.
+
+    name = "yunet"
+
+    def __init__(self, model_path=FACE_DETECTOR_MODEL, score_threshold=FACE_DETECTOR_SCORE, nms_threshold=0.3):
+        if not model_path or not os.path.exists(model_path):
+            raise RuntimeError(f"YuNet model not found at {model_path!r}")
+        self.model_path = model_path
+        self.score_threshold = score_threshold
+        self.nms_threshold = nms_threshold
+        self._local = threading.local()
+
+    def _detector(self):
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            detector = self._local.detector = cv2.FaceDetectorYN.create(
+                self.model_path, "", (320, 320), self.score_threshold, self.nms_threshold)
+        return detector
+
+    def warm(self):
+        self._detector()
+
+    def detect(self, img):
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+        detector = self._detector()
+        detector.setInputSize((img.shape[1] , img.shape[0]))
+        _ , faces = detector.detect(img)
+
+        if faces is None:
+            return []
+        return [tuple(int(v) for v in face[:4]) for face in faces]
+
+
+class SSDDetector:
 
-    face_cascade =cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    # ResNet-10 SSD (res10_300x300_ssd_iter_140000.caffemodel with its
+    # deploy.prototxt as FACE_DETECTOR_CONFIG, or an ONNX export) via cv2.dnn.
 
-    faces =face_cascade.detectMultiScale(gray,1.1,5)
+    name = "ssd"
+
+    def __init__(self, model_path=FACE_DETECTOR_MODEL, config_path=FACE_DETECTOR_CONFIG, score_threshold=FACE_DETECTOR_SCORE):
+        if not model_path or not os.path.exists(model_path):
+            raise RuntimeError(f"SSD model not found at {model_path!r}")
+        self.model_path = model_path
+        self.config_path = config_path
+        self.score_threshold = score_threshold
+        self._local = threading.local()
+
+    def _net(self):
+        net = getattr(self._local, "net", None)
+        if net is None:
+            net = self._local.net = cv2.dnn.readNet(self.model_path, self.config_path)
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        return net
+
+    def warm(self):
+        self._net()
+
+    def detect(self, img):
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+        h , w = img.shape[:2]
+        net = self._net()
+        net.setInput(cv2.dnn.blobFromImage(img, 1.0, (300, 300), (104.0, 177.0, 123.0)))
+        detections = net.forward().reshape(-1, 7)
+
+        faces = []
+        for score , x1 , y1 , x2 , y2 in detections[:, 2:7]:
+            if score < self.score_threshold:
+                continue
+            x1 , y1 = max(0 , int(x1 * w)) , max(0 , int(y1 * h))
+            x2 , y2 = min(w , int(x2 * w)) , min(h , int(y2 * h))
+            if x2 > x1 and y2 > y1:
+                faces.append((x1 , y1 , x2 - x1 , y2 - y1))
+        return faces
+
+
+def build_face_detector(name=FACE_DETECTOR, model_path=FACE_DETECTOR_MODEL):
+    if name == "haar":
+        return HaarDetector()
+    if name == "lbp":
+        return LBPDetector(model_path)
+    if name == "yunet":
+        return YuNetDetector(model_path)
+    if name == "ssd":
+        return SSDDetector(model_path)
+    raise ValueError(f"Unknown face detector {name!r}")
+
+
+_default_detector = None
+_default_detector_lock = threading.Lock()
+
+
+def default_face_detector():
+    global _default_detector
+    with _default_detector_lock:
+        if _default_detector is None:
+            _default_detector = build_face_detector()
+        return _default_detector
+
+
+def detect_faces(img, max_edge=DETECT_MAX_EDGE, detector=None):
+    scale = max(img.shape[:2]) / max_edge
+    if scale > 1:
+        img = cv2.resize(img , (round(img.shape[1] / scale) , round(img.shape[0] / scale)) , interpolation=cv2.INTER_AREA)
+
+    faces = (detector or default_face_detector()).detect(img)
+
+    if scale > 1:
+        faces = [scale_box(face, scale) for face in faces]
+
+    return sorted(faces,key=lambda r:r[2] *r[3],reverse=True)
+
+
+def detect_largest_face(img):
+    faces = detect_faces(img)
 
     if len(faces)==0:
-        return image_bytes,None
+        return None
+
+    return faces[0]
 
-    largest_face = max(faces,key=lambda r:r[2] *r[3])
 
-    (x,y,w,h) = largest_face
+def _draw_face(img, face_box):
+    (x,y,w,h) = face_box
 
     cv2.rectangle(img, (x,y),(x+w , y+h) , (0,255,0),3 )
 
     is_sucess , buffer = cv2.imencode(".jpg" , img)
 
-    return buffer.tobytes(), largest_face
\ No newline at end of file
+    return buffer.tobytes()
+
+
+def annotate_faces(img, face_boxes, labels):
+    for (x,y,w,h) , label in zip(face_boxes , labels):
+        cv2.rectangle(img, (x,y),(x+w , y+h) , (0,255,0),3 )
+
+        if label:
+            (text_w , text_h) , baseline = cv2.getTextSize(label , cv2.FONT_HERSHEY_SIMPLEX , 0.6 , 2)
+            top = max(0 , y - text_h - baseline - 4)
+            cv2.rectangle(img, (x,top),(x + text_w + 4 , top + text_h + baseline + 4) , (0,255,0),-1 )
+            cv2.putText(img , label , (x + 2 , top + text_h + 2) , cv2.FONT_HERSHEY_SIMPLEX , 0.6 , (0,0,0) , 2)
+
+    is_sucess , buffer = cv2.imencode(".jpg" , img)
+
+    return buffer.tobytes()
+
+
+def prepare_model_image(img, face_box=None, max_edge=MODEL_IMAGE_MAX_EDGE, quality=MODEL_IMAGE_QUALITY, margin=MODEL_FACE_MARGIN):
+    if face_box is not None:
+        (x,y,w,h) = face_box
+        pad_x , pad_y = int(w * margin) , int(h * margin)
+        img_h , img_w = img.shape[:2]
+
+        img = img[max(0 , y - pad_y):min(img_h , y + h + pad_y), max(0 , x - pad_x):min(img_w , x + w + pad_x)]
+
+    h , w = img.shape[:2]
+    scale = max_edge / max(h , w)
+    if scale < 1:
+        img = cv2.resize(img , (max(1 , round(w * scale)) , max(1 , round(h * scale))) , interpolation=cv2.INTER_AREA)
+
+    is_sucess , buffer = cv2.imencode(".jpg" , img , [cv2.IMWRITE_JPEG_QUALITY , quality])
+
+    return buffer.tobytes()
+
+
+def preprocess_image(image_file):
+    return preprocess_bytes(_read_upload(image_file))
+
+
+def preprocess_bytes(image_bytes):
+    timings = {}
+    start = time.perf_counter()
+
+    def lap(stage):
+        nonlocal start
+        now = time.perf_counter()
+        timings[stage] = round((now - start) * 1000, 2)
+        start = now
+
+    img , scale = decode_image(image_bytes)
+    lap("decode")
+
+    face_box = detect_largest_face(img)
+    lap("detect")
+
+    model_bytes = prepare_model_image(img, face_box)
+    lap("encode_model")
+
+    # Small uploads (and tight crops of them) can grow when re-encoded; send
+    # the upload untouched instead.
+    if len(model_bytes) >= len(image_bytes):
+        model_bytes = image_bytes
+
+    # The local recognizer's embedding, so the request thread only has to
+    # match it against the index.
+    from app.utils.local_recognizer import face_embedding
+    embedding = face_embedding(img, face_box)
+    lap("embed")
+
+    if face_box is None:
+        return PreparedImage(image_bytes, model_bytes, None, len(image_bytes), timings, embedding)
+
+    display_bytes = _draw_face(img, face_box)
+    lap("encode_display")
+
+    # Boxes are reported in full-resolution coordinates of the upright upload.
+    return PreparedImage(display_bytes, model_bytes, scale_box(face_box, scale), len(image_bytes), timings, embedding)
+
+
+def process_image(image_file):
+    image_bytes = _read_upload(image_file)
+
+    with stage_timer("process_image", "decode"):
+        img , scale = decode_image(image_bytes)
+
+    with stage_timer("process_image", "detect"):
+        largest_face = detect_largest_face(img)
+
+    if largest_face is None:
+        return image_bytes,None
+
+    with stage_timer("process_image", "encode_display"):
+        return _draw_face(img, largest_face), scale_box(largest_face, scale)
+
+
+def content_hash(image_bytes):
+    nparr = np.frombuffer(image_bytes,np.uint8)
+    img = cv2.imdecode(nparr,cv2.IMREAD_COLOR)
+
+    if img is None:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    digest = hashlib.sha256(str(img.shape).encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def perceptual_hash(image_bytes, size=8):
+    nparr = np.frombuffer(image_bytes,np.uint8)
+    gray = cv2.imdecode(nparr,cv2.IMREAD_GRAYSCALE)
+
+    if gray is None:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    small = cv2.resize(gray,(size + 1,size),interpolation=cv2.INTER_AREA)
+    diff = small[:,1:] > small[:,:-1]
+    return np.packbits(diff).tobytes().hex()
\ No newline at end of file
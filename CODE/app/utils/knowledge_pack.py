@@ -0,0 +1,203 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+
+KNOWLEDGE_PACK_PATH = os.getenv("KNOWLEDGE_PACK_PATH", os.path.join(os.path.dirname(__file__), "..", "..", "knowledge", "pack.json"))
+KNOWLEDGE_MIN_SCORE = float(os.getenv("KNOWLEDGE_MIN_SCORE", "1.5"))
+
+# Profile fields, in the order and wording of the identify prompt.
+PROFILE_FIELDS = [
+    ("full_name", "Full Name"),
+    ("profession", "Profession"),
+    ("nationality", "Nationality"),
+    ("famous_for", "Famous For"),
+    ("top_achievements", "Top Achievements"),
+]
+
+# Whole-question phrasings that a single profile field answers outright.
+# {who} / {whom} / {whose} stand for a pronoun or the person's name. Anything
+# that doesn't match in full ("where was he born?", "what is his job and
+# salary?") goes to retrieval and the LLM instead.
+FIELD_INTENTS = [
+    ("profession", (
+        r"what (?:is|was) {whose} (?:job|profession|occupation|line of work)",
+        r"what (?:does|did) {who} do(?: for a living| for work)?",
+        r"what (?:does|did) {who} work as",
+        r"what (?:kind of |type of )?work (?:does|did) {who} do",
+    )),
+    ("nationality", (
+        r"what (?:is|was) {whose} nationality",
+        r"what nationality (?:is|was) {who}",
+        r"(?:what|which) country (?:is|was) {who} (?:from|a citizen of)",
+        r"(?:what|which) country (?:does|did) {who} come from",
+        r"where (?:is|was) {who} from",
+        r"where (?:does|did) {who} come from",
+    )),
+    ("famous_for", (
+        r"(?:what|why) (?:is|was) {who} (?:best |most |well |widely )?(?:famous|known|popular|renowned)(?: for)?",
+        r"what (?:made|makes) {whom} famous",
+    )),
+    ("top_achievements", (
+        r"what (?:are|were) {whose} (?:top |main |biggest |greatest |major |notable |key )?"
+        r"(?:achievements|accomplishments|awards|honours|honors)",
+        r"(?:list |name )?{whose} (?:top |main |biggest |greatest |major |notable |key )?"
+        r"(?:achievements|accomplishments|awards|honours|honors)",
+        r"what (?:awards|honours|honors|prizes) (?:has|have|did) {who} (?:won|win|received|receive|got|get)",
+        r"what (?:has|have|did) {who} (?:won|win|achieved|achieve|accomplished|accomplish)",
+    )),
+]
+INTENT_PREFIX = r"(?:(?:can|could) you )?(?:please )?(?:tell me )?"
+SUBJECT_PRONOUNS = ("he", "she", "they", "this person", "this celebrity")
+OBJECT_PRONOUNS = ("him", "her", "them", "this person", "this celebrity")
+POSSESSIVE_PRONOUNS = ("his", "her", "their", "this person's", "this celebrity's")
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "of", "in", "on", "for", "to", "and", "or",
+    "what", "which", "who", "whom", "how", "when", "where", "why", "does", "did", "do", "he", "she",
+    "his", "her", "him", "they", "their", "them", "it", "its", "about", "me", "tell", "with", "as",
+}
+
+_default_pack = None
+_default_loaded = False
+_default_lock = threading.Lock()
+
+
+def normalize_name(name):
+    return " ".join(re.sub(r"[^\w\s]", " ", name.replace("_", " ").lower()).split())
+
+
+def tokenize(text):
+    return [t for t in re.findall(r"\w+", text.lower()) if t not in STOPWORDS]
+
+
+def normalize_question_text(question):
+    return " ".join(re.sub(r"[^\w\s']", " ", question.lower().replace("\u2019", "'")).split())
+
+
+@lru_cache(maxsize=256)
+def field_patterns(names):
+    # names: normalised forms the question may use for the person.
+    names = tuple(re.escape(name) for name in names if name)
+    alternation = lambda words: "(?:" + "|".join(words) + ")"
+    slots = {
+        "who": alternation(SUBJECT_PRONOUNS + names),
+        "whom": alternation(OBJECT_PRONOUNS + names),
+        "whose": alternation(POSSESSIVE_PRONOUNS + tuple(f"{name}'s?" for name in names)),
+    }
+    return [
+        (key , [re.compile(INTENT_PREFIX + pattern.format(**slots)) for pattern in patterns])
+        for key , patterns in FIELD_INTENTS
+    ]
+
+
+def format_profile(profile):
+    lines = []
+    for key , label in PROFILE_FIELDS:
+        value = profile.get(key)
+        if not value:
+            continue
+        if isinstance(value , list):
+            lines.append(f"- **{label}**:")
+            lines.extend(f"  - {item}" for item in value)
+        else:
+            lines.append(f"- **{label}**: {value}")
+    return "\n".join(lines)
+
+
+class KnowledgePack:
+
+    # {"celebrities": [{"name", "profile": {...}, "chunks": [str, ...]}]}
+    # Chunks are scored with BM25, restricted to the asked-about person.
+
+    def __init__(self, celebrities, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.entries = {normalize_name(c["name"]): c for c in celebrities}
+
+        self.chunks = {}
+        document_frequency = Counter()
+        lengths = []
+        for key , entry in self.entries.items():
+            tokenized = []
+            for chunk in entry.get("chunks" , []):
+                counts = Counter(tokenize(chunk))
+                tokenized.append((chunk , counts , sum(counts.values())))
+                document_frequency.update(counts.keys())
+                lengths.append(sum(counts.values()))
+            self.chunks[key] = tokenized
+
+        total = len(lengths)
+        self.average_length = sum(lengths) / total if total else 0.0
+        self.idf = {
+            term: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term , df in document_frequency.items()
+        }
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f)["celebrities"])
+
+    def __contains__(self, name):
+        return normalize_name(name) in self.entries
+
+    def names(self):
+        return [entry["name"] for entry in self.entries.values()]
+
+    def profile(self, name):
+        entry = self.entries.get(normalize_name(name))
+        return entry["profile"] if entry else None
+
+    def answer_field(self, name, question):
+        profile = self.profile(name)
+        if not profile:
+            return None
+
+        names = set()
+        for full in (name, profile.get("full_name", "")):
+            parts = normalize_name(full).split()
+            if parts:
+                names.update((" ".join(parts), parts[0], parts[-1]))
+
+        question = normalize_question_text(question)
+        for key , patterns in field_patterns(tuple(sorted(names))):
+            if profile.get(key) and any(pattern.fullmatch(question) for pattern in patterns):
+                value = profile[key]
+                label = dict(PROFILE_FIELDS)[key]
+                if isinstance(value , list):
+                    value = "; ".join(value)
+                return f"{profile.get('full_name' , name)} — {label}: {value}"
+        return None
+
+    def retrieve(self, name, question, k=3):
+        chunks = self.chunks.get(normalize_name(name) , [])
+        terms = set(tokenize(question))
+        if not chunks or not terms:
+            return []
+
+        scored = []
+        for chunk , counts , length in chunks:
+            score = 0.0
+            for term in terms:
+                tf = counts.get(term , 0)
+                if tf:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+                    score += self.idf.get(term , 0.0) * tf * (self.k1 + 1) / norm
+            if score > 0:
+                scored.append((score , chunk))
+
+        scored.sort(reverse=True)
+        return scored[:k]
+
+
+def default_knowledge_pack():
+    global _default_pack, _default_loaded
+    with _default_lock:
+        if not _default_loaded:
+            _default_loaded = True
+            if os.path.exists(KNOWLEDGE_PACK_PATH):
+                _default_pack = KnowledgePack.load(KNOWLEDGE_PACK_PATH)
+        return _default_pack
@@ -0,0 +1,61 @@
+import threading
+import time
+
+
+class ServerState:
+
+    # Readiness for load balancers: not ready until the app has warmed up,
+    # and not ready again once shutdown starts so traffic drains first.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.ready = False
+        self.draining = False
+        self.checks = {}
+
+    def mark_ready(self):
+        with self._lock:
+            self.ready = True
+
+    def begin_shutdown(self):
+        with self._lock:
+            self.draining = True
+
+    def add_check(self, name, check):
+        self.checks[name] = check
+
+    def readiness(self):
+        failed = {}
+        for name , check in self.checks.items():
+            try:
+                ok = check()
+            except Exception as e:
+                ok , failed[name] = False , str(e)
+            if not ok:
+                failed.setdefault(name, "failed")
+
+        with self._lock:
+            ready = self.ready and not self.draining and not failed
+            return ready , {
+                "ready": ready,
+                "draining": self.draining,
+                "uptime": round(time.monotonic() - self.started, 1),
+                "failed_checks": failed,
+            }
+
+
+server_state = ServerState()
+
+
+def shutdown():
+    # Called once per worker on exit; lets in-flight work finish, then frees pools.
+    from app.utils.http_client import default_http_client
+    from app.utils.metrics import metrics
+    from app.utils.preprocess_pool import default_preprocess_pool
+
+    server_state.begin_shutdown()
+    default_preprocess_pool().shutdown()
+    default_http_client().close()
+    # The last counts; the next scrape folds them into the archive.
+    metrics.flush()
@@ -0,0 +1,89 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from app.utils.face_embedder import build_embedder
+from app.utils.face_index import load_index
+from app.utils.image_handler import detect_largest_face
+
+FACE_INDEX_PATH = os.getenv("FACE_INDEX_PATH", os.path.join(os.path.dirname(__file__), "..", "..", "face_index"))
+LOCAL_MATCH_THRESHOLD = os.getenv("LOCAL_MATCH_THRESHOLD", "")
+
+_default_recognizer = None
+_default_loaded = False
+_default_lock = threading.Lock()
+
+
+class LocalRecognizer:
+
+    def __init__(self, index, embedder, threshold=None):
+        self.index = index
+        self.embedder = embedder
+        self.threshold = threshold if threshold is not None else embedder.threshold
+
+    @classmethod
+    def from_path(cls, path, threshold=None):
+        index = load_index(path)
+        return cls(index, build_embedder(index.embedder), threshold)
+
+    def save(self, path):
+        self.index.save(path)
+
+    def embed_face(self, img, face_box):
+        if face_box is not None:
+            (x,y,w,h) = face_box
+            img = img[y:y + h, x:x + w]
+        return self.embedder.embed(img)
+
+    def embed_image(self, img):
+        return self.embed_face(img, detect_largest_face(img))
+
+    def recognize(self, image_bytes, embedding=None):
+        # embedding comes from the preprocess worker that already decoded the
+        # upload and found the face; without it, decode and detect here.
+        if embedding is None:
+            img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                return None, 0.0
+            embedding = self.embed_image(img)
+
+        name, score = self.index.match(embedding)
+        if name is None or score < self.threshold:
+            return None, score
+        return name, score
+
+    def enroll(self, name, images):
+        vectors = []
+        for image_bytes in images:
+            img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+            if img is not None:
+                vectors.append(self.embed_image(img))
+
+        if vectors:
+            self.index.add(name, np.vstack(vectors))
+        return len(vectors)
+
+    def remove(self, name):
+        return self.index.remove(name)
+
+
+def face_embedding(img, face_box):
+    # Runs in a preprocess worker on its decoded image and tight face box (the
+    # whole image when no face was found, as embed_image does).
+    recognizer = default_local_recognizer()
+    if recognizer is None:
+        return None
+    return recognizer.embed_face(img, face_box)
+
+
+def default_local_recognizer():
+    global _default_recognizer, _default_loaded
+    with _default_lock:
+        if not _default_loaded:
+            _default_loaded = True
+            if os.path.exists(os.path.join(FACE_INDEX_PATH, "meta.json")):
+                threshold = float(LOCAL_MATCH_THRESHOLD) if LOCAL_MATCH_THRESHOLD else None
+                _default_recognizer = LocalRecognizer.from_path(FACE_INDEX_PATH, threshold)
+        return _default_recognizer
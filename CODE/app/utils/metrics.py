@@ -0,0 +1,366 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# A directory shared by the processes of one server (gunicorn.conf.py sets
+# it). Each process writes its counters, histograms and gauges there and a
+# scrape of any worker adds them up; unset, /metrics is per process.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+# Totals of exited workers, folded together so counters never go backwards.
+METRICS_ARCHIVE = "archive.json"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name , value in zip(names , values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        if self.registry is not None:
+            self.registry.touch()
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self, values=None):
+        for key , value in (self.values() if values is None else values).items():
+            yield self.name + "_total", key, value
+
+    @staticmethod
+    def merge(value, other):
+        return value + other
+
+
+class Histogram:
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.registry = registry
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            counts , total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i , bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts , total + value)
+        if self.registry is not None:
+            self.registry.touch()
+
+    def values(self):
+        with self._lock:
+            return {key : [list(counts) , total] for key , (counts , total) in self._values.items()}
+
+    def samples(self, values=None):
+        for key , (counts , total) in (self.values() if values is None else values).items():
+            cumulative = 0
+            for bound , count in zip(self.buckets , counts):
+                cumulative += count
+                yield self.name + "_bucket", key + (_number(bound),), cumulative
+            yield self.name + "_sum", key, total
+            yield self.name + "_count", key, cumulative
+
+
+class Gauge:
+
+    # Read at scrape time from a callback returning a number, or a dict of
+    # label tuples to numbers.
+
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labelnames=()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        value = self.fn()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for key , v in value.items():
+            yield self.name, tuple(key), v
+
+    def values(self):
+        return {tuple(key) : v for _ , key , v in self.samples()}
+
+
+class MetricsRegistry:
+
+    # Prometheus text exposition without the client library. With a shared
+    # directory, counters and histograms are summed over every process of the
+    # server (exited workers included) and gauges are reported per live
+    # process with a "pid" label; without one, values are this process's.
+
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        if hasattr(os, "register_at_fork"):
+            # The flusher thread doesn't survive fork(); each worker starts its own.
+            os.register_at_fork(after_in_child=self._forked)
+
+    def _forked(self):
+        self._flusher = None
+        self._lock = threading.Lock()
+
+    def touch(self):
+        # Processes that never record anything (e.g. preprocess workers) never write a file.
+        if self.directory and self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames, registry=self))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets, registry=self))
+
+    def gauge(self, name, help, fn, labelnames=()):
+        with self._lock:
+            # Re-registering replaces the callback (e.g. a new app instance).
+            self._metrics[name] = Gauge(name, help, fn, labelnames)
+            return self._metrics[name]
+
+    def _snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        snapshot = {}
+        for metric in metrics:
+            try:
+                values = metric.values()
+            except Exception:
+                continue
+            snapshot[metric.name] = [[list(key) , value] for key , value in values.items()]
+        return snapshot
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def flush(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(os.getpid())
+        with open(path + ".tmp", "w") as f:
+            json.dump(self._snapshot(), f)
+        os.replace(path + ".tmp", path)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return {name : {tuple(key) : value for key , value in values} for name , values in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def _merge(self, into, snapshot, kinds):
+        for name , values in snapshot.items():
+            kind = kinds.get(name)
+            if kind is None or kind.kind == "gauge":
+                continue
+            merged = into.setdefault(name, {})
+            for key , value in values.items():
+                if key not in merged:
+                    merged[key] = value
+                elif kind.kind == "counter":
+                    merged[key] += value
+                else:
+                    merged[key] = [[a + b for a , b in zip(merged[key][0], value[0])], merged[key][1] + value[1]]
+
+    def _archive_exited(self, kinds):
+        # Folds the files of exited workers into the archive, so their totals
+        # stay while the directory doesn't grow with every recycled worker.
+        archive_path = os.path.join(self.directory, METRICS_ARCHIVE)
+        exited = []
+        for name in os.listdir(self.directory):
+            pid = name[:-len(".json")]
+            if not name.endswith(".json") or not pid.isdigit():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                exited.append(name)
+            except PermissionError:
+                pass
+
+        if not exited:
+            return
+        archive = self._read(archive_path)
+        for name in exited:
+            self._merge(archive, self._read(os.path.join(self.directory, name)), kinds)
+        with open(archive_path + ".tmp", "w") as f:
+            json.dump({name : [[list(key) , value] for key , value in values.items()] for name , values in archive.items()}, f)
+        os.replace(archive_path + ".tmp", archive_path)
+        for name in exited:
+            os.remove(os.path.join(self.directory, name))
+
+    def _collect(self, metrics):
+        # {name: {label tuple: value}} over every process; gauges get a pid label.
+        # Scrapes on different workers take turns, so none reads a file that
+        # another is moving into the archive.
+        import fcntl
+
+        kinds = {metric.name : metric for metric in metrics}
+        self.flush()
+
+        totals = {}
+        gauges = {}
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._archive_exited(kinds)
+            for name in sorted(os.listdir(self.directory)):
+                if not name.endswith(".json"):
+                    continue
+                snapshot = self._read(os.path.join(self.directory, name))
+                self._merge(totals, snapshot, kinds)
+                if name != METRICS_ARCHIVE:
+                    pid = name[:-len(".json")]
+                    for metric_name , values in snapshot.items():
+                        if metric_name in kinds and kinds[metric_name].kind == "gauge":
+                            gauges.setdefault(metric_name, {}).update({key + (pid,) : v for key , v in values.items()})
+        totals.update(gauges)
+        return totals
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        collected = self._collect(metrics) if self.directory else None
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            labelnames = metric.labelnames
+            if collected is not None and metric.kind == "gauge":
+                labelnames += ("pid",)
+            names = labelnames + (("le",) if metric.kind == "histogram" else ())
+            try:
+                if collected is None:
+                    samples = metric.samples()
+                elif metric.kind == "gauge":
+                    samples = ((metric.name , key , value) for key , value in collected.get(metric.name, {}).items())
+                else:
+                    samples = metric.samples(collected.get(metric.name, {}))
+                for sample , key , value in samples:
+                    label_names = names if len(key) == len(names) else labelnames
+                    lines.append(f"{sample}{_labels(label_names, key)} {_number(value)}")
+            except Exception:
+                continue
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+stage_seconds = metrics.histogram(
+    "celebrity_stage_seconds", "Time spent in each stage of a request", ("operation", "stage"))
+upstream_responses = metrics.counter(
+    "celebrity_upstream_responses", "Groq responses by status code (\"error\" for transport failures)", ("endpoint", "status"))
+upstream_queue_seconds = metrics.histogram(
+    "celebrity_upstream_queue_seconds", "Time spent waiting for the upstream rate limits", ("priority",))
+upstream_payload_bytes = metrics.histogram(
+    "celebrity_upstream_payload_bytes", "Size of the JSON body sent to Groq", ("endpoint",), SIZE_BUCKETS)
+upstream_tokens = metrics.counter(
+    "celebrity_upstream_tokens", "Tokens reported by Groq, plus the local prompt estimate", ("endpoint", "kind"))
+results_total = metrics.counter(
+    "celebrity_results", "Identify and QA results by where they came from", ("operation", "source"))
+provider_calls = metrics.counter(
+    "celebrity_provider_calls", "Upstream calls per provider and outcome", ("operation", "provider", "outcome"))
+provider_routes = metrics.counter(
+    "celebrity_provider_routes", "Hedged requests, failovers to the next provider and background probes", ("operation", "event"))
+http_seconds = metrics.histogram(
+    "celebrity_http_request_seconds", "Web request latency until the response starts", ("endpoint", "method", "status"))
+
+
+@contextmanager
+def stage_timer(operation, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, operation=operation, stage=stage)
+
+
+def record_response(endpoint, response=None):
+    upstream_responses.inc(endpoint=endpoint, status=getattr(response, "status_code", "error"))
+
+
+def flatten(stats, prefix=""):
+    # Numeric leaves of a nested stats dict, keyed for a gauge with one "key" label.
+    values = {}
+    for name , value in stats.items():
+        key = f"{prefix}{name}"
+        if isinstance(value, dict):
+            values.update(flatten(value, key + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[(key,)] = value
+    return values
+
+
+def observe_stages(operation, timings):
+    # Stage timings measured elsewhere (e.g. in a preprocess worker process), in ms.
+    for stage , ms in (timings or {}).items():
+        stage_seconds.observe(ms / 1000, operation=operation, stage=stage)
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from collections import namedtuple
+
+from app.utils.image_handler import annotate_faces, decode_image, detect_faces, prepare_model_image, scale_box
+from app.utils.local_recognizer import face_embedding
+from app.utils.metrics import stage_timer
+from app.utils.preprocess_pool import default_preprocess_pool
+
+# face_boxes are in the decoded image's coordinates (for annotation),
+# upload_boxes in the full-resolution upload's.
+PreparedFaces = namedtuple("PreparedFaces", "crops face_boxes upload_boxes timings embeddings", defaults=(None,))
+
+
+def prepare_faces(image_bytes):
+    # Runs in a preprocess worker: decode, detect, crop and embed every face.
+    timings = {}
+    start = time.perf_counter()
+
+    def lap(stage):
+        nonlocal start
+        now = time.perf_counter()
+        timings[stage] = round((now - start) * 1000, 2)
+        start = now
+
+    img , scale = decode_image(image_bytes)
+    lap("decode")
+
+    face_boxes = detect_faces(img)
+    lap("detect")
+
+    crops = [prepare_model_image(img, face_box) for face_box in face_boxes]
+    lap("crop")
+
+    embeddings = [face_embedding(img, face_box) for face_box in face_boxes]
+    lap("embed")
+
+    return PreparedFaces(crops, face_boxes, [scale_box(face_box, scale) for face_box in face_boxes], timings, embeddings)
+
+
+def annotate_upload(image_bytes, face_boxes, labels):
+    # Runs in a preprocess worker; the same reduced decode gives the same coordinates.
+    img , _ = decode_image(image_bytes)
+    return annotate_faces(img, face_boxes, labels)
+
+
+def _located(prepared, results):
+    return [result._replace(face_box=upload_box) for upload_box , result in zip(prepared.upload_boxes , results)]
+
+
+def _labels(results):
+    return [result.name if result.known else "?" for result in results]
+
+
+def _faces(results):
+    return [dict(result.to_dict(), info=result.info) for result in results]
+
+
+def identify_faces(image_bytes, detector, mode=None, pool=None):
+    pool = pool or default_preprocess_pool()
+    prepared = pool.call(prepare_faces, image_bytes, operation="identify_faces")
+
+    with stage_timer("identify_faces", "identify"):
+        results = _located(prepared, detector.identify_results(prepared.crops, mode, prepared.embeddings))
+
+    with stage_timer("identify_faces", "annotate"):
+        display_bytes = pool.call(annotate_upload, image_bytes, prepared.face_boxes, _labels(results), operation="identify_faces")
+
+    return display_bytes, _faces(results)
+
+
+async def identify_faces_async(image_bytes, detector, mode=None, pool=None):
+    # The same, for the ASGI app: pool futures are awaited and the detector's
+    # identify_results is a coroutine.
+    pool = pool or default_preprocess_pool()
+    prepared = await asyncio.wrap_future(pool.submit_call(prepare_faces, image_bytes, operation="identify_faces"))
+
+    with stage_timer("identify_faces", "identify"):
+        results = _located(prepared, await detector.identify_results(prepared.crops, mode, prepared.embeddings))
+
+    with stage_timer("identify_faces", "annotate"):
+        display_bytes = await asyncio.wrap_future(pool.submit_call(
+            annotate_upload, image_bytes, prepared.face_boxes, _labels(results), operation="identify_faces"))
+
+    return display_bytes, _faces(results)
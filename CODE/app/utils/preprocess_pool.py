@@ -0,0 +1,267 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+from app.utils.cpu import available_cpus
+from app.utils.face_registry import registry
+from app.utils.image_handler import PreparedImage, preprocess_bytes
+from app.utils.metrics import observe_stages, stage_seconds
+
+# 0 runs preprocessing on the calling thread. Every process that serves
+# requests has its own pool; gunicorn.conf.py divides the CPUs between workers.
+PREPROCESS_PROCESSES = int(os.getenv("PREPROCESS_PROCESSES", os.getenv("BATCH_PROCESSES", str(available_cpus()))))
+# Uploads at least this large reach the workers through shared memory
+# instead of being pickled down the pool's pipe.
+PREPROCESS_SHM_MIN_BYTES = int(os.getenv("PREPROCESS_SHM_MIN_BYTES", str(256 * 1024)))
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def _warm_worker():
+    from app.utils.image_handler import default_face_detector
+    from app.utils.local_recognizer import default_local_recognizer
+    default_face_detector().warm()
+    default_local_recognizer()
+
+
+def _ping(image_bytes):
+    return None
+
+
+def _preprocess(image_bytes):
+    prepared = preprocess_bytes(image_bytes)
+
+    # The parent already has the upload; don't send it back when it is reused as-is.
+    return prepared._replace(
+        display_bytes=None if prepared.display_bytes is image_bytes else prepared.display_bytes,
+        model_bytes=None if prepared.model_bytes is image_bytes else prepared.model_bytes,
+    )
+
+
+def _run(fn, image_bytes=None, shm_name=None, size=0, args=()):
+    start = time.perf_counter()
+
+    if shm_name is not None:
+        # Spawned workers share the parent's resource tracker, so the parent's
+        # unlink() is the only cleanup the block needs.
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            image_bytes = bytes(shm.buf[:size])
+        finally:
+            shm.close()
+
+    value = fn(image_bytes, *args)
+    # The worker's cascade registry rides along so the parent can report it.
+    return value, time.perf_counter() - start, (os.getpid(), registry.stats())
+
+
+class PreprocessPool:
+
+    # preprocess_bytes() in a pool of spawned processes with warm detectors,
+    # so decoding, detection and re-encoding don't hold the request thread's GIL.
+    # submit_call() runs any other module-level fn(image_bytes, *args) the same
+    # way, e.g. the multi-face detection and annotation steps.
+
+    def __init__(self, processes=PREPROCESS_PROCESSES, shm_min_bytes=PREPROCESS_SHM_MIN_BYTES):
+        self.processes = processes
+        self.shm_min_bytes = shm_min_bytes
+        self._executor = None
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.shared = 0
+        self.busy_seconds = 0.0
+        self.warmed = False
+        self._warming = False
+        self.registries = {}
+
+    def executor(self):
+        # "spawn" keeps OpenCV's internal threads out of forked gunicorn workers.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_worker,
+                )
+                self.started = time.monotonic()
+            return self._executor
+
+    def warm(self):
+        # Starts the workers, which warm their detectors as they start, without
+        # waiting for them; readiness reads `warmed`, set once every one has
+        # answered. An inline pool warms this process's detector instead.
+        with self._lock:
+            if self._warming or self.warmed:
+                return self.warmed
+            self._warming = True
+
+        if self.processes <= 0:
+            try:
+                _warm_worker()
+            finally:
+                with self._lock:
+                    self._warming = False
+            with self._lock:
+                self.registries[os.getpid()] = registry.stats()
+                self.warmed = True
+            return True
+
+        remaining = self.processes
+
+        def answered(future):
+            nonlocal remaining
+            try:
+                _ , _ , (pid , stats) = future.result()
+            except Exception:
+                # Try again on the next readiness check.
+                with self._lock:
+                    self._warming = False
+                return
+            with self._lock:
+                self.registries[pid] = stats
+                remaining -= 1
+                if remaining == 0:
+                    self.warmed , self._warming = True , False
+
+        try:
+            for _ in range(self.processes):
+                self.executor().submit(_run, _ping, b"").add_done_callback(answered)
+        except Exception:
+            with self._lock:
+                self._warming = False
+        return False
+
+    def submit(self, image_bytes):
+        return self.submit_call(_preprocess, image_bytes)
+
+    def submit_call(self, fn, image_bytes, *args, operation="preprocess"):
+        with self._lock:
+            self.submitted += 1
+
+        result = Future()
+        submitted = time.perf_counter()
+
+        if self.processes <= 0:
+            try:
+                value , seconds , worker = _run(fn, image_bytes, args=args)
+                self._done(result, image_bytes, None, value, seconds, worker, submitted, operation)
+            except Exception as e:
+                self._failed(result, None, e)
+            return result
+
+        shm = None
+        try:
+            if len(image_bytes) >= self.shm_min_bytes:
+                shm = shared_memory.SharedMemory(create=True, size=len(image_bytes))
+                shm.buf[:len(image_bytes)] = image_bytes
+                with self._lock:
+                    self.shared += 1
+                future = self.executor().submit(_run, fn, None, shm.name, len(image_bytes), args)
+            else:
+                future = self.executor().submit(_run, fn, image_bytes, args=args)
+        except Exception as e:
+            self._failed(result, shm, e)
+            return result
+
+        def finished(future):
+            try:
+                value , seconds , worker = future.result()
+            except Exception as e:
+                self._failed(result, shm, e)
+                return
+            self._done(result, image_bytes, shm, value, seconds, worker, submitted, operation)
+
+        future.add_done_callback(finished)
+        return result
+
+    def preprocess(self, image_bytes):
+        return self.submit(image_bytes).result()
+
+    def call(self, fn, image_bytes, *args, operation="preprocess"):
+        return self.submit_call(fn, image_bytes, *args, operation=operation).result()
+
+    def _release(self, shm):
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    def _done(self, result, image_bytes, shm, value, seconds, worker, submitted, operation):
+        self._release(shm)
+        pid , registry_stats = worker
+        with self._lock:
+            self.completed += 1
+            self.busy_seconds += seconds
+            self.registries[pid] = registry_stats
+        observe_stages(operation, getattr(value, "timings", None))
+        # Queueing plus the hand-off to and from the worker.
+        stage_seconds.observe(max(0.0, time.perf_counter() - submitted - seconds), operation=operation, stage="pool_wait")
+        if isinstance(value, PreparedImage):
+            value = value._replace(
+                display_bytes=image_bytes if value.display_bytes is None else value.display_bytes,
+                model_bytes=image_bytes if value.model_bytes is None else value.model_bytes,
+            )
+        result.set_result(value)
+
+    def _failed(self, result, shm, error):
+        self._release(shm)
+        with self._lock:
+            self.failed += 1
+            # A crashed worker breaks the whole executor; start a fresh one next time.
+            if isinstance(error, BrokenProcessPool):
+                self._executor = None
+                self.registries.clear()
+        result.set_exception(error)
+
+    def stats(self):
+        with self._lock:
+            in_flight = self.submitted - self.completed - self.failed
+            workers = max(1, self.processes)
+            elapsed = max(1e-9, time.monotonic() - self.started)
+            return {
+                "processes": self.processes,
+                "warmed": self.warmed,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "shared_memory": self.shared,
+                "running": min(in_flight, workers),
+                "queue_depth": max(0, in_flight - workers),
+                "avg_ms": round(self.busy_seconds / max(1, self.completed) * 1000, 2),
+                "utilization": round(min(1.0, self.busy_seconds / (workers * elapsed)), 3),
+                "face_registry": self._registry_stats(),
+            }
+
+    def _registry_stats(self):
+        # Summed over the workers' last reports (called under the lock).
+        idle = {}
+        for stats in self.registries.values():
+            for name , count in stats["idle"].items():
+                idle[name] = idle.get(name, 0) + count
+        return {
+            "workers": len(self.registries),
+            "loads": sum(stats["loads"] for stats in self.registries.values()),
+            "hits": sum(stats["hits"] for stats in self.registries.values()),
+            "idle": idle,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            executor , self._executor = self._executor , None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def default_preprocess_pool():
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = PreprocessPool()
+        return _default_pool
@@ -0,0 +1,276 @@
+import base64
+import json
+import os
+import re
+import threading
+
+from app.utils.metrics import upstream_payload_bytes, upstream_tokens
+
+PROMPT_STYLE = os.getenv("PROMPT_STYLE", "compact")
+# response_format={"type": "json_object"} is supported by Groq's Llama 4 models.
+PROMPT_JSON_OUTPUT = os.getenv("PROMPT_JSON_OUTPUT", "1") == "1"
+# "json_schema" constrains the reply to IDENTIFY_SCHEMA; "json_object" only asks for valid JSON.
+PROMPT_RESPONSE_FORMAT = os.getenv("PROMPT_RESPONSE_FORMAT", "json_schema")
+
+IDENTIFY_MAX_TOKENS = int(os.getenv("IDENTIFY_MAX_TOKENS", "300"))
+GROUP_MAX_TOKENS_PER_FACE = int(os.getenv("GROUP_MAX_TOKENS_PER_FACE", "250"))
+QA_MAX_TOKENS = int(os.getenv("QA_MAX_TOKENS", "300"))
+# Earlier chat turns sent with each question. Off by default: answers that
+# depend on history bypass the answer cache.
+QA_HISTORY_TOKENS = int(os.getenv("QA_HISTORY_TOKENS", "0"))
+
+LEGACY_IDENTIFY_PROMPT = """You are a celebrity recognition expert AI. 
+Identify the person in the image. If known, respond in this format:
+
+- **Full Name**:
+- **Profession**:
+- **Nationality**:
+- **Famous For**:
+- **Top Achievements**:
+
+If unknown, return "Unknown".
+"""
+
+COMPACT_IDENTIFY_PROMPT = """Identify this person. Reply only with JSON:
+{"full_name":"","profession":"","nationality":"","famous_for":"","top_achievements":[],"confidence":0.0}
+Use at most 3 short achievements; confidence is 0-1. If unknown: {"full_name":"Unknown","confidence":0}"""
+
+COMPACT_IDENTIFY_MARKDOWN_PROMPT = """Identify this person. If known, reply exactly:
+- **Full Name**:
+- **Profession**:
+- **Nationality**:
+- **Famous For**:
+- **Top Achievements**: (at most 3 short items)
+If unknown, reply "Unknown"."""
+
+LEGACY_GROUP_PROMPT = """You are a celebrity recognition expert AI.
+You are given {count} face images, numbered 1 to {count} in order.
+For each image write a section starting with "### Face N" and, if the person is known, respond in this format:
+
+- **Full Name**:
+- **Profession**:
+- **Nationality**:
+- **Famous For**:
+- **Top Achievements**:
+
+If a face is unknown, write "Unknown" in its section.
+"""
+
+COMPACT_GROUP_PROMPT = """Identify each of the {count} people, in image order. Reply only with JSON:
+{{"faces":[{{"full_name":"","profession":"","nationality":"","famous_for":"","top_achievements":[],"confidence":0.0}}]}}
+One entry per image, at most 3 short achievements each; confidence is 0-1. Unknown: {{"full_name":"Unknown","confidence":0}}"""
+
+LEGACY_QA_PROMPT = """
+                    You are a AI Assistant that knows a lot about celebrities. You have to answer questions about {name} concisely and accurately.
+                    Question : {question}
+                    """
+
+COMPACT_QA_PROMPT = "Answer briefly (max 3 sentences) about {name}.\nQ: {question}"
+
+COMPACT_QA_CONTEXT_PROMPT = "Answer briefly (max 3 sentences) about {name}, using these facts where relevant:\n{context}\nQ: {question}"
+
+IDENTIFY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "full_name": {"type": "string"},
+        "profession": {"type": "string"},
+        "nationality": {"type": "string"},
+        "famous_for": {"type": "string"},
+        "top_achievements": {"type": "array", "items": {"type": "string"}},
+        "confidence": {"type": "number"},
+    },
+    "required": ["full_name", "confidence"],
+}
+
+GROUP_IDENTIFY_SCHEMA = {
+    "type": "object",
+    "properties": {"faces": {"type": "array", "items": IDENTIFY_SCHEMA}},
+    "required": ["faces"],
+}
+
+
+def response_format(schema, name):
+    if PROMPT_RESPONSE_FORMAT == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema}}
+    return {"type": "json_object"}
+
+
+def count_tokens(text):
+    # Local estimate: ~1 token per word or punctuation mark, plus one per
+    # extra 4 characters in long words. Within ~10% of Llama 3/4 tokenizers on English.
+    tokens = 0
+    for piece in re.findall(r"\w+|[^\w\s]", text):
+        tokens += 1 + max(0, len(piece) - 4) // 4
+    return tokens
+
+
+def count_message_tokens(messages):
+    tokens = 0
+    images = 0
+    for message in messages:
+        tokens += 4
+        content = message["content"]
+        if isinstance(content, str):
+            tokens += count_tokens(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                tokens += count_tokens(part["text"])
+            elif part.get("type") == "image_url":
+                images += 1
+    return tokens, images
+
+
+def payload_size(payload):
+    # Request body size without encoding it again: the fields other than the
+    # messages are small and dumped as-is; message strings are counted by
+    # length (base64 image URLs are ASCII, so that is their encoded size) plus
+    # a fixed allowance for the JSON around each one.
+    size = len(json.dumps({key : value for key , value in payload.items() if key != "messages"}))
+    for message in payload.get("messages", []):
+        size += 32 + len(message.get("role", ""))
+        content = message["content"]
+        if isinstance(content, str):
+            size += len(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                size += 32 + len(part["text"])
+            elif part.get("type") == "image_url":
+                size += 48 + len(part["image_url"]["url"])
+    return size
+
+
+def image_part(image_bytes):
+    encoded_image = base64.b64encode(image_bytes).decode()
+    return {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}}
+
+
+def identify_payload(model, image_bytes, style=None, json_output=None):
+    style = style or PROMPT_STYLE
+    json_output = PROMPT_JSON_OUTPUT if json_output is None else json_output
+
+    if style == "legacy":
+        text , max_tokens , json_output = LEGACY_IDENTIFY_PROMPT , 1024 , False
+    elif json_output:
+        text , max_tokens = COMPACT_IDENTIFY_PROMPT , IDENTIFY_MAX_TOKENS
+    else:
+        text , max_tokens = COMPACT_IDENTIFY_MARKDOWN_PROMPT , IDENTIFY_MAX_TOKENS
+
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": [{"type": "text", "text": text}, image_part(image_bytes)]}],
+        "temperature": 0.3,
+        "max_tokens": max_tokens,
+    }
+    if json_output:
+        payload["response_format"] = response_format(IDENTIFY_SCHEMA, "celebrity")
+    return payload
+
+
+def group_identify_payload(model, images, style=None, json_output=None):
+    style = style or PROMPT_STYLE
+    json_output = PROMPT_JSON_OUTPUT if json_output is None else json_output
+
+    if style == "legacy" or not json_output:
+        text , max_tokens , json_output = LEGACY_GROUP_PROMPT.format(count=len(images)) , 1024 * len(images) , False
+    else:
+        text , max_tokens = COMPACT_GROUP_PROMPT.format(count=len(images)) , GROUP_MAX_TOKENS_PER_FACE * len(images)
+
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": [{"type": "text", "text": text}] + [image_part(i) for i in images]}],
+        "temperature": 0.3,
+        "max_tokens": max_tokens,
+    }
+    if json_output:
+        payload["response_format"] = response_format(GROUP_IDENTIFY_SCHEMA, "celebrities")
+    return payload
+
+
+def trim_history(history, budget=QA_HISTORY_TOKENS):
+    # Keep the most recent turns that fit in the budget, oldest first.
+    kept = []
+    used = 0
+    if budget <= 0:
+        return kept
+    for role , message in reversed(history or []):
+        cost = count_tokens(message) + 4
+        if used + cost > budget:
+            break
+        kept.append({"role": "user" if role == "user" else "assistant", "content": message})
+        used += cost
+    return list(reversed(kept))
+
+
+def qa_payload(model, name, question, facts=None, history=None, style=None):
+    style = style or PROMPT_STYLE
+
+    if style == "legacy":
+        prompt , max_tokens = LEGACY_QA_PROMPT.format(name=name, question=question) , 512
+    elif facts:
+        context = "\n".join(f"- {fact}" for fact in facts)
+        prompt = COMPACT_QA_CONTEXT_PROMPT.format(name=name, context=context, question=question)
+        max_tokens = QA_MAX_TOKENS
+    else:
+        prompt , max_tokens = COMPACT_QA_PROMPT.format(name=name, question=question) , QA_MAX_TOKENS
+
+    return {
+        "model": model,
+        "messages": trim_history(history) + [{"role": "user", "content": prompt}],
+        "temperature": 0.5,
+        "max_tokens": max_tokens,
+    }
+
+
+def parse_json_content(content):
+    # JSON mode sometimes still wraps the object in a ```json fence.
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`")
+        content = content[content.find("{"):]
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class TokenMeter:
+
+    # Per-endpoint totals of the local prompt estimate and the usage the
+    # upstream reports, so the estimate and the budgets can be checked.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, payload, usage=None):
+        estimate , images = count_message_tokens(payload["messages"])
+        usage = usage or {}
+        with self._lock:
+            totals = self.endpoints.setdefault(endpoint, {
+                "requests": 0, "images": 0, "estimated_prompt_tokens": 0,
+                "prompt_tokens": 0, "completion_tokens": 0,
+            })
+            totals["requests"] += 1
+            totals["images"] += images
+            totals["estimated_prompt_tokens"] += estimate
+            totals["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            totals["completion_tokens"] += usage.get("completion_tokens", 0)
+
+        upstream_payload_bytes.observe(payload_size(payload), endpoint=endpoint)
+        upstream_tokens.inc(estimate, endpoint=endpoint, kind="estimated_prompt")
+        upstream_tokens.inc(usage.get("prompt_tokens", 0), endpoint=endpoint, kind="prompt")
+        upstream_tokens.inc(usage.get("completion_tokens", 0), endpoint=endpoint, kind="completion")
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: dict(totals) for endpoint, totals in self.endpoints.items()}
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+
+
+token_meter = TokenMeter()
@@ -0,0 +1,545 @@
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from app.utils.metrics import provider_calls, provider_routes
+from app.utils.upstream_scheduler import BATCH, UpstreamScheduler, default_upstream_scheduler, upstream_priority
+
+GROQ_MODEL = "meta-llama/llama-4-maverick-17b-128e-instruct"
+# JSON list (or a path to one) of OpenAI-compatible chat-completions endpoints:
+#   [{"name": "groq", "url": "...", "model": "...", "api_key_env": "GROQ_API_KEY"},
+#    {"name": "ollama", "url": "http://localhost:11434/v1/chat/completions", "model": "llava",
+#     "vision": true, "response_format": "json_object"}]
+# Optional keys: "api_key", "vision" (accepts images, default true), "response_format"
+# ("json_schema" as built, "json_object" or "none"), "requests_per_minute", "tokens_per_minute".
+# Unset means Groq alone, from GROQ_API_URL and GROQ_API_KEY.
+LLM_PROVIDERS = os.getenv("LLM_PROVIDERS", "")
+PROVIDER_EWMA_ALPHA = float(os.getenv("PROVIDER_EWMA_ALPHA", "0.2"))
+# Each unit of EWMA error rate weighs like this many times the latency.
+PROVIDER_ERROR_PENALTY = float(os.getenv("PROVIDER_ERROR_PENALTY", "4"))
+PROVIDER_MAX_FAILURES = int(os.getenv("PROVIDER_MAX_FAILURES", "3"))
+PROVIDER_COOLDOWN = float(os.getenv("PROVIDER_COOLDOWN", "30"))
+# Fire a second provider once the first has taken its own p95 (clamped to
+# the bounds below); PROVIDER_HEDGE_DELAY until enough latencies are known.
+PROVIDER_HEDGE = os.getenv("PROVIDER_HEDGE", "1") == "1"
+PROVIDER_HEDGE_DELAY = float(os.getenv("PROVIDER_HEDGE_DELAY", "2"))
+PROVIDER_HEDGE_MIN_DELAY = float(os.getenv("PROVIDER_HEDGE_MIN_DELAY", "0.25"))
+PROVIDER_HEDGE_MAX_DELAY = float(os.getenv("PROVIDER_HEDGE_MAX_DELAY", "10"))
+PROVIDER_HEDGE_MIN_SAMPLES = 20
+# Threads running provider calls at once (hedged requests and probes).
+PROVIDER_MAX_CALLS = int(os.getenv("PROVIDER_MAX_CALLS", "256"))
+PROVIDER_LATENCY_WINDOW = 200
+
+# What stale providers are probed with: one token, no user data.
+PROBE_PAYLOAD = {"messages": [{"role": "user", "content": "Reply with OK."}], "max_tokens": 1, "temperature": 0}
+
+_call_slots = threading.BoundedSemaphore(PROVIDER_MAX_CALLS)
+_default_providers = None
+_default_routers = {}
+_default_lock = threading.Lock()
+
+
+class Provider:
+
+    def __init__(self, name, url, model=GROQ_MODEL, api_key=None, vision=True, response_format="json_schema",
+                 scheduler=None):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.vision = vision
+        self.response_format = response_format
+        self.scheduler = scheduler or UpstreamScheduler()
+
+    def headers(self):
+        headers = {"Content-Type" : "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def payload(self, payload):
+        payload = dict(payload, model=self.model)
+        if "response_format" in payload:
+            if self.response_format == "none":
+                del payload["response_format"]
+            elif self.response_format == "json_object":
+                payload["response_format"] = {"type": "json_object"}
+        return payload
+
+
+class ProviderHealth:
+
+    # What one router has seen from one provider.
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.down_until = 0.0
+        self.calls = 0
+        self.updated = 0.0
+        self.probed = 0.0
+        self.recent = deque(maxlen=PROVIDER_LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok):
+        with self._lock:
+            self.calls += 1
+            self.updated = time.monotonic()
+            self.error_rate += PROVIDER_EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+            if ok:
+                self.latency = seconds if self.latency is None else self.latency + PROVIDER_EWMA_ALPHA * (seconds - self.latency)
+                self.recent.append(seconds)
+                self.failures = 0
+            else:
+                self.failures += 1
+                if self.failures >= PROVIDER_MAX_FAILURES:
+                    self.down_until = time.monotonic() + PROVIDER_COOLDOWN
+
+    def stale(self):
+        # Unmeasured, or not heard from for a cooldown.
+        return self.latency is None or time.monotonic() - self.updated > PROVIDER_COOLDOWN
+
+    def record_probe(self, seconds, ok):
+        # A one-token probe shows the provider is up, and only seeds the
+        # latency of one that has none; real calls refine it.
+        with self._lock:
+            self.updated = time.monotonic()
+            if ok:
+                self.failures = 0
+                if self.latency is None:
+                    self.latency = seconds
+            else:
+                self.error_rate += PROVIDER_EWMA_ALPHA * (1.0 - self.error_rate)
+                self.failures += 1
+                if self.failures >= PROVIDER_MAX_FAILURES:
+                    self.down_until = time.monotonic() + PROVIDER_COOLDOWN
+
+    def claim_probe(self):
+        # At most one background probe per cooldown while stale.
+        with self._lock:
+            now = time.monotonic()
+            stale = self.latency is None or now - self.updated > PROVIDER_COOLDOWN
+            if not stale or now - self.probed < PROVIDER_COOLDOWN:
+                return False
+            self.probed = now
+            return True
+
+    def score(self):
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + PROVIDER_ERROR_PENALTY * self.error_rate)
+
+    def down(self):
+        return time.monotonic() < self.down_until
+
+    def p95(self):
+        with self._lock:
+            if len(self.recent) < PROVIDER_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def stats(self):
+        p95 = self.p95()
+        return {
+            "calls": self.calls,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "failures": self.failures,
+            "down": self.down(),
+        }
+
+
+def _has_images(payload):
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list) and any(part.get("type") == "image_url" for part in content):
+            return True
+    return False
+
+
+def _close(response):
+    close = getattr(response, "close", None)
+    if close is not None:
+        close()
+
+
+def _spawn(fn, *args, block=True):
+    # A thread per call, started only once one of PROVIDER_MAX_CALLS slots is
+    # free, so the call runs as soon as it is launched (a hedge delay never
+    # includes queueing) and a stall can't grow threads without bound. With
+    # block=False (hedges, probes) returns None instead of waiting for a slot.
+    # The caller's context (e.g. its upstream priority) comes along.
+    if not _call_slots.acquire(blocking=block):
+        return None
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(context.run(fn, *args))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            _call_slots.release()
+
+    try:
+        threading.Thread(target=run, name="provider-call", daemon=True).start()
+    except BaseException:
+        _call_slots.release()
+        raise
+    return future
+
+
+class ProviderRouter:
+
+    # Sends each call to the provider with the best EWMA latency, weighted by
+    # its error rate. If that call is still running after the provider's p95,
+    # the next provider is tried in parallel and the first 200 wins; errors
+    # fail over down the ranking. Providers that keep failing sit out a
+    # cooldown. Streams fail over but are never hedged.
+    #
+    # Unmeasured and stale providers rank after fresh ones, so user requests
+    # don't go first to a provider nobody has timed lately. Instead, once per
+    # cooldown, they get PROBE_PAYLOAD in the background; its response only
+    # updates their health.
+
+    def __init__(self, providers, operation="default", hedge=PROVIDER_HEDGE):
+        self.providers = list(providers)
+        self.operation = operation
+        self.hedge = hedge
+        self.health = {provider.name: ProviderHealth() for provider in self.providers}
+        self.hedges = 0
+        self.failovers = 0
+        self.probes = 0
+        self._probe_tasks = set()
+        self._lock = threading.Lock()
+
+    def rank(self, payload):
+        providers = self.providers
+        if _has_images(payload):
+            providers = [provider for provider in providers if provider.vision] or providers
+        # Providers in cooldown stay as a last resort.
+        return sorted(providers, key=lambda provider: (
+            self.health[provider.name].down(), self.health[provider.name].stale(), self.health[provider.name].score()))
+
+    def hedge_delay(self, provider):
+        p95 = self.health[provider.name].p95()
+        if p95 is None:
+            return PROVIDER_HEDGE_DELAY
+        return min(PROVIDER_HEDGE_MAX_DELAY, max(PROVIDER_HEDGE_MIN_DELAY, p95))
+
+    def _record(self, provider, start, response=None):
+        ok = response is not None and response.status_code == 200
+        self.health[provider.name].record(time.perf_counter() - start, ok)
+        provider_calls.inc(operation=self.operation, provider=provider.name, outcome="ok" if ok else "error")
+
+    def _count(self, event):
+        with self._lock:
+            if event == "hedge":
+                self.hedges += 1
+            elif event == "probe":
+                self.probes += 1
+            else:
+                self.failovers += 1
+        provider_routes.inc(operation=self.operation, event=event)
+
+    def _call(self, http, provider, payload, kwargs):
+        start = time.perf_counter()
+        try:
+            response = provider.scheduler.post(http, provider.url, headers=provider.headers(),
+                                               json=provider.payload(payload), **kwargs)
+        except Exception:
+            self._record(provider, start)
+            raise
+        self._record(provider, start, response)
+        return response
+
+    async def _call_async(self, client, provider, payload, kwargs):
+        start = time.perf_counter()
+        try:
+            response = await provider.scheduler.post_async(client, provider.url, headers=provider.headers(),
+                                                           json=provider.payload(payload), **kwargs)
+        except Exception:
+            self._record(provider, start)
+            raise
+        self._record(provider, start, response)
+        return response
+
+    def _to_probe(self, candidates):
+        # The first candidate is getting the request anyway.
+        probes = [provider for provider in candidates[1:]
+                  if not self.health[provider.name].down() and self.health[provider.name].claim_probe()]
+        for _ in probes:
+            self._count("probe")
+        return probes
+
+    def _record_probe(self, provider, start, response=None):
+        ok = response is not None and response.status_code == 200
+        self.health[provider.name].record_probe(time.perf_counter() - start, ok)
+
+    def _probe(self, http, provider):
+        start = time.perf_counter()
+        try:
+            with upstream_priority(BATCH):
+                response = provider.scheduler.post(http, provider.url, headers=provider.headers(),
+                                                   json=provider.payload(PROBE_PAYLOAD))
+        except Exception:
+            self._record_probe(provider, start)
+            return
+        self._record_probe(provider, start, response)
+        _close(response)
+
+    async def _probe_async(self, client, provider):
+        start = time.perf_counter()
+        try:
+            with upstream_priority(BATCH):
+                response = await provider.scheduler.post_async(client, provider.url, headers=provider.headers(),
+                                                               json=provider.payload(PROBE_PAYLOAD))
+        except Exception:
+            self._record_probe(provider, start)
+            return
+        self._record_probe(provider, start, response)
+
+    def _start_probes(self, http, candidates):
+        for provider in self._to_probe(candidates):
+            _spawn(self._probe, http, provider, block=False)
+
+    def _start_probes_async(self, client, candidates):
+        for provider in self._to_probe(candidates):
+            task = asyncio.ensure_future(self._probe_async(client, provider))
+            self._probe_tasks.add(task)
+            task.add_done_callback(self._probe_tasks.discard)
+
+    def post(self, http, payload, **kwargs):
+        candidates = self.rank(payload)
+        self._start_probes(http, candidates)
+        if kwargs.get("stream") or not self.hedge or len(candidates) < 2:
+            return self._failover(http, candidates, payload, kwargs)
+        return self._hedged(http, candidates, payload, kwargs)
+
+    def _failover(self, http, candidates, payload, kwargs):
+        response = error = None
+        for i , provider in enumerate(candidates):
+            if i:
+                self._count("failover")
+            if response is not None:
+                _close(response)
+            try:
+                response = self._call(http, provider, payload, kwargs)
+            except Exception as e:
+                response , error = None , e
+                continue
+            if response.status_code == 200:
+                return response
+
+        if response is not None:
+            return response
+        raise error
+
+    def _hedged(self, http, candidates, payload, kwargs):
+        queue = list(candidates)
+        pending = {}
+        deadline = None
+        response = error = None
+
+        hedging = True
+
+        def launch(hedge=False):
+            # Hedges are skipped rather than waiting when every call slot is taken.
+            nonlocal deadline
+            future = _spawn(self._call, http, queue[0], payload, kwargs, block=not hedge)
+            if future is None:
+                return False
+            provider = queue.pop(0)
+            deadline = time.monotonic() + self.hedge_delay(provider)
+            pending[future] = provider
+            return True
+
+        launch()
+        while pending:
+            # At most one hedge in the air at a time.
+            hedge_due = hedging and queue and len(pending) == 1
+            done , _ = wait(pending, timeout=max(0.0, deadline - time.monotonic()) if hedge_due else None,
+                            return_when=FIRST_COMPLETED)
+            if not done:
+                if launch(hedge=True):
+                    self._count("hedge")
+                else:
+                    hedging = False
+                continue
+
+            for future in done:
+                del pending[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    result = None
+
+                if result is not None and result.status_code == 200:
+                    # The loser's response is dropped whenever it arrives.
+                    for other in pending:
+                        other.add_done_callback(lambda f: f.exception() is None and _close(f.result()))
+                    if response is not None:
+                        _close(response)
+                    return result
+
+                if result is not None:
+                    if response is not None:
+                        _close(response)
+                    response = result
+
+            if not pending and queue:
+                self._count("failover")
+                launch()
+
+        if response is not None:
+            return response
+        raise error
+
+    async def post_async(self, client, payload, **kwargs):
+        candidates = self.rank(payload)
+        self._start_probes_async(client, candidates)
+        hedge = self.hedge and len(candidates) > 1
+        queue = list(candidates)
+        pending = {}
+        deadline = None
+        response = error = None
+
+        def launch():
+            nonlocal deadline
+            provider = queue.pop(0)
+            deadline = time.monotonic() + self.hedge_delay(provider)
+            pending[asyncio.ensure_future(self._call_async(client, provider, payload, kwargs))] = provider
+
+        launch()
+        try:
+            while pending:
+                hedge_due = hedge and queue and len(pending) == 1
+                done , _ = await asyncio.wait(pending, timeout=max(0.0, deadline - time.monotonic()) if hedge_due else None,
+                                              return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self._count("hedge")
+                    launch()
+                    continue
+
+                for task in done:
+                    del pending[task]
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        error = e
+                        result = None
+
+                    if result is not None and result.status_code == 200:
+                        return result
+
+                    if result is not None:
+                        response = result
+
+                if not pending and queue:
+                    self._count("failover")
+                    launch()
+        finally:
+            # Losing hedges are cancelled; the scheduler releases their slots.
+            for task in pending:
+                task.cancel()
+
+        if response is not None:
+            return response
+        raise error
+
+    @asynccontextmanager
+    async def stream_async(self, client, payload):
+        candidates = self.rank(payload)
+        self._start_probes_async(client, candidates)
+
+        for i , provider in enumerate(candidates):
+            last = i == len(candidates) - 1
+            if i:
+                self._count("failover")
+            start = time.perf_counter()
+
+            async with AsyncExitStack() as stack:
+                try:
+                    response = await stack.enter_async_context(provider.scheduler.stream_async(
+                        client, "POST", provider.url, headers=provider.headers(), json=provider.payload(payload)))
+                except Exception:
+                    self._record(provider, start)
+                    if last:
+                        raise
+                    continue
+
+                self._record(provider, start, response)
+                if response.status_code != 200 and not last:
+                    continue
+                yield response
+                return
+
+    def stats(self):
+        return {
+            "operation": self.operation,
+            "hedges": self.hedges,
+            "failovers": self.failovers,
+            "probes": self.probes,
+            "providers": {
+                provider.name: dict(self.health[provider.name].stats(), scheduler=provider.scheduler.stats())
+                for provider in self.providers
+            },
+        }
+
+
+def load_providers(value=LLM_PROVIDERS):
+    if not value:
+        return [Provider("groq", os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions"),
+                         GROQ_MODEL, os.getenv("GROQ_API_KEY"), scheduler=default_upstream_scheduler())]
+
+    if not value.lstrip().startswith("["):
+        with open(value) as f:
+            value = f.read()
+
+    providers = []
+    for i , config in enumerate(json.loads(value)):
+        api_key = config.get("api_key")
+        if config.get("api_key_env"):
+            api_key = os.getenv(config["api_key_env"])
+        # Each endpoint has its own rate limits, learnt from its headers.
+        limits = (config.get("requests_per_minute", 0), config.get("tokens_per_minute", 0))
+        providers.append(Provider(
+            config.get("name") or f"provider-{i}",
+            config["url"],
+            config.get("model", GROQ_MODEL),
+            api_key,
+            config.get("vision", True),
+            config.get("response_format", "json_schema"),
+            UpstreamScheduler(*limits),
+        ))
+    return providers
+
+
+def default_providers():
+    global _default_providers
+    with _default_lock:
+        if _default_providers is None:
+            _default_providers = load_providers()
+        return _default_providers
+
+
+def default_provider_router(operation):
+    # One router per operation, since identify and QA latencies aren't comparable.
+    providers = default_providers()
+    with _default_lock:
+        router = _default_routers.get(operation)
+        if router is None:
+            router = _default_routers[operation] = ProviderRouter(providers, operation)
+        return router
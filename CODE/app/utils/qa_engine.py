@@ -1,37 +1,195 @@
-import os
+import json
 import requests
+import time
+
+from app.utils.answer_cache import default_answer_cache, normalize_question
+from app.utils.http_client import default_http_client
+from app.utils.knowledge_pack import KNOWLEDGE_MIN_SCORE, default_knowledge_pack
+from app.utils.metrics import record_response, results_total, stage_seconds, stage_timer
+from app.utils.providers import GROQ_MODEL, default_provider_router
+from app.utils.prompts import QA_HISTORY_TOKENS, qa_payload, token_meter
+from app.utils.single_flight import answer_flights
+
+
+class AnswerStreamError(RuntimeError):
+
+    # A streamed answer that failed, raised rather than yielded so it never
+    # reaches the cache, single-flight followers or the client as answer text.
+
+    def __init__(self, message="Sorry I couldn't find the answer"):
+        super().__init__(message)
+
 
 class QAEngine:
 
-    def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY")
-        self.api_url = "https://api.groq.com/openai/v1/chat/completions"
-        self.model  = "meta-llama/llama-4-maverick-17b-128e-instruct"
-
-    def ask_about_celebrity(self,name,question):
-        headers = {
-            "Authorization" : f"Bearer {self.api_key}",
-            "Content-Type" : "application/json"
-        }
-
-        prompt = f"""
-                    You are a AI Assistant that knows a lot about celebrities. You have to answer questions about {name} concisely and accurately.
-                    Question : {question}
-                    """
-        
-        payload  = {
-            "model" : self.model,
-            "messages" : [{"role" : "user" , "content" : prompt}],
-            "temperature" :  0.5,
-            "max_tokens" : 512
-        }
+    def __init__(self, http=None, cache=None, flights=None, knowledge=None, router=None):
+        self.model  = GROQ_MODEL
+        self.http = http or default_http_client()
+        self.cache = cache if cache is not None else default_answer_cache()
+        self.flights = flights or answer_flights
+        self.knowledge = knowledge if knowledge is not None else default_knowledge_pack()
+        self.router = router or default_provider_router("qa")
+
+    def _retrieve(self,name,question):
+        if self.knowledge is None:
+            return []
+        return [chunk for score , chunk in self.knowledge.retrieve(name,question) if score >= KNOWLEDGE_MIN_SCORE]
+
+    def answer_locally(self,name,question):
+        if self.knowledge is None:
+            return None
+        return self.knowledge.answer_field(name,question)
+
+    def _build_payload(self,name,question,history=None):
+        with stage_timer("qa" , "knowledge"):
+            chunks = self._retrieve(name,question)
+        with stage_timer("qa" , "build_payload"):
+            return qa_payload(self.model , name , question , chunks , history)
+
+    def _flight_key(self,name,question):
+        return (name.strip().lower() , normalize_question(question))
+
+    def ask_about_celebrity(self,name,question,history=None):
+        # Follow-ups that depend on earlier turns can't share cached answers.
+        if history and QA_HISTORY_TOKENS > 0:
+            return self._ask_remote(name,question,history)
+
+        with stage_timer("qa" , "cache"):
+            cached = self.cache.get(name,question)
+        if cached is not None:
+            results_total.inc(operation="qa" , source="cache")
+            return cached
+
+        with stage_timer("qa" , "local_answer"):
+            local = self.answer_locally(name,question)
+        if local is not None:
+            results_total.inc(operation="qa" , source="local")
+            return local
 
-        response = requests.post(self.api_url , headers=headers , json=payload)
+        return self.flights.do(self._flight_key(name,question) , self._ask_uncached , name , question)
 
+    def _ask_uncached(self,name,question):
+        cached = self.cache.get(name,question)
+        if cached is not None:
+            return cached
+
+        return self._ask_remote(name,question)
+
+    def _ask_remote(self,name,question,history=None):
+        payload = self._build_payload(name,question,history)
+
+        try:
+            with stage_timer("qa" , "upstream"):
+                response = self.router.post(self.http , payload)
+        except requests.RequestException:
+            record_response("qa")
+            results_total.inc(operation="qa" , source="error")
+            return "Sorry I couldn't find the answer"
+
+        record_response("qa" , response)
         if response.status_code==200:
-            return response.json()['choices'][0]['message']['content']
+            data = response.json()
+            token_meter.record("qa" , payload , data.get("usage"))
+            answer = data['choices'][0]['message']['content']
+            results_total.inc(operation="qa" , source="remote")
+            if not history:
+                self.cache.set(name,question,answer)
+            return answer
         
+        results_total.inc(operation="qa" , source="error")
         return "Sorry I couldn't find the answer"
 
+    def stream_answer(self,name,question,history=None):
+        if history and QA_HISTORY_TOKENS > 0:
+            yield from self._stream_uncached(name,question,history)
+            return
+
+        with stage_timer("qa_stream" , "cache"):
+            cached = self.cache.get(name,question)
+        if cached is not None:
+            results_total.inc(operation="qa_stream" , source="cache")
+            yield cached
+            return
+
+        with stage_timer("qa_stream" , "local_answer"):
+            local = self.answer_locally(name,question)
+        if local is not None:
+            results_total.inc(operation="qa_stream" , source="local")
+            yield local
+            return
+
+        # Followers of an in-flight answer (streamed or not) get it in one piece.
+        key = self._flight_key(name,question)
+        future , leader = self.flights.join(key)
+        if not leader:
+            try:
+                yield future.result()
+            except AnswerStreamError:
+                raise
+            except Exception as e:
+                raise AnswerStreamError() from e
+            return
+
+        chunks = []
+        try:
+            for chunk in self._stream_uncached(name,question):
+                chunks.append(chunk)
+                yield chunk
+        except BaseException as e:
+            # Failed, or the client went away: followers get the error, not a partial answer.
+            self.flights.finish(key , future , error=e if isinstance(e , AnswerStreamError) else AnswerStreamError())
+            raise
+        self.flights.finish(key , future , "".join(chunks))
+
+    def _stream_uncached(self,name,question,history=None):
+        # OpenAI-compatible SSE: "data: {json}" lines, terminated by "data: [DONE]".
+        # Any failure, before or after the first chunk, raises AnswerStreamError.
+        payload = self._build_payload(name,question,history)
+        payload["stream"] = True
+        token_meter.record("qa_stream" , payload)
+
+        start = time.perf_counter()
+        try:
+            response = self.router.post(self.http , payload , stream=True)
+        except requests.RequestException as e:
+            record_response("qa_stream")
+            results_total.inc(operation="qa_stream" , source="error")
+            raise AnswerStreamError() from e
+
+        record_response("qa_stream" , response)
+        with response:
+            if response.status_code!=200:
+                results_total.inc(operation="qa_stream" , source="error")
+                raise AnswerStreamError()
+
+            chunks = []
+            done = False
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        done = True
+                        break
+
+                    choices = json.loads(data).get("choices") or [{}]
+                    chunk = choices[0].get("delta" , {}).get("content")
+                    if chunk:
+                        if not chunks:
+                            stage_seconds.observe(time.perf_counter() - start , operation="qa_stream" , stage="first_token")
+                        chunks.append(chunk)
+                        yield chunk
+            except (requests.RequestException , ValueError) as e:
+                results_total.inc(operation="qa_stream" , source="error")
+                raise AnswerStreamError() from e
 
+            if not done or not chunks:
+                results_total.inc(operation="qa_stream" , source="error")
+                raise AnswerStreamError()
 
+            results_total.inc(operation="qa_stream" , source="remote")
+            # Only complete, non-empty answers are cached.
+            if not history:
+                self.cache.set(name,question,"".join(chunks))
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import re
+import secrets
+import threading
+import time
+
+from app.utils.cache import LRUCache
+
+# A directory for results, needed whenever more than one process may get the
+# follow-up request (gunicorn.conf.py sets one for its workers). Unset, results
+# stay in this process's memory.
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", "")
+RESULT_STORE_SIZE = int(os.getenv("RESULT_STORE_SIZE", "1024"))
+RESULT_TTL = int(os.getenv("RESULT_TTL", "3600"))
+# How often put() sweeps expired results out of a FileResultStore.
+RESULT_PURGE_INTERVAL = int(os.getenv("RESULT_PURGE_INTERVAL", "300"))
+
+RESULT_ID = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def new_result_id():
+    return secrets.token_urlsafe(16)
+
+
+def make_result(image_bytes, player_info, player_name, faces=None):
+    return {
+        "image": image_bytes,
+        "etag": hashlib.sha256(image_bytes).hexdigest()[:32],
+        "player_info": player_info,
+        "player_name": player_name,
+        "faces": faces or [],
+    }
+
+
+def _write_private(path, data):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+
+
+class MemoryResultStore:
+
+    def __init__(self, maxsize=RESULT_STORE_SIZE, ttl=RESULT_TTL):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def put(self, result):
+        result_id = new_result_id()
+        self._cache.set(result_id, result)
+        return result_id
+
+    def get(self, result_id):
+        if not result_id or not RESULT_ID.match(result_id):
+            return None
+        return self._cache.get(result_id)
+
+
+class FileResultStore:
+
+    # One <id>.jpg + <id>.json pair per result, so every worker using the
+    # directory can serve any result; pods share results only if it is on a
+    # volume they all mount. Uploaded photos are private to the server's user:
+    # the directory is 0700 and the files 0600.
+
+    def __init__(self, path, ttl=RESULT_TTL, purge_interval=RESULT_PURGE_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        if os.stat(path).st_uid != os.getuid():
+            raise PermissionError(f"{path} belongs to another user")
+        os.chmod(path, 0o700)
+
+    def _paths(self, result_id):
+        return os.path.join(self.path, f"{result_id}.jpg"), os.path.join(self.path, f"{result_id}.json")
+
+    def put(self, result):
+        self._maybe_purge()
+
+        result_id = new_result_id()
+        image_path, meta_path = self._paths(result_id)
+
+        _write_private(image_path, result["image"])
+
+        meta = {k: v for k, v in result.items() if k != "image"}
+        tmp_path = meta_path + ".tmp"
+        _write_private(tmp_path, json.dumps(meta).encode())
+        os.replace(tmp_path, meta_path)
+
+        return result_id
+
+    def get(self, result_id):
+        if not result_id or not RESULT_ID.match(result_id):
+            return None
+
+        image_path, meta_path = self._paths(result_id)
+        try:
+            if time.time() - os.path.getmtime(meta_path) > self.ttl:
+                self._remove(result_id)
+                return None
+
+            with open(meta_path) as f:
+                result = json.load(f)
+            with open(image_path, "rb") as f:
+                result["image"] = f.read()
+        except FileNotFoundError:
+            return None
+
+        return result
+
+    def _remove(self, result_id):
+        for path in self._paths(result_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _maybe_purge(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+        self.purge_expired()
+
+    def purge_expired(self):
+        # Results nobody asked for again are otherwise never deleted. Every
+        # file past the TTL goes, including halves of interrupted puts; other
+        # workers may be sweeping the same directory.
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += name.endswith(".json")
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+def default_result_store():
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = FileResultStore(RESULT_STORE_PATH) if RESULT_STORE_PATH else MemoryResultStore()
+        return _default_store
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+
+    # Concurrent calls with the same key share one execution: the first
+    # caller runs it, everyone else waits on the leader's future.
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+
+            future = self._calls[key] = Future()
+            self.leaders += 1
+            return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, *args, **kwargs):
+        future, leader = self.join(key)
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+
+        self.finish(key, future, result)
+        return result
+
+    def stats(self):
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def join(self, key):
+        # For leaders that produce their result piecemeal (streams); must be
+        # called on the event loop.
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return future, False
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self.leaders += 1
+        return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+        if error is not None:
+            future.set_exception(error)
+            # Followers re-raise it; don't log it as unretrieved when there are none.
+            future.exception()
+        else:
+            future.set_result(result)
+
+    async def do(self, key, fn, *args, **kwargs):
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            # shield: a cancelled follower must not cancel the leader's call.
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(fn(*args, **kwargs))
+        self._calls[key] = task
+        self.leaders += 1
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+identify_flights = SingleFlight()
+answer_flights = SingleFlight()
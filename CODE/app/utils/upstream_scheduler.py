@@ -0,0 +1,330 @@
+import asyncio
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+
+from app.utils.metrics import upstream_queue_seconds
+from app.utils.prompts import count_message_tokens
+
+# Starting limits before Groq's rate-limit headers have been seen; 0 lets
+# requests through until the first response says otherwise.
+GROQ_REQUESTS_PER_MINUTE = int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "0"))
+GROQ_TOKENS_PER_MINUTE = int(os.getenv("GROQ_TOKENS_PER_MINUTE", "0"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "4"))
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "1"))
+# A 429 asking us to wait longer than this is returned instead of retried.
+UPSTREAM_MAX_WAIT = float(os.getenv("UPSTREAM_MAX_WAIT", "60"))
+# Rough prompt cost of one image, for budgeting before the response arrives.
+UPSTREAM_IMAGE_TOKENS = int(os.getenv("UPSTREAM_IMAGE_TOKENS", "600"))
+UPSTREAM_POLL = 0.05
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+_priority = ContextVar("upstream_priority", default=INTERACTIVE)
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+@contextmanager
+def upstream_priority(priority):
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def parse_duration(value):
+    # Groq resets look like "7.66s", "2m59.56s" or "120ms".
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number , unit in parts)
+
+
+def retry_after(headers):
+    value = headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    # Without Retry-After, wait for whichever limit resets last.
+    resets = [parse_duration(headers.get(f"x-ratelimit-reset-{kind}")) for kind in ("requests", "tokens")]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+
+def request_cost(payload):
+    if not payload:
+        return 0
+    tokens , images = count_message_tokens(payload.get("messages", []))
+    return tokens + images * UPSTREAM_IMAGE_TOKENS + payload.get("max_tokens", 0)
+
+
+def _int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+
+    # A capacity of 0 means the limit isn't known yet and nothing is held back.
+
+    def __init__(self, capacity=0, rate=0.0):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost, now):
+        self._refill(now)
+        if not self.capacity:
+            return 0.0
+        missing = min(cost, self.capacity) - self.level
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else 1.0
+
+    def take(self, cost, now):
+        self._refill(now)
+        if self.capacity:
+            self.level -= min(cost, self.capacity)
+
+    def update(self, limit, remaining, reset, in_flight, now):
+        # The server's count doesn't include calls still on their way to it.
+        if reset and limit > remaining:
+            self.rate = (limit - remaining) / reset
+        elif not self.rate:
+            self.rate = limit / 60
+        self.capacity = limit
+        self.level = float(remaining - in_flight)
+        self.updated = now
+
+    def stats(self):
+        return {"capacity": self.capacity, "level": round(self.level, 1), "rate": round(self.rate, 3)}
+
+
+class UpstreamScheduler:
+
+    # Shared gate in front of every Groq call. Requests and tokens are metered
+    # with token buckets that follow the x-ratelimit-* headers, callers wait in
+    # a priority queue (interactive before batch, FIFO within a priority), and
+    # a 429 pauses everyone until Retry-After instead of letting each caller
+    # burn its own retries.
+
+    def __init__(self, requests_per_minute=GROQ_REQUESTS_PER_MINUTE, tokens_per_minute=GROQ_TOKENS_PER_MINUTE,
+                 max_retries=UPSTREAM_MAX_RETRIES, backoff=UPSTREAM_BACKOFF, max_wait=UPSTREAM_MAX_WAIT):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self.in_flight_tokens = 0
+        self.dispatched = 0
+        self.rate_limited = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _enqueue(self, priority, seq):
+        ticket = (priority, next(self._seq) if seq is None else seq)
+        heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _leave(self, ticket):
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+        self._cond.notify_all()
+
+    def _try(self, ticket, cost, now):
+        # 0 once the ticket is dispatched, else seconds to wait (None: others are ahead).
+        if self._queue[0] != ticket:
+            return None
+        delay = max(self.paused_until - now, self.requests.delay(1, now), self.tokens.delay(cost, now))
+        if delay > 0:
+            return delay
+
+        heapq.heappop(self._queue)
+        self.requests.take(1, now)
+        self.tokens.take(cost, now)
+        self.in_flight += 1
+        self.in_flight_tokens += cost
+        self.dispatched += 1
+        self._cond.notify_all()
+        return 0
+
+    def acquire(self, cost, priority=None, seq=None):
+        priority = _priority.get() if priority is None else priority
+        start = time.perf_counter()
+
+        with self._cond:
+            ticket = self._enqueue(priority, seq)
+            try:
+                while True:
+                    delay = self._try(ticket, cost, time.monotonic())
+                    if delay == 0:
+                        break
+                    self._cond.wait(delay)
+            except BaseException:
+                self._leave(ticket)
+                raise
+
+        upstream_queue_seconds.observe(time.perf_counter() - start, priority=PRIORITY_NAMES.get(priority, priority))
+        return ticket[1]
+
+    async def acquire_async(self, cost, priority=None, seq=None):
+        priority = _priority.get() if priority is None else priority
+        start = time.perf_counter()
+
+        with self._cond:
+            ticket = self._enqueue(priority, seq)
+        try:
+            while True:
+                with self._cond:
+                    delay = self._try(ticket, cost, time.monotonic())
+                if delay == 0:
+                    break
+                await asyncio.sleep(UPSTREAM_POLL if delay is None else min(delay, 1.0))
+        except BaseException:
+            with self._cond:
+                self._leave(ticket)
+            raise
+
+        upstream_queue_seconds.observe(time.perf_counter() - start, priority=PRIORITY_NAMES.get(priority, priority))
+        return ticket[1]
+
+    def release(self, cost, response=None, attempt=0):
+        # True when the call was rate limited and is worth retrying.
+        now = time.monotonic()
+        retry = False
+
+        with self._cond:
+            self.in_flight -= 1
+            self.in_flight_tokens -= cost
+
+            if response is not None:
+                self._update(response.headers, now)
+
+                if response.status_code == 429:
+                    self.rate_limited += 1
+                    delay = retry_after(response.headers)
+                    if delay is None:
+                        delay = self.backoff * (2 ** attempt)
+                    self.paused_until = max(self.paused_until, now + delay)
+                    retry = delay <= self.max_wait and attempt < self.max_retries
+
+            self._cond.notify_all()
+        return retry
+
+    def _update(self, headers, now):
+        for bucket , kind , in_flight in ((self.requests, "requests", self.in_flight),
+                                          (self.tokens, "tokens", self.in_flight_tokens)):
+            limit = _int(headers.get(f"x-ratelimit-limit-{kind}"))
+            remaining = _int(headers.get(f"x-ratelimit-remaining-{kind}"))
+            if limit and remaining is not None:
+                bucket.update(limit, remaining, parse_duration(headers.get(f"x-ratelimit-reset-{kind}")), in_flight, now)
+
+    def post(self, http, url, **kwargs):
+        cost = request_cost(kwargs.get("json"))
+        seq = None
+
+        for attempt in range(self.max_retries + 1):
+            # Retries keep their place in the queue.
+            seq = self.acquire(cost, seq=seq)
+            try:
+                response = http.post(url, **kwargs)
+            except BaseException:
+                self.release(cost)
+                raise
+
+            if not self.release(cost, response, attempt):
+                return response
+            response.close()
+
+    async def post_async(self, client, url, **kwargs):
+        cost = request_cost(kwargs.get("json"))
+        seq = None
+
+        for attempt in range(self.max_retries + 1):
+            seq = await self.acquire_async(cost, seq=seq)
+            try:
+                response = await client.post(url, **kwargs)
+            except BaseException:
+                self.release(cost)
+                raise
+
+            if not self.release(cost, response, attempt):
+                return response
+            await response.aclose()
+
+    @asynccontextmanager
+    async def stream_async(self, client, method, url, **kwargs):
+        cost = request_cost(kwargs.get("json"))
+        seq = None
+
+        for attempt in range(self.max_retries + 1):
+            seq = await self.acquire_async(cost, seq=seq)
+            released = False
+            try:
+                async with client.stream(method, url, **kwargs) as response:
+                    released = True
+                    if self.release(cost, response, attempt):
+                        continue
+                    yield response
+                    return
+            finally:
+                if not released:
+                    self.release(cost)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "queued_batch": sum(1 for priority , _ in self._queue if priority == BATCH),
+                "in_flight": self.in_flight,
+                "dispatched": self.dispatched,
+                "rate_limited": self.rate_limited,
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 3),
+                "requests": self.requests.stats(),
+                "tokens": self.tokens.stats(),
+            }
+
+
+def default_upstream_scheduler():
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = UpstreamScheduler()
+        return _default_scheduler
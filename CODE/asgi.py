@@ -0,0 +1,9 @@
+from app import create_asgi_app
+from dotenv import load_dotenv
+
+load_dotenv()
+app = create_asgi_app()
+
+if __name__=="__main__":
+    import uvicorn
+    uvicorn.run("asgi:app" , host="0.0.0.0" , port=5000)
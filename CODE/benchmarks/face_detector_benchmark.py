@@ -0,0 +1,80 @@
+import argparse
+import statistics
+import time
+
+from app.utils.image_handler import (DETECT_MAX_EDGE, FACE_DETECTOR_CONFIG, FACE_DETECTOR_MODEL, HaarDetector,
+                                     LBPDetector, SSDDetector, YuNetDetector, decode_image, detect_faces)
+from build_face_index import DATASET_DIR, iter_dataset
+
+# Run from CODE/:  python -m benchmarks.face_detector_benchmark --per-identity 10
+# Every dataset image shows a celebrity, so recall is the share of images
+# with at least one detection; faces/img above 1 hints at false positives.
+
+CONFIGS = {
+    "haar": lambda args: HaarDetector(),
+    "haar-fast": lambda args: HaarDetector(scale_factor=1.2, min_neighbors=4, min_size=40),
+    "haar-profile": lambda args: HaarDetector(profile=True),
+    "lbp": lambda args: LBPDetector(args.lbp_model),
+    "yunet": lambda args: YuNetDetector(args.yunet_model),
+    "ssd": lambda args: SSDDetector(args.ssd_model, args.ssd_config),
+}
+
+
+def load_images(dataset_dir, per_identity):
+    images = []
+    for _, path in iter_dataset(dataset_dir, per_identity):
+        with open(path, "rb") as f:
+            img, _ = decode_image(f.read())
+        if img is not None:
+            images.append(img)
+    return images
+
+
+def run_detector(detector, images, max_edge):
+    detector.warm()
+    latencies = []
+    found = 0
+    faces = 0
+
+    for img in images:
+        start = time.perf_counter()
+        boxes = detect_faces(img, max_edge, detector)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found += bool(boxes)
+        faces += len(boxes)
+
+    latencies.sort()
+    return {
+        "recall": found / max(1, len(images)),
+        "faces_per_image": faces / max(1, len(images)),
+        "throughput": len(images) / (sum(latencies) / 1000),
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Speed/recall benchmark for the face detector backends")
+    parser.add_argument("--dataset", default=DATASET_DIR)
+    parser.add_argument("--per-identity", type=int, default=10)
+    parser.add_argument("--max-edge", type=int, default=DETECT_MAX_EDGE)
+    parser.add_argument("--detectors", nargs="+", default=list(CONFIGS))
+    parser.add_argument("--lbp-model", default="", help="path to lbpcascade_frontalface_improved.xml")
+    parser.add_argument("--yunet-model", default=FACE_DETECTOR_MODEL, help="path to face_detection_yunet_*.onnx")
+    parser.add_argument("--ssd-model", default=FACE_DETECTOR_MODEL)
+    parser.add_argument("--ssd-config", default=FACE_DETECTOR_CONFIG)
+    args = parser.parse_args()
+
+    images = load_images(args.dataset, args.per_identity)
+    print(f"images={len(images)} max_edge={args.max_edge}")
+
+    for name in args.detectors:
+        try:
+            detector = CONFIGS[name](args)
+            stats = run_detector(detector, images, args.max_edge)
+        except RuntimeError as e:
+            print(f"{name:<14} skipped: {e}")
+            continue
+
+        print(f"{name:<14} recall={stats['recall']:6.3f}  faces/img={stats['faces_per_image']:5.2f}  "
+              f"throughput={stats['throughput']:7.1f} img/s  p50={stats['p50']:7.1f} ms  p95={stats['p95']:7.1f} ms")
@@ -0,0 +1,85 @@
+import argparse
+import time
+
+import numpy as np
+
+from app.utils.face_embedder import build_embedder
+from app.utils.face_index import FlatFaceIndex, IVFFaceIndex, load_index
+from build_face_index import DATASET_DIR, embed_dataset
+
+# Run from CODE/:  python -m benchmarks.face_index_benchmark --per-identity 40
+
+
+def split_holdout(embeddings, label_ids, every):
+    queries = np.arange(len(label_ids)) % every == 0
+    return (embeddings[~queries], label_ids[~queries]), (embeddings[queries], label_ids[queries])
+
+
+def add_distractors(index, count, dim, seed=0):
+    # Random unit vectors under fake identities, to see how latency scales
+    # once the gallery is much larger than the bundled dataset.
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    for start in range(0, count, 100):
+        index.add(f"distractor-{start // 100}", vectors[start:start + 100])
+
+
+def run_queries(index, queries, **kwargs):
+    results = []
+    start = time.perf_counter()
+    for vector in queries:
+        results.append(index.search(vector, k=1, **kwargs)[0][0])
+    elapsed = time.perf_counter() - start
+    return results, elapsed / max(1, len(queries)) * 1000
+
+
+def report(name, predicted, truth, exact, latency_ms):
+    accuracy = np.mean([p == t for p, t in zip(predicted, truth)])
+    recall = np.mean([p == e for p, e in zip(predicted, exact)])
+    print(f"{name:<22} top1={accuracy:6.3f}  recall@1_vs_flat={recall:6.3f}  latency={latency_ms:8.3f} ms/query")
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark for the face index")
+    parser.add_argument("--dataset", default=DATASET_DIR)
+    parser.add_argument("--index-path", default="", help="reuse the embeddings of a built index instead of re-embedding")
+    parser.add_argument("--embedder", default="")
+    parser.add_argument("--per-identity", type=int, default=40)
+    parser.add_argument("--holdout-every", type=int, default=10)
+    parser.add_argument("--distractors", type=int, default=0)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    if args.index_path:
+        source = load_index(args.index_path, mmap=False)
+        if isinstance(source, IVFFaceIndex):
+            source.compact()
+        embeddings, label_ids, labels = np.asarray(source.embeddings), np.asarray(source.label_ids), source.labels
+        embedder_name = source.embedder
+    else:
+        embedder = build_embedder(args.embedder) if args.embedder else build_embedder()
+        embeddings, label_ids, labels = embed_dataset(args.dataset, embedder, args.per_identity)
+        embedder_name = embedder.name
+
+    (gallery, gallery_ids), (queries, query_ids) = split_holdout(embeddings, label_ids, args.holdout_every)
+    truth = [labels[i] for i in query_ids]
+
+    flat = FlatFaceIndex(gallery, gallery_ids, labels, embedder_name)
+    if args.distractors:
+        add_distractors(flat, args.distractors, gallery.shape[1])
+
+    start = time.perf_counter()
+    ivf = IVFFaceIndex.build(flat.embeddings, flat.label_ids, flat.labels, embedder_name, nlist=args.nlist)
+    build_seconds = time.perf_counter() - start
+
+    print(f"gallery={len(flat)} queries={len(queries)} identities={len(labels)} "
+          f"embedder={embedder_name} nlist={len(ivf.centroids)} ivf_build={build_seconds:.2f}s")
+
+    exact, latency = run_queries(flat, queries)
+    report("flat", exact, truth, exact, latency)
+
+    for nprobe in args.nprobe:
+        predicted, latency = run_queries(ivf, queries, nprobe=nprobe)
+        report(f"ivf nprobe={nprobe}", predicted, truth, exact, latency)
@@ -0,0 +1,285 @@
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.utils.prompts import count_message_tokens, count_tokens
+
+# Run from CODE/:  python -m benchmarks.groq_stub --port 8765
+# then point the app at it with GROQ_API_URL=http://127.0.0.1:8765/v1/chat/completions
+
+# Flat per-image prompt cost, roughly one Llama 4 vision tile.
+IMAGE_TOKENS = 600
+
+LEGACY_IDENTIFY_RESPONSE = """- **Full Name**: Tom Hanks
+- **Profession**: Actor, Filmmaker, and Producer
+- **Nationality**: American
+- **Famous For**: His versatile performances in critically acclaimed and commercially successful films such as "Forrest Gump", "Cast Away", "Saving Private Ryan", "Philadelphia", "Apollo 13", and as the voice of Woody in the "Toy Story" franchise. He is widely regarded as one of the most beloved and recognizable actors in Hollywood.
+- **Top Achievements**:
+  - Won two consecutive Academy Awards for Best Actor for "Philadelphia" (1993) and "Forrest Gump" (1994)
+  - Received the Presidential Medal of Freedom in 2016
+  - Recipient of the AFI Life Achievement Award and the Cecil B. DeMille Award
+  - His films have grossed over $4.9 billion in the United States and $9.96 billion worldwide
+  - Known for his humanitarian work and advocacy, including support for veterans and space exploration"""
+
+COMPACT_IDENTIFY_RESPONSE = json.dumps({
+    "full_name": "Tom Hanks",
+    "profession": "Actor and filmmaker",
+    "nationality": "American",
+    "famous_for": "Forrest Gump, Cast Away, Saving Private Ryan, Toy Story",
+    "top_achievements": ["Two Best Actor Oscars", "Presidential Medal of Freedom", "AFI Life Achievement Award"],
+    "confidence": 0.97,
+})
+
+LEGACY_QA_RESPONSE = """Tom Hanks is famous for a wide range of movies across several decades. Some of his most notable films include "Forrest Gump" (1994), for which he won the Academy Award for Best Actor; "Philadelphia" (1993), which earned him his first Oscar; "Saving Private Ryan" (1998), a critically acclaimed World War II drama directed by Steven Spielberg; "Cast Away" (2000), in which he played a FedEx employee stranded on an island; "Apollo 13" (1995), about the ill-fated lunar mission; "The Green Mile" (1999); "Catch Me If You Can" (2002); "Captain Phillips" (2013); and "Sully" (2016). He is also well known as the voice of Woody in the "Toy Story" animated franchise. His consistent ability to portray relatable, decent characters has made him one of the most beloved actors in Hollywood history."""
+
+COMPACT_QA_RESPONSE = """Tom Hanks is best known for "Forrest Gump" and "Philadelphia", which won him back-to-back Best Actor Oscars, plus "Saving Private Ryan", "Cast Away", "Apollo 13" and voicing Woody in "Toy Story"."""
+
+# First recording whose "match" appears in the prompt text wins.
+DEFAULT_RECORDINGS = [
+    {"match": "Reply only with JSON", "content": COMPACT_IDENTIFY_RESPONSE},
+    {"match": "You are a celebrity recognition expert AI", "content": LEGACY_IDENTIFY_RESPONSE},
+    {"match": "Answer briefly", "content": COMPACT_QA_RESPONSE},
+    {"match": "", "content": LEGACY_QA_RESPONSE},
+]
+
+
+class StubServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-stream are expected under load; don't print tracebacks.
+        pass
+
+
+def prompt_text(messages):
+    texts = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            texts.append(content)
+        else:
+            texts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    return "\n".join(texts)
+
+
+def truncate_to_tokens(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split(" ")
+    while words and count_tokens(" ".join(words)) > max_tokens:
+        words = words[:max(1, len(words) * 9 // 10)] if len(words) > 10 else words[:-1]
+    return " ".join(words)
+
+
+class GroqStub:
+
+    # Chat-completions stub with a simple latency model:
+    # (base + prompt_tokens * prefill + completion_tokens * decode) * (1 +- jitter).
+    # Optional per-minute request and token limits answer 429 with Retry-After
+    # and send Groq's x-ratelimit-* headers. stall_probability and error_rate
+    # imitate a degraded provider: occasional stalls, or 503s.
+
+    def __init__(self, recordings=None, base_latency=0.05, prefill_per_token=0.0001, decode_per_token=0.004,
+                 host="127.0.0.1", port=0, jitter=0.0, seed=0, requests_per_minute=0, tokens_per_minute=0,
+                 stall_probability=0.0, stall_seconds=0.0, error_rate=0.0):
+        self.recordings = recordings or DEFAULT_RECORDINGS
+        self.base_latency = base_latency
+        self.prefill_per_token = prefill_per_token
+        self.decode_per_token = decode_per_token
+        self.jitter = jitter
+        self.stall_probability = stall_probability
+        self.stall_seconds = stall_seconds
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self._levels = {kind: float(limit) for kind, limit in self.limits.items()}
+        self._refilled = time.monotonic()
+        self.rate_limited = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = StubServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def respond(self, request):
+        text = prompt_text(request["messages"])
+        content = next(r["content"] for r in self.recordings if r["match"] in text)
+        content = truncate_to_tokens(content, request.get("max_tokens", 1024))
+
+        prompt_tokens, images = count_message_tokens(request["messages"])
+        prompt_tokens += images * IMAGE_TOKENS
+        completion_tokens = count_tokens(content)
+        latency = (self.base_latency + prompt_tokens * self.prefill_per_token
+                   + completion_tokens * self.decode_per_token)
+        with self._lock:
+            if self.jitter:
+                latency *= 1 + self._random.uniform(-self.jitter, self.jitter)
+            if self._random.random() < self.stall_probability:
+                latency += self.stall_seconds
+
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        return content, usage, latency
+
+    def admit(self, tokens):
+        # Continuous buckets; returns (seconds to wait or None, rate-limit headers).
+        costs = {"requests": 1, "tokens": tokens}
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            for kind, limit in self.limits.items():
+                if limit:
+                    level = min(limit, self._levels[kind] + (now - self._refilled) * limit / 60)
+                    self._levels[kind] = level
+                    if level < min(costs[kind], limit):
+                        wait = max(wait, (min(costs[kind], limit) - level) * 60 / limit)
+            self._refilled = now
+
+            if wait:
+                self.rate_limited += 1
+            else:
+                for kind, limit in self.limits.items():
+                    if limit:
+                        self._levels[kind] -= min(costs[kind], limit)
+
+            headers = {}
+            for kind, limit in self.limits.items():
+                if limit:
+                    level = max(0.0, self._levels[kind])
+                    headers[f"x-ratelimit-limit-{kind}"] = str(limit)
+                    headers[f"x-ratelimit-remaining-{kind}"] = str(int(level))
+                    headers[f"x-ratelimit-reset-{kind}"] = f"{(limit - level) * 60 / limit:.2f}s"
+        return (wait or None), headers
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._send(200, b'{"status":"ok"}')
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                with stub._lock:
+                    stub.requests += 1
+
+                content, usage, latency = stub.respond(request)
+
+                with stub._lock:
+                    failed = stub._random.random() < stub.error_rate
+                if failed:
+                    time.sleep(stub.base_latency)
+                    self._send(503, b'{"error":{"message":"Service unavailable"}}')
+                    return
+
+                wait, headers = stub.admit(usage["total_tokens"])
+                if wait:
+                    headers["Retry-After"] = str(max(1, math.ceil(wait)))
+                    self._send(429, b'{"error":{"message":"Rate limit reached","type":"tokens"}}', headers=headers)
+                    return
+
+                if not request.get("stream"):
+                    time.sleep(latency)
+                    body = json.dumps({
+                        "object": "chat.completion",
+                        "model": request.get("model"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                     "finish_reason": "stop"}],
+                        "usage": usage,
+                    }).encode()
+                    self._send(200, body, headers=headers)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                words = content.split(" ")
+                prefill = latency - usage["completion_tokens"] * stub.decode_per_token
+                time.sleep(max(0.0, prefill))
+                for i, word in enumerate(words):
+                    chunk = word if i == 0 else " " + word
+                    time.sleep(count_tokens(chunk) * stub.decode_per_token)
+                    event = {"choices": [{"index": 0, "delta": {"content": chunk}}]}
+                    self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+                self._write_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def load_recordings(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Local stub of the Groq chat-completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--recordings", default="", help="JSON list of {match, content}")
+    parser.add_argument("--base-latency", type=float, default=0.05)
+    parser.add_argument("--prefill-per-token", type=float, default=0.0001)
+    parser.add_argument("--decode-per-token", type=float, default=0.004)
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +- fraction applied to each latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests-per-minute", type=int, default=0, help="answer 429 above this rate (0: no limit)")
+    parser.add_argument("--tokens-per-minute", type=int, default=0)
+    parser.add_argument("--stall-probability", type=float, default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    args = parser.parse_args()
+
+    recordings = load_recordings(args.recordings) if args.recordings else None
+    stub = GroqStub(recordings, args.base_latency, args.prefill_per_token, args.decode_per_token,
+                    host=args.host, port=args.port, jitter=args.jitter, seed=args.seed,
+                    requests_per_minute=args.requests_per_minute, tokens_per_minute=args.tokens_per_minute,
+                    stall_probability=args.stall_probability, stall_seconds=args.stall_seconds,
+                    error_rate=args.error_rate)
+    print(f"Groq stub listening on {stub.url}")
+    stub.server.serve_forever()
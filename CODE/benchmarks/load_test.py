@@ -0,0 +1,171 @@
+import argparse
+import itertools
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.groq_stub import GroqStub
+
+# Run from CODE/:
+#   python -m benchmarks.load_test --server dev
+#   python -m benchmarks.load_test --server gunicorn
+# Starts the app against a local Groq stub with the answer cache and the
+# knowledge pack disabled, so every request waits on the (stubbed) upstream.
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_IMAGE = os.path.join(CODE_DIR, "..", "samples", "Brad_Pitt.jpg")
+# A path that doesn't exist, to switch off the knowledge pack and face index.
+MISSING = os.path.join(tempfile.gettempdir(), "load-test-disabled")
+
+SERVERS = {
+    "dev": [sys.executable, "app.py"],
+    "gunicorn": [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+}
+
+
+def start_server(kind, port, stub_url, extra_env):
+    env = dict(os.environ)
+    env.update({
+        "GROQ_API_URL": stub_url,
+        "GROQ_API_KEY": "stub",
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "GUNICORN_ACCESS_LOG": "",
+        "ANSWER_CACHE_SIZE": "0",
+        "ANSWER_CACHE_SIMILARITY": "",
+        "ANSWER_CACHE_PATH": "",
+        "IDENTIFY_CACHE_SIZE": "0",
+        "IDENTIFY_CACHE_PATH": "",
+        "KNOWLEDGE_PACK_PATH": MISSING,
+        "FACE_INDEX_PATH": MISSING,
+    })
+    env.update(extra_env)
+
+    command = SERVERS[kind]
+    if kind == "dev":
+        # app.py always binds port 5000.
+        port = 5000
+    process = subprocess.Popen(command, cwd=CODE_DIR, env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(base_url + "/readyz", timeout=1).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+
+    stop_server(process)
+    raise RuntimeError(f"{kind} server did not become ready")
+
+
+def stop_server(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=40)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def ask(session, base_url, n):
+    # Unique questions so single-flight can't coalesce them.
+    response = session.post(base_url + "/api/ask/stream",
+                            data={"name": "Tom Hanks", "question": f"Tell me fact number {n} about him"})
+    response.content
+    return response.status_code
+
+
+def identify(session, base_url, n, image=[]):
+    if not image:
+        with open(SAMPLE_IMAGE, "rb") as f:
+            image.append(f.read())
+    response = session.post(base_url + "/api/identify/faces", files={"image": ("face.jpg", image[0])})
+    return response.status_code
+
+
+WORKLOADS = {"ask": ask, "identify": identify}
+
+
+def run_load(base_url, workload, concurrency, duration):
+    counter = itertools.count()
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        nonlocal errors
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                status = WORKLOADS[workload](session, base_url, next(counter))
+            except requests.RequestException:
+                status = None
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                if status == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(client)
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / wall,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+    }
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Load test the web app against a stubbed Groq API")
+    parser.add_argument("--server", nargs="+", choices=list(SERVERS), default=["dev", "gunicorn"])
+    parser.add_argument("--url", default="", help="test an already running server instead")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--workload", choices=list(WORKLOADS), default="ask")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--env", nargs="*", default=[], help="extra KEY=VALUE settings for the server")
+    args = parser.parse_args()
+
+    extra_env = dict(item.split("=", 1) for item in args.env)
+
+    with GroqStub(host="127.0.0.1") as stub:
+        targets = [("url", args.url)] if args.url else args.server
+        for target in targets:
+            if args.url:
+                name , base_url , process = "url" , args.url , None
+            else:
+                name = target
+                process , base_url = start_server(target, args.port, stub.url, extra_env)
+            try:
+                stats = run_load(base_url, args.workload, args.concurrency, args.duration)
+            finally:
+                if process is not None:
+                    stop_server(process)
+
+            print(f"{name:<9} {args.workload:<8} c={args.concurrency:<3} requests={stats['requests']:<6} "
+                  f"errors={stats['errors']:<4} throughput={stats['throughput']:7.1f} req/s  "
+                  f"p50={stats['p50']:7.1f} ms  p95={stats['p95']:7.1f} ms  p99={stats['p99']:7.1f} ms")
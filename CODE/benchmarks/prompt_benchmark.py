@@ -0,0 +1,94 @@
+import argparse
+import glob
+import os
+import statistics
+import time
+
+from app.utils import prompts
+from app.utils.celebrity_detector import CelebrityDetector
+from app.utils.image_handler import preprocess_bytes
+from app.utils.providers import Provider, ProviderRouter
+from app.utils.qa_engine import QAEngine
+from benchmarks.groq_stub import GroqStub
+
+# Run from CODE/:  python -m benchmarks.prompt_benchmark --requests 10
+# Compares PROMPT_STYLE=legacy against compact on the uncached remote path,
+# against a local stub that replays recorded responses for each prompt.
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "samples")
+
+QUESTIONS = [
+    "What movies is he famous for?",
+    "Where was he born?",
+    "What awards has he won?",
+]
+
+
+def load_samples(samples_dir, limit):
+    images = []
+    for path in sorted(glob.glob(os.path.join(samples_dir, "*.jpg")))[:limit]:
+        with open(path, "rb") as f:
+            images.append(preprocess_bytes(f.read()).model_bytes)
+    return images
+
+
+def timed(calls):
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def run_style(style, url, images, requests):
+    prompts.PROMPT_STYLE = style
+    prompts.token_meter.reset()
+
+    # Call the remote paths directly, without knowledge-pack facts, so caches
+    # and local answers don't hide the prompt cost.
+    router = ProviderRouter([Provider("stub", url)], "benchmark")
+    detector = CelebrityDetector(router=router)
+    qa = QAEngine(router=router)
+    qa.knowledge = None
+
+    identify_ms = timed(lambda image=images[i % len(images)]: detector._identify_remote(image) for i in range(requests))
+    qa_ms = timed(lambda q=QUESTIONS[i % len(QUESTIONS)]: qa._ask_remote("Tom Hanks", q) for i in range(requests))
+
+    return {"identify": identify_ms, "qa": qa_ms}, prompts.token_meter.stats()
+
+
+def report(style, latencies, stats):
+    for endpoint in ("identify", "qa"):
+        totals = stats.get(endpoint, {})
+        count = max(1, totals.get("requests", 0))
+        print(f"{style:<8} {endpoint:<9} "
+              f"latency={statistics.mean(latencies[endpoint]):7.1f} ms  "
+              f"prompt_est={totals.get('estimated_prompt_tokens', 0) / count:6.1f}  "
+              f"prompt={totals.get('prompt_tokens', 0) / count:6.1f}  "
+              f"completion={totals.get('completion_tokens', 0) / count:6.1f} tokens/request")
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Measure prompt and token savings of the compact prompt style")
+    parser.add_argument("--samples", default=SAMPLES_DIR)
+    parser.add_argument("--images", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+
+    images = load_samples(args.samples, args.images)
+
+    with GroqStub() as stub:
+        results = {}
+        for style in ("legacy", "compact"):
+            latencies, stats = run_style(style, stub.url, images, args.requests)
+            results[style] = (latencies, stats)
+            report(style, latencies, stats)
+
+    for endpoint in ("identify", "qa"):
+        legacy = results["legacy"][1].get(endpoint, {})
+        compact = results["compact"][1].get(endpoint, {})
+        before = legacy.get("prompt_tokens", 0) + legacy.get("completion_tokens", 0)
+        after = compact.get("prompt_tokens", 0) + compact.get("completion_tokens", 0)
+        if before:
+            print(f"{endpoint:<9} total tokens saved: {100 * (1 - after / before):5.1f}%")
@@ -0,0 +1,64 @@
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.providers import Provider, ProviderRouter
+from app.utils.qa_engine import QAEngine
+from benchmarks.groq_stub import GroqStub
+
+# Run from CODE/:  PROVIDER_HEDGE_DELAY=0.5 python -m benchmarks.provider_benchmark --requests 300
+# Two stubbed providers, one of which stalls now and then. Compares sending
+# everything to the degraded one, routing without hedging, and routing with
+# hedged requests, on the uncached QA path.
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+def run(router, requests, concurrency):
+    qa = QAEngine(router=router)
+    qa.knowledge = None
+
+    def ask(n):
+        start = time.perf_counter()
+        qa._ask_remote("Tom Hanks", f"Tell me fact number {n} about him")
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(ask, range(requests)))
+
+    return {
+        "p50": statistics.median(latencies),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1],
+    }
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Tail latency of provider routing and hedging")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stall-probability", type=float, default=0.08)
+    parser.add_argument("--stall-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    with GroqStub(base_latency=0.05, decode_per_token=0.002, jitter=0.2, seed=1,
+                  stall_probability=args.stall_probability, stall_seconds=args.stall_seconds) as degraded, \
+         GroqStub(base_latency=0.08, decode_per_token=0.002, jitter=0.2, seed=2) as healthy:
+        setups = {
+            "degraded only": lambda: ProviderRouter([Provider("degraded", degraded.url)], hedge=False),
+            "routed": lambda: ProviderRouter([Provider("degraded", degraded.url), Provider("healthy", healthy.url)],
+                                             hedge=False),
+            "routed+hedged": lambda: ProviderRouter([Provider("degraded", degraded.url), Provider("healthy", healthy.url)],
+                                                    hedge=True),
+        }
+
+        for name , build in setups.items():
+            router = build()
+            stats = run(router, args.requests, args.concurrency)
+            calls = {provider: health.calls for provider , health in router.health.items()}
+            print(f"{name:<14} p50={stats['p50']:7.1f} ms  p95={stats['p95']:7.1f} ms  p99={stats['p99']:7.1f} ms  "
+                  f"max={stats['max']:7.1f} ms  hedges={router.hedges:<4} calls={calls}")
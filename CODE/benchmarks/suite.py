@@ -0,0 +1,259 @@
+import argparse
+import gc
+import glob
+import io
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import requests
+from werkzeug.datastructures import FileStorage
+
+# Run from CODE/:
+#   python -m benchmarks.suite --json before.json
+#   python -m benchmarks.suite --baseline before.json
+# Replays samples/ and the Celebrity Faces Dataset through process_image and
+# the Flask "/" route (test client, no socket) with caches and the knowledge
+# pack off. Groq is replaced by benchmarks.groq_stub running in its own
+# process, so the run needs no network and the stub's allocations stay out
+# of the memory figures. Nothing from the app (or build_face_index, which
+# imports it) is imported before configure().
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES_DIR = os.path.join(CODE_DIR, "..", "samples")
+# A path that doesn't exist, to switch off the knowledge pack and face index.
+MISSING = os.path.join(tempfile.gettempdir(), "benchmark-suite-disabled")
+
+QUESTIONS = [
+    "What movies is he famous for?",
+    "Where was he born?",
+    "What awards has he won?",
+]
+
+
+def load_images(samples_dir, dataset_dir, per_identity, limit):
+    from build_face_index import DATASET_DIR, iter_dataset
+
+    dataset_dir = dataset_dir or DATASET_DIR
+    paths = sorted(glob.glob(os.path.join(samples_dir, "*.jpg")))
+    paths += [path for _, path in iter_dataset(dataset_dir, per_identity)]
+
+    images = []
+    for path in paths[:limit]:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    return images
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(args):
+    port = free_port()
+    command = [sys.executable, "-m", "benchmarks.groq_stub", "--port", str(port),
+               "--base-latency", str(args.base_latency), "--prefill-per-token", str(args.prefill_per_token),
+               "--decode-per-token", str(args.decode_per_token), "--jitter", str(args.jitter)]
+    if args.recordings:
+        command += ["--recordings", args.recordings]
+    process = subprocess.Popen(command, cwd=CODE_DIR, stdout=subprocess.DEVNULL)
+
+    url = f"http://127.0.0.1:{port}/v1/chat/completions"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError("Groq stub did not start")
+
+
+def configure(stub_url, processes):
+    # Before the app is imported: its settings are read at import time.
+    os.environ.update({
+        "GROQ_API_URL": stub_url,
+        "GROQ_API_KEY": "stub",
+        "PREPROCESS_PROCESSES": str(processes),
+        "ANSWER_CACHE_SIZE": "0",
+        "ANSWER_CACHE_SIMILARITY": "",
+        "ANSWER_CACHE_PATH": "",
+        "IDENTIFY_CACHE_SIZE": "0",
+        "IDENTIFY_CACHE_PATH": "",
+        "KNOWLEDGE_PACK_PATH": MISSING,
+        "FACE_INDEX_PATH": MISSING,
+    })
+
+
+def build_scenarios(images, requests_per_scenario):
+    from app import create_app
+    from app.routes import result_store
+    from app.utils.image_handler import process_image
+    from app.utils.result_store import make_result
+
+    client = create_app().test_client()
+    result_id = result_store.put(make_result(images[0], "Tom Hanks", "Tom Hanks"))
+
+    def run_process_image(image):
+        process_image(FileStorage(io.BytesIO(image), "upload.jpg"))
+
+    def run_identify(image):
+        response = client.post("/", data={"image": (io.BytesIO(image), "upload.jpg")},
+                               content_type="multipart/form-data")
+        if response.status_code != 200:
+            raise RuntimeError(f"/ returned {response.status_code}")
+
+    def run_ask(question):
+        response = client.post("/", data={"question": question, "result_id": result_id})
+        if response.status_code != 200:
+            raise RuntimeError(f"/ returned {response.status_code}")
+
+    def cycle(items):
+        return [items[i % len(items)] for i in range(requests_per_scenario or len(items))]
+
+    return {
+        "process_image": (run_process_image, cycle(images)),
+        "route_identify": (run_identify, cycle(images)),
+        "route_ask": (run_ask, cycle(QUESTIONS)),
+    }
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+def measure_latency(fn, inputs, warmup):
+    for item in inputs[:warmup]:
+        fn(item)
+
+    latencies = []
+    start = time.perf_counter()
+    for item in inputs:
+        call_start = time.perf_counter()
+        fn(item)
+        latencies.append((time.perf_counter() - call_start) * 1000)
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "throughput": len(latencies) / wall,
+        "mean": statistics.mean(latencies),
+        "p50": statistics.median(latencies),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+def measure_memory(fn, inputs):
+    # A separate pass: tracemalloc slows every allocation down. NumPy (and so
+    # OpenCV's Python arrays) report their buffers to it.
+    gc.collect()
+    collections = sum(stat["collections"] for stat in gc.get_stats())
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    initial = tracemalloc.get_traced_memory()[0]
+
+    peaks = []
+    for item in inputs:
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn(item)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - initial
+    tracemalloc.stop()
+    # CPython has no allocation counter; net live blocks and the collections
+    # the cyclic GC ran (triggered by container allocations) stand in for it.
+    return {
+        "peak_kb": statistics.mean(peaks) / 1024,
+        "max_peak_kb": max(peaks) / 1024,
+        "retained_kb": retained / 1024,
+        "retained_blocks": sys.getallocatedblocks() - blocks,
+        "gc_per_request": (sum(stat["collections"] for stat in gc.get_stats()) - collections - 1) / len(inputs),
+    }
+
+
+def report(name, stats, baseline=None):
+    line = (f"{name:<15} n={stats['requests']:<4} throughput={stats['throughput']:7.1f}/s  "
+            f"p50={stats['p50']:7.1f} ms  p95={stats['p95']:7.1f} ms  p99={stats['p99']:7.1f} ms")
+    if "peak_kb" in stats:
+        line += (f"  peak={stats['peak_kb']:8.0f} KiB (max {stats['max_peak_kb']:.0f})  "
+                 f"retained={stats['retained_kb']:6.0f} KiB/{stats['retained_blocks']} blocks  "
+                 f"gc/req={stats['gc_per_request']:.2f}")
+    print(line)
+
+    if baseline:
+        deltas = []
+        for key in ("throughput", "p50", "p95", "p99", "peak_kb"):
+            if baseline.get(key) and key in stats:
+                deltas.append(f"{key} {100 * (stats[key] / baseline[key] - 1):+.1f}%")
+        print(f"{'':<15} vs baseline: " + "  ".join(deltas))
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Offline latency and memory benchmarks against a Groq stub")
+    parser.add_argument("--samples", default=SAMPLES_DIR)
+    parser.add_argument("--dataset", default="", help="default: build_face_index's dataset directory")
+    parser.add_argument("--per-identity", type=int, default=2)
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--requests", type=int, default=0, help="per scenario; default one pass over the inputs")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--scenario", nargs="*", default=[])
+    parser.add_argument("--processes", type=int, default=0,
+                        help="preprocess pool size; 0 keeps the work in this process so memory covers it")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--recordings", default="", help="JSON list of {match, content} for the stub")
+    parser.add_argument("--base-latency", type=float, default=0.05)
+    parser.add_argument("--prefill-per-token", type=float, default=0.0001)
+    parser.add_argument("--decode-per-token", type=float, default=0.004)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--json", default="", help="write the results here")
+    parser.add_argument("--baseline", default="", help="results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["scenarios"]
+
+    stub , stub_url = start_stub(args)
+    try:
+        configure(stub_url, args.processes)
+        images = load_images(args.samples, args.dataset, args.per_identity, args.images)
+        scenarios = build_scenarios(images, args.requests)
+
+        results = {}
+        for name , (fn , inputs) in scenarios.items():
+            if args.scenario and name not in args.scenario:
+                continue
+            stats = measure_latency(fn, inputs, args.warmup)
+            if not args.no_memory:
+                stats.update(measure_memory(fn, inputs))
+            results[name] = stats
+            report(name, stats, baseline.get(name))
+    finally:
+        from app.utils.lifecycle import shutdown
+        shutdown()
+        stub.terminate()
+        stub.wait()
+
+    # ru_maxrss is in KiB on Linux.
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"images={len(images)}  max RSS={max_rss_mb:.0f} MiB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"images": len(images), "max_rss_mb": max_rss_mb, "scenarios": results}, f, indent=2)
@@ -0,0 +1,94 @@
+import argparse
+import os
+
+import cv2
+import numpy as np
+
+from app.utils.face_embedder import build_embedder
+from app.utils.face_index import FlatFaceIndex, IVFFaceIndex
+from app.utils.image_handler import detect_largest_face
+from app.utils.local_recognizer import FACE_INDEX_PATH
+
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Celebrity Faces Dataset")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def identity_name(folder):
+    # "Anushka_Sharma" -> "Anushka Sharma"
+    return folder.replace("_", " ").strip()
+
+
+def iter_dataset(dataset_dir, per_identity=None):
+    for folder in sorted(os.listdir(dataset_dir)):
+        folder_path = os.path.join(dataset_dir, folder)
+        if not os.path.isdir(folder_path):
+            continue
+
+        images = sorted(f for f in os.listdir(folder_path) if f.lower().endswith(IMAGE_EXTENSIONS))
+        if per_identity:
+            images = images[:per_identity]
+
+        for image in images:
+            yield identity_name(folder), os.path.join(folder_path, image)
+
+
+def embed_file(embedder, path, require_face=False):
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+
+    face_box = detect_largest_face(img)
+    if face_box is None:
+        if require_face:
+            return None
+    else:
+        (x,y,w,h) = face_box
+        img = img[y:y + h, x:x + w]
+
+    return embedder.embed(img)
+
+
+def embed_dataset(dataset_dir, embedder, per_identity=None, require_face=False):
+    labels = []
+    label_ids = []
+    vectors = []
+
+    for name, path in iter_dataset(dataset_dir, per_identity):
+        vector = embed_file(embedder, path, require_face)
+        if vector is None:
+            continue
+
+        if name not in labels:
+            labels.append(name)
+        label_ids.append(labels.index(name))
+        vectors.append(vector)
+
+    embeddings = np.vstack(vectors).astype(np.float32) if vectors else np.zeros((0, embedder.dim), np.float32)
+    return embeddings, np.asarray(label_ids, np.int32), labels
+
+
+def build_index(dataset_dir, embedder, per_identity=None, require_face=False, kind="flat", nlist=None, nprobe=8):
+    embeddings, label_ids, labels = embed_dataset(dataset_dir, embedder, per_identity, require_face)
+
+    if kind == "ivf":
+        return IVFFaceIndex.build(embeddings, label_ids, labels, embedder.name, nlist=nlist, nprobe=nprobe)
+    return FlatFaceIndex(embeddings, label_ids, labels, embedder.name)
+
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Embed the Celebrity Faces Dataset into a face index")
+    parser.add_argument("--dataset", default=DATASET_DIR)
+    parser.add_argument("--output", default=FACE_INDEX_PATH)
+    parser.add_argument("--embedder", default="")
+    parser.add_argument("--per-identity", type=int, default=None)
+    parser.add_argument("--require-face", action="store_true")
+    parser.add_argument("--index", choices=["flat", "ivf"], default="flat")
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+
+    embedder = build_embedder(args.embedder) if args.embedder else build_embedder()
+    index = build_index(args.dataset, embedder, args.per_identity, args.require_face, args.index, args.nlist, args.nprobe)
+    index.save(args.output)
+
+    print(f"Indexed {len(index)} faces for {len(index.labels)} identities with {embedder.name} -> {args.output}")
@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+
+from dotenv import load_dotenv
+
+from app.utils.http_client import default_http_client
+from app.utils.knowledge_pack import KNOWLEDGE_PACK_PATH, KnowledgePack, normalize_name
+from app.utils.upstream_scheduler import default_upstream_scheduler
+from build_face_index import DATASET_DIR, identity_name
+
+PROFILE_PROMPT = """Return a JSON object about the public figure "{name}" with these keys:
+"full_name" (string), "profession" (string), "nationality" (string), "famous_for" (string),
+"top_achievements" (list of short strings), "facts" (list of 20-40 short, self-contained factual sentences
+covering birth date and place, family, career milestones, notable works, awards and recent activity).
+Return only the JSON object."""
+
+
+def roster(dataset_dir):
+    return sorted(identity_name(f) for f in os.listdir(dataset_dir) if os.path.isdir(os.path.join(dataset_dir, f)))
+
+
+def load_curated(source_dir):
+    # <Name>.json files: {"name", "profile": {...}, "chunks": [...]}
+    curated = {}
+    if source_dir and os.path.isdir(source_dir):
+        for filename in sorted(os.listdir(source_dir)):
+            if filename.endswith(".json"):
+                with open(os.path.join(source_dir, filename)) as f:
+                    entry = json.load(f)
+                curated[normalize_name(entry["name"])] = entry
+    return curated
+
+
+def fetch_from_llm(name, model):
+    # The scheduler paces the build to Groq's limits and waits out 429s.
+    response = default_upstream_scheduler().post(
+        default_http_client(),
+        os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions"),
+        headers={"Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}", "Content-Type": "application/json"},
+        json={
+            "model": model,
+            "messages": [{"role": "user", "content": PROFILE_PROMPT.format(name=name)}],
+            "temperature": 0.2,
+            "max_tokens": 2048,
+            "response_format": {"type": "json_object"},
+        },
+    )
+    response.raise_for_status()
+    data = json.loads(response.json()["choices"][0]["message"]["content"])
+
+    facts = [fact.strip() for fact in data.pop("facts", []) if fact.strip()]
+    return {"name": name, "profile": data, "chunks": facts}
+
+
+if __name__=="__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Build the offline per-celebrity knowledge pack")
+    parser.add_argument("--dataset", default=DATASET_DIR)
+    parser.add_argument("--source", default="", help="directory of curated <Name>.json entries")
+    parser.add_argument("--from-llm", action="store_true", help="fetch entries missing from --source once via Groq")
+    parser.add_argument("--model", default="meta-llama/llama-4-maverick-17b-128e-instruct")
+    parser.add_argument("--output", default=KNOWLEDGE_PACK_PATH)
+    args = parser.parse_args()
+
+    curated = load_curated(args.source)
+    celebrities = []
+    for name in roster(args.dataset):
+        entry = curated.get(normalize_name(name))
+        if entry is None and args.from_llm:
+            entry = fetch_from_llm(name, args.model)
+            print(f"Fetched {name}: {len(entry['chunks'])} facts")
+        if entry is None:
+            print(f"Skipping {name}: no curated entry")
+            continue
+        celebrities.append(entry)
+
+    # Fail on malformed entries before writing anything.
+    KnowledgePack(celebrities)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"celebrities": celebrities}, f, ensure_ascii=False, separators=(",", ":"))
+
+    print(f"Wrote {len(celebrities)} celebrities to {args.output}")
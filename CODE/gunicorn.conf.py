@@ -0,0 +1,102 @@
+import os
+import shutil
+import signal
+import tempfile
+import threading
+
+# Identify and QA requests spend most of their time waiting on Groq, so each
+# worker runs many threads (gthread) or greenlets (gevent) rather than the
+# one-request-per-process sync worker.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+
+if worker_class == "gevent":
+    # Patch before the app is preloaded so its locks and sockets are cooperative.
+    from gevent import monkey
+    monkey.patch_all()
+
+    # A ProcessPoolExecutor's management thread and pipes don't survive
+    # monkey-patching reliably, so gevent workers preprocess inline.
+    if int(os.getenv("PREPROCESS_PROCESSES", "0")) > 0:
+        raise RuntimeError("PREPROCESS_PROCESSES must be 0 with the gevent worker class")
+    os.environ["PREPROCESS_PROCESSES"] = "0"
+
+from app.utils.cpu import available_cpus
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+# Sized to the container's CPU limit, not the host's core count.
+workers = int(os.getenv("GUNICORN_WORKERS", str(available_cpus())))
+threads = int(os.getenv("GUNICORN_THREADS", "64"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "256"))
+# One pooled upstream connection per concurrent request.
+os.environ.setdefault("HTTP_POOL_MAXSIZE", str(worker_connections if worker_class == "gevent" else threads))
+
+# Each worker starts its own preprocess pool; split the CPUs between them
+# instead of giving every worker one process per CPU.
+os.environ.setdefault("PREPROCESS_PROCESSES", str(max(1, available_cpus() // workers)))
+
+# Any worker may get the follow-up to an upload, so results are shared on
+# disk (private to this user; see FileResultStore). Set RESULT_STORE_PATH to a
+# mounted volume in containers, or empty with a single worker.
+os.environ.setdefault("RESULT_STORE_PATH", os.path.join(tempfile.gettempdir(), f"celebrity-results-{os.getuid()}"))
+
+# Workers write their counters here and /metrics adds them up, so a scrape
+# that lands on any worker reports the whole server.
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "celebrity-metrics"))
+
+# Import the app, knowledge pack and face index once in the master; workers
+# share those pages copy-on-write. Preprocess pools (and the cascades their
+# processes load) are started per worker, in post_worker_init.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "200"))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+
+# On SIGTERM a worker keeps serving this long with /readyz answering 503, so
+# load balancers take it out of rotation before it stops accepting.
+DRAIN_SECONDS = float(os.getenv("GUNICORN_DRAIN_SECONDS", "5"))
+
+
+def on_starting(server):
+    # Counters start from zero with the server; leftovers of the last run would
+    # otherwise be added in (reloads keep them).
+    shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared across processes.
+    from app.utils.http_client import default_http_client
+    default_http_client().close()
+
+
+def post_worker_init(worker):
+    from app.utils.lifecycle import server_state
+    from app.utils.preprocess_pool import default_preprocess_pool
+
+    # Start this worker's preprocess processes now rather than on the first
+    # upload; /readyz turns ready once they have warmed up.
+    default_preprocess_pool().warm()
+
+    # gunicorn's handler stops the worker accepting right away, so a draining
+    # /readyz would never be seen; wrap it with the drain period.
+    stop = signal.getsignal(signal.SIGTERM)
+
+    def drain(signum, frame):
+        server_state.begin_shutdown()
+        worker.log.info("Draining for %.1fs before shutdown", DRAIN_SECONDS)
+        timer = threading.Timer(DRAIN_SECONDS, stop, (signum, None))
+        timer.daemon = True
+        timer.start()
+
+    if callable(stop) and DRAIN_SECONDS > 0:
+        signal.signal(signal.SIGTERM, drain)
+
+
+def worker_exit(server, worker):
+    from app.utils.lifecycle import shutdown
+    shutdown()
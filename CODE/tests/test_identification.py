@@ -0,0 +1,124 @@
+import pytest
+
+from app.utils.identification import FIELD_LINE, Identification
+from app.utils.prompts import parse_json_content
+
+FULL_MARKDOWN = """- **Full Name**: Tom Hanks
+- **Profession**: Actor
+- **Nationality**: American
+- **Famous For**: Forrest Gump
+- **Top Achievements**:
+  - Two Academy Awards
+  - Presidential Medal of Freedom"""
+
+
+def parse(content):
+    # JSON first, then the markdown of the older prompts, as CelebrityDetector._parse_response does.
+    profile = parse_json_content(content)
+    return Identification.from_profile(profile) if profile is not None else Identification.from_markdown(content)
+
+
+@pytest.mark.parametrize("line , label , value", [
+    ("- **Full Name**: Tom Hanks", "Full Name", "Tom Hanks"),
+    ("**Full Name:** Tom Hanks", "Full Name", "Tom Hanks"),
+    ("Full Name: Tom Hanks", "Full Name", "Tom Hanks"),
+    ("* __Profession__ - Actor", "Profession", "Actor"),
+    ("1. Nationality — American", "Nationality", "American"),
+    ("  • known for： Forrest Gump", "known for", "Forrest Gump"),
+    ("- **Top Achievements**:", "Top Achievements", ""),
+    ("- **Match Confidence**: 0.93", "Match Confidence", "0.93"),
+])
+def test_field_line(line, label, value):
+    match = FIELD_LINE.match(line)
+    assert match is not None
+    assert match.group(1) == label
+    assert match.group(2).strip("*_ ") == value
+
+
+@pytest.mark.parametrize("line", [
+    "Tom Hanks is an actor.",
+    "  - Two Academy Awards",
+    "### Face 1",
+    "Unknown",
+])
+def test_not_a_field_line(line):
+    assert FIELD_LINE.match(line) is None
+
+
+@pytest.mark.parametrize("content , expected", [
+    (FULL_MARKDOWN, ("Tom Hanks", "Actor", "American", "Forrest Gump", ("Two Academy Awards", "Presidential Medal of Freedom"))),
+    # Plain labels and bullets.
+    ("Full Name: Tom Hanks\nProfession: Actor\nNationality: American\nFamous For: Forrest Gump\n"
+     "Top Achievements:\n- Two Academy Awards\n- Presidential Medal of Freedom",
+     ("Tom Hanks", "Actor", "American", "Forrest Gump", ("Two Academy Awards", "Presidential Medal of Freedom"))),
+    # Colon inside the bold, and achievements on one line.
+    ("**Full Name:** Tom Hanks\n**Occupation:** Actor\n**Top Achievements:** Two Academy Awards; Presidential Medal of Freedom",
+     ("Tom Hanks", "Actor", "", "", ("Two Academy Awards", "Presidential Medal of Freedom"))),
+    # Missing fields stay empty.
+    ("- **Full Name**: Tom Hanks", ("Tom Hanks", "", "", "", ())),
+    ("- **Full Name**: Tom Hanks\n- **Profession**:\n- **Top Achievements**:", ("Tom Hanks", "", "", "", ())),
+    # Only the first value of a repeated field counts.
+    ("Name: Tom Hanks\nFull Name: Thomas Hanks", ("Tom Hanks", "", "", "", ())),
+])
+def test_from_markdown(content, expected):
+    result = Identification.from_markdown(content)
+    assert (result.name, result.profession, result.nationality, result.famous_for, result.achievements) == expected
+    assert result.known
+    assert result.raw == ""
+
+
+@pytest.mark.parametrize("content , confidence", [
+    (FULL_MARKDOWN + "\n- **Match Confidence**: 0.93", 0.93),
+    (FULL_MARKDOWN + "\n- **Confidence**: 87%", 0.87),
+    (FULL_MARKDOWN + "\n- **Confidence**: high", None),
+    (FULL_MARKDOWN, None),
+])
+def test_from_markdown_confidence(content, confidence):
+    result = Identification.from_markdown(content)
+    assert result.confidence == (pytest.approx(confidence) if confidence is not None else None)
+
+
+@pytest.mark.parametrize("content , raw", [
+    ("Unknown", ""),
+    ("**Unknown**", ""),
+    ("  unknown  ", ""),
+    ("- **Full Name**: Unknown", "- **Full Name**: Unknown"),
+    ("I can't identify this person.", "I can't identify this person."),
+    ("- **Profession**: Actor", "- **Profession**: Actor"),
+    ("", ""),
+])
+def test_from_markdown_unknown(content, raw):
+    result = Identification.from_markdown(content)
+    assert not result.known
+    assert result.name == "Unknown"
+    assert result.raw == raw
+    assert result.info == (raw or "Unknown")
+
+
+@pytest.mark.parametrize("content , name , confidence", [
+    ('{"full_name": "Tom Hanks", "profession": "Actor", "top_achievements": ["Two Academy Awards"], "confidence": 0.9}',
+     "Tom Hanks", 0.9),
+    ('```json\n{"full_name": "Tom Hanks", "confidence": 90}\n```', "Tom Hanks", 0.9),
+    ('{"full_name": "Unknown", "confidence": 0}', "Unknown", None),
+    ('{"full_name": "", "confidence": 0.4}', "Unknown", None),
+    (FULL_MARKDOWN, "Tom Hanks", None),
+    ("Unknown", "Unknown", None),
+    # Not an object: falls back to markdown.
+    ('["Tom Hanks"]', "Unknown", None),
+])
+def test_json_or_markdown(content, name, confidence):
+    result = parse(content)
+    assert result.name == name
+    assert result.confidence == (pytest.approx(confidence) if confidence is not None else None)
+
+
+def test_json_and_markdown_agree():
+    from_json = parse('{"full_name": "Tom Hanks", "profession": "Actor", "nationality": "American", '
+                      '"famous_for": "Forrest Gump", '
+                      '"top_achievements": ["Two Academy Awards", "Presidential Medal of Freedom"]}')
+    assert from_json == parse(FULL_MARKDOWN)
+
+
+def test_info_round_trips_through_markdown():
+    result = parse(FULL_MARKDOWN + "\n- **Match Confidence**: 0.93")
+    assert Identification.from_markdown(result.info) == result
@@ -0,0 +1,48 @@
+import pytest
+
+from app.utils.knowledge_pack import KnowledgePack
+
+PACK = KnowledgePack([{
+    "name": "Tom Hanks",
+    "profile": {
+        "full_name": "Thomas Jeffrey Hanks",
+        "profession": "Actor and filmmaker",
+        "nationality": "American",
+        "famous_for": "Forrest Gump, Cast Away and Toy Story",
+        "top_achievements": ["Two Academy Awards for Best Actor", "Presidential Medal of Freedom"],
+    },
+    "chunks": ["Hanks was born in Concord, California, in 1956."],
+}])
+
+
+@pytest.mark.parametrize("question , label", [
+    ("What is his job?", "Profession"),
+    ("What does he do for a living?", "Profession"),
+    ("What is Tom Hanks's profession?", "Profession"),
+    ("Where is he from?", "Nationality"),
+    ("What country is Hanks from?", "Nationality"),
+    ("What is he famous for?", "Famous For"),
+    ("Why is he famous?", "Famous For"),
+    ("What awards has he won?", "Top Achievements"),
+    ("Can you tell me his top achievements?", "Top Achievements"),
+])
+def test_answers_field_questions(question, label):
+    answer = PACK.answer_field("Tom Hanks", question)
+    assert answer is not None and f"{label}:" in answer
+
+
+@pytest.mark.parametrize("question", [
+    "Where was he born?",
+    "Where is he now?",
+    "What does he eat for breakfast?",
+    "Is he a wonderful father?",
+    "What is his job and how much does he earn?",
+    "Has his nationality affected his roles?",
+    "Who did he work with on Cast Away?",
+])
+def test_leaves_other_questions_to_retrieval(question):
+    assert PACK.answer_field("Tom Hanks", question) is None
+
+
+def test_unknown_person():
+    assert PACK.answer_field("Someone Else", "What is his job?") is None
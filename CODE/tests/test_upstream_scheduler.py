@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.utils.upstream_scheduler import (BATCH, INTERACTIVE, TokenBucket, UpstreamScheduler, parse_duration,
+                                          retry_after, upstream_priority)
+
+
+class FakeResponse:
+
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeHttp:
+
+    # Hands out the queued responses in order and notes when each call was made.
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def post(self, url, **kwargs):
+        self.calls.append(time.monotonic())
+        return self.responses.pop(0)
+
+
+class FakeAsyncHttp(FakeHttp):
+
+    async def post(self, url, **kwargs):
+        return super().post(url, **kwargs)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.mark.parametrize("value , seconds", [
+    ("7.66s", 7.66),
+    ("2m59.56s", 179.56),
+    ("120ms", 0.12),
+    ("1h", 3600),
+    ("12", 12),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("value", ["", None, "soon"])
+def test_parse_duration_without_a_duration(value):
+    assert parse_duration(value) is None
+
+
+def test_bucket_follows_ratelimit_headers():
+    scheduler = UpstreamScheduler(requests_per_minute=0, tokens_per_minute=0)
+    scheduler.acquire(100)
+    scheduler.release(100, FakeResponse(headers={
+        "x-ratelimit-limit-requests": "30",
+        "x-ratelimit-remaining-requests": "29",
+        "x-ratelimit-reset-requests": "2s",
+        "x-ratelimit-limit-tokens": "6000",
+        "x-ratelimit-remaining-tokens": "5000",
+        "x-ratelimit-reset-tokens": "1m0s",
+    }))
+
+    assert scheduler.requests.capacity == 30
+    assert scheduler.requests.level == 29
+    assert scheduler.requests.rate == pytest.approx(0.5)
+    assert scheduler.tokens.capacity == 6000
+    assert scheduler.tokens.level == 5000
+    assert scheduler.tokens.rate == pytest.approx(1000 / 60)
+
+
+def test_headers_count_calls_still_in_flight():
+    scheduler = UpstreamScheduler()
+    scheduler.acquire(10)
+    scheduler.acquire(10)
+    scheduler.release(10, FakeResponse(headers={"x-ratelimit-limit-requests": "30", "x-ratelimit-remaining-requests": "20"}))
+
+    # The other call hasn't reached the server yet; without a reset the rate is limit per minute.
+    assert scheduler.requests.level == 19
+    assert scheduler.requests.rate == pytest.approx(0.5)
+
+
+def test_bucket_refills_at_its_rate():
+    bucket = TokenBucket()
+    bucket.update(10, 0, 5, 0, now=100.0)
+
+    assert bucket.delay(1, 100.0) == pytest.approx(0.5)
+    assert bucket.delay(1, 100.5) == 0.0
+    bucket.take(1, 100.5)
+    assert bucket.level == pytest.approx(0.0)
+    assert bucket.delay(1, 110.5) == 0.0
+    assert bucket.level == 10
+
+
+def test_unknown_limits_hold_nothing_back():
+    bucket = TokenBucket()
+    bucket.take(1000, 0.0)
+    assert bucket.delay(1000, 0.0) == 0.0
+
+
+def test_interactive_goes_before_batch():
+    scheduler = UpstreamScheduler()
+    # One request at a time, every 50ms, so dispatches can't overlap.
+    scheduler.requests = TokenBucket(1, 20.0)
+    scheduler.paused_until = time.monotonic() + 0.2
+    order = []
+
+    def call(name, priority):
+        with upstream_priority(priority):
+            scheduler.acquire(1)
+        order.append(name)
+
+    threads = []
+    for name , priority in (("batch 1", BATCH), ("batch 2", BATCH), ("interactive", INTERACTIVE)):
+        threads.append(threading.Thread(target=call, args=(name, priority)))
+        threads[-1].start()
+        wait_for(lambda: scheduler.stats()["queued"] == len(threads))
+
+    assert scheduler.stats()["queued_batch"] == 2
+    for thread in threads:
+        thread.join(2)
+
+    assert order == ["interactive", "batch 1", "batch 2"]
+
+
+def test_retry_after_seconds_and_reset_headers():
+    assert retry_after({"Retry-After": "3"}) == 3.0
+    assert retry_after({"x-ratelimit-reset-requests": "2s", "x-ratelimit-reset-tokens": "7.5s"}) == 7.5
+    assert retry_after({}) is None
+
+
+def test_429_pauses_everyone_then_resumes():
+    scheduler = UpstreamScheduler()
+    http = FakeHttp([FakeResponse(429, {"Retry-After": "0.2"}), FakeResponse(200)])
+
+    response = scheduler.post(http, "http://upstream", json={"messages": [], "max_tokens": 1})
+
+    assert response.status_code == 200
+    assert scheduler.rate_limited == 1
+    assert len(http.calls) == 2
+    assert http.calls[1] - http.calls[0] >= 0.19
+
+    # Other callers wait out the same pause.
+    scheduler.acquire(0)
+    scheduler.release(0, FakeResponse(429, {"Retry-After": "0.2"}))
+    start = time.monotonic()
+    scheduler.acquire(1)
+    assert time.monotonic() - start >= 0.19
+    assert scheduler.stats()["paused_for"] == 0
+
+
+def test_long_retry_after_is_returned_not_retried():
+    scheduler = UpstreamScheduler(max_wait=1)
+    http = FakeHttp([FakeResponse(429, {"Retry-After": "30"})])
+
+    response = scheduler.post(http, "http://upstream", json={"messages": []})
+
+    assert response.status_code == 429
+    assert len(http.calls) == 1
+    assert scheduler.stats()["paused_for"] > 29
+
+
+def test_async_429_pauses_then_resumes():
+    scheduler = UpstreamScheduler()
+    limited = FakeResponse(429, {"Retry-After": "0.2"})
+    http = FakeAsyncHttp([limited, FakeResponse(200)])
+
+    response = asyncio.run(scheduler.post_async(http, "http://upstream", json={"messages": []}))
+
+    assert response.status_code == 200
+    assert limited.closed
+    assert http.calls[1] - http.calls[0] >= 0.19
@@ -0,0 +1,6 @@
+from app import create_app
+from dotenv import load_dotenv
+
+# Production entry point:  gunicorn -c gunicorn.conf.py wsgi:app
+load_dotenv()
+app = create_app()
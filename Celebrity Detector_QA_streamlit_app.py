@@ -1,4 +1,5 @@
 import streamlit as st
+import hashlib
 import os
 import sys
 import time
@@ -28,7 +29,8 @@ except Exception:
 try:
     from app.utils.celebrity_detector import CelebrityDetector
     from app.utils.qa_engine import QAEngine
-    from app.utils.image_handler import process_image
+    from app.utils.http_client import default_http_client
+    from app.utils.preprocess_pool import default_preprocess_pool
     MODULES_LOADED = True
 except ImportError as e:
     MODULES_LOADED = False
@@ -216,6 +218,68 @@ tab1, tab2, tab3, tab4, tab5 = st.tabs([
     "📋 System Logs"
 ])
 
+# --- CACHED RESOURCES ---
+# Streamlit reruns this script on every interaction; keep engines, thumbnails
+# and detection results across reruns so a rerun does almost no I/O.
+THUMBNAIL_EDGE = 320
+PREVIEW_EDGE = 1024
+
+@st.cache_resource
+def get_http_client():
+    return default_http_client()
+
+@st.cache_resource
+def get_engines():
+    http = get_http_client()
+    return CelebrityDetector(http=http), QAEngine(http=http)
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def list_samples(samples_dir, mtime):
+    # Filter out specific celebrities from samples as requested
+    return sorted([f for f in os.listdir(samples_dir)
+                   if f.lower().endswith(('.jpg', '.jpeg', '.png'))
+                   and "anushka" not in f.lower()
+                   and "melinda" not in f.lower()
+                   and "vikas" not in f.lower()
+                   and "bill" not in f.lower()
+                   and "dalai" not in f.lower()])
+
+def _resized_jpeg(image, edge):
+    image = image.convert("RGB")
+    image.thumbnail((edge, edge))
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def load_thumbnail(path, mtime, edge=THUMBNAIL_EDGE):
+    # mtime is part of the cache key so an edited sample is picked up.
+    image = Image.open(path)
+    image.draft("RGB", (edge, edge))
+    return _resized_jpeg(image, edge)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_sample(path, mtime):
+    with open(path, "rb") as f:
+        return f.read()
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_preview(digest, _image_bytes, edge=PREVIEW_EDGE):
+    # Arguments starting with "_" are not hashed; the digest is the key.
+    return _resized_jpeg(Image.open(BytesIO(_image_bytes)), edge)
+
+@st.cache_data(max_entries=256, ttl=3600, show_spinner=False)
+def detect_celebrity(digest, _image_bytes):
+    detector , _ = get_engines()
+    prepared = default_preprocess_pool().preprocess(_image_bytes)
+
+    # Detect (only the downscaled face crop is sent upstream)
+    result_text, player_name = detector.identify(prepared.model_bytes)
+    if not player_name:
+        # Upstream failures are raised so they aren't memoised.
+        raise RuntimeError("The recognition service did not respond. Please try again.")
+    return result_text, player_name
+
 # --- STATE MANAGEMENT ---
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
@@ -274,14 +338,7 @@ with tab1:
             # Load all samples dynamically
             samples_dir_path = os.path.join(current_dir, "samples")
             if os.path.exists(samples_dir_path):
-                # Filter out specific celebrities from samples as requested
-                sample_files = sorted([f for f in os.listdir(samples_dir_path) 
-                                     if f.lower().endswith(('.jpg', '.jpeg', '.png')) 
-                                     and "anushka" not in f.lower()
-                                     and "melinda" not in f.lower()
-                                     and "vikas" not in f.lower()
-                                     and "bill" not in f.lower()
-                                     and "dalai" not in f.lower()])
+                sample_files = list_samples(samples_dir_path, os.path.getmtime(samples_dir_path))
                 
                 # Scrollable container for many samples (Gallery View)
                 with st.container():
@@ -294,26 +351,25 @@ with tab1:
                         
                         with cols[i % 4]:
                             # Display Thumbnail
-                            st.image(path_to_img, use_container_width=True)
+                            st.image(load_thumbnail(path_to_img, os.path.getmtime(path_to_img)), use_container_width=True)
                             # Selection Button
                             if st.button(nice_name, key=f"s_{i}", use_container_width=True):
                                 st.session_state.selected_sample = f"samples/{sample_file}"
             
-            # Determine Active File (Upload vs Sample)
-            active_file = None
+            # Determine Active Image (Upload vs Sample)
+            image_bytes = None
             if uploaded_file:
-                active_file = uploaded_file
+                image_bytes = uploaded_file.getvalue()
             elif st.session_state.selected_sample:
                 sample_path = os.path.join(current_dir, st.session_state.selected_sample)
                 if os.path.exists(sample_path):
-                    with open(sample_path, "rb") as f:
-                        active_file = BytesIO(f.read())
-                        active_file.name = st.session_state.selected_sample 
+                    image_bytes = load_sample(sample_path, os.path.getmtime(sample_path))
             
-            if active_file is not None:
+            if image_bytes is not None:
+                image_digest = hashlib.sha256(image_bytes).hexdigest()
+
                 # Display Image
-                image = Image.open(active_file)
-                st.image(image, caption="Selected Image", use_container_width=True)
+                st.image(load_preview(image_digest, image_bytes), caption="Selected Image", use_container_width=True)
                 
                 # Verify Groq Key
                 if not os.getenv("GROQ_API_KEY"):
@@ -322,25 +378,8 @@ with tab1:
                 if st.button("🔍 Detect Celebrity", type="primary", use_container_width=True):
                     with st.spinner("Processing image and identifying face..."):
                         try:
-                            # Reset pointer
-                            active_file.seek(0)
-                            
-                            # FlaskFileAdapter
-                            class FlaskFileAdapter:
-                                def __init__(self, streamlit_file):
-                                    self.file = streamlit_file
-                                def save(self, destination):
-                                    self.file.seek(0)
-                                    destination.write(self.file.read())
-                            
-                            detector = CelebrityDetector()
-                            qa = QAEngine()
-                            
-                            adapter = FlaskFileAdapter(active_file)
-                            img_bytes, face_box = process_image(adapter)
-                            
-                            # Detect
-                            result_text, player_name = detector.identify(img_bytes)
+                            # Memoised by image hash: re-detecting the same image costs nothing
+                            result_text, player_name = detect_celebrity(image_digest, image_bytes)
                             
                             st.session_state.detected_name = player_name
                             st.session_state.detected_info = result_text
@@ -389,10 +428,13 @@ with tab1:
                 if submitted and q_input:
                     st.session_state.chat_history.append(("user", q_input))
                     
-                    with st.spinner("Thinking..."):
-                        qa_eng = QAEngine()
-                        ans = qa_eng.ask_about_celebrity(st.session_state.detected_name, q_input)
-                        st.session_state.chat_history.append(("ai", ans))
+                    # Stream tokens into the chat as they arrive instead of waiting for the full answer
+                    _, qa_eng = get_engines()
+                    with chat_container:
+                        st.markdown(f"<div class='user-message'>👤 {q_input}</div>", unsafe_allow_html=True)
+                        st.markdown("🤖 **RatneshAI:**")
+                        ans = st.write_stream(qa_eng.stream_answer(st.session_state.detected_name, q_input, st.session_state.chat_history[:-1]))
+                    st.session_state.chat_history.append(("ai", ans))
                     
                     st.rerun()
                 